@@ -0,0 +1,18 @@
+"""
+Stage 2 screening of the CounselChat corpus (see data_and_model_training.ipynb)
+"""
+
+from .labels import (
+    EXCLUDE_REASONS,
+    QUALITIES,
+    PROMPT_VERSION,
+    RESPONSE_SCHEMA,
+    JSON_FALLBACK,
+    make_prompt,
+    parse_label,
+    is_acceptable,
+    is_failure,
+)
+from .cache import LabelCache
+from .gemini import GeminiScreener, TokenBucket
+from .mock_server import MockGeminiServer
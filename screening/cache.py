@@ -0,0 +1,136 @@
+"""
+On-disk Stage 2 label cache
+Labels are stored as they arrive, so an interrupted screening run resumes where it stopped
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+from .labels import PROMPT_VERSION, is_failure
+
+_LOOKUP_CHUNK = 500  # keys per "IN (...)" query, under SQLite's variable limit
+
+
+class LabelCache:
+    """
+    SQLite table of labels keyed by sha256(model, prompt version, question)
+
+    Each ``put`` commits straight away, so everything labelled before a
+    crash or a Colab disconnect is kept. Changing the model or bumping
+    PROMPT_VERSION gives new keys, so stale labels are never reused.
+    Fallback labels (the model never answered) are not stored, so those
+    items are retried on the next run.
+
+    Usage:
+        with LabelCache("data/1/label_cache.sqlite", model=MODEL_NAME) as cache:
+            labels = await screener.screen(kept_stage1, cache=cache)
+            print(cache.metrics())
+    """
+
+    def __init__(self, path: str, model: str, prompt_version: str = PROMPT_VERSION):
+        self.path = path
+        self.model = model
+        self.prompt_version = prompt_version
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS labels ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " prompt_version TEXT NOT NULL,"
+            " label TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def key(self, question: str) -> str:
+        text = "\0".join((self.model, self.prompt_version, (question or "").strip()))
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, question: str) -> Optional[Dict]:
+        return self.get_many([question])[0]
+
+    def get_many(self, questions: Sequence[str]) -> List[Optional[Dict]]:
+        """Cached labels in the order of ``questions`` (None where there is none)"""
+        keys = [self.key(q) for q in questions]
+        with self._lock:
+            found = self._fetch(keys)
+            labels = [json.loads(found[key]) if key in found else None for key in keys]
+            hits = sum(label is not None for label in labels)
+            self.hits += hits
+            self.misses += len(labels) - hits
+        return labels
+
+    def contains_many(self, questions: Sequence[str]) -> List[bool]:
+        """Whether each question has a cached label (not counted as a lookup in ``metrics``)"""
+        keys = [self.key(q) for q in questions]
+        with self._lock:
+            found = self._fetch(keys)
+        return [key in found for key in keys]
+
+    def _fetch(self, keys: Sequence[str]) -> Dict[str, str]:
+        found: Dict[str, str] = {}
+        for i in range(0, len(keys), _LOOKUP_CHUNK):
+            chunk = list(keys[i:i + _LOOKUP_CHUNK])
+            rows = self._db.execute(
+                f"SELECT key, label FROM labels WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            found.update(rows)
+        return found
+
+    def put(self, question: str, label: Dict):
+        self.put_many([question], [label])
+
+    def put_many(self, questions: Sequence[str], labels: Sequence[Dict]):
+        """Store labels in one transaction, skipping fallback labels"""
+        now = time.time()
+        rows = [
+            (self.key(q), self.model, self.prompt_version, json.dumps(label, ensure_ascii=False), now)
+            for q, label in zip(questions, labels)
+            if not is_failure(label)
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO labels VALUES (?, ?, ?, ?, ?)", rows)
+            self._db.commit()
+            self.writes += len(rows)
+
+    def __len__(self) -> int:
+        """Labels stored for this model and prompt version"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM labels WHERE model = ? AND prompt_version = ?",
+                (self.model, self.prompt_version),
+            ).fetchone()[0]
+
+    def metrics(self) -> Dict:
+        """Lookups and writes since this cache was opened"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "writes": self.writes,
+            "stored": len(self),
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self) -> "LabelCache":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
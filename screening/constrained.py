@@ -0,0 +1,256 @@
+"""
+Schema-constrained decoding for Stage 2 labels
+A character DFA for the label JSON and a LogitsProcessor that only lets the model write text it accepts
+"""
+
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+from transformers import LogitsProcessor
+
+from .labels import EXCLUDE_REASONS, QUALITIES
+
+FLAG_CHARS = "abcdefghijklmnopqrstuvwxyz0123456789 -_/'"
+MAX_FLAGS = 4
+MAX_FLAG_CHARS = 40
+
+
+class LabelDFA:
+    """
+    Character-level DFA accepting exactly the label JSON, in one fixed layout:
+
+        {"is_child_context": true, "exclude_reason": "none", "risk_flags": ["self-harm"], "quality": "high"}
+
+    ``exclude_reason`` and ``quality`` are limited to their enums and
+    ``risk_flags`` to at most ``max_flags`` short lowercase phrases, so the
+    language is finite: ``distance[state]`` (characters still needed to
+    finish) is what lets the decoder always close the object in time.
+    """
+
+    def __init__(self, exclude_reasons: Sequence[str] = EXCLUDE_REASONS, qualities: Sequence[str] = QUALITIES,
+                 max_flags: int = MAX_FLAGS, max_flag_chars: int = MAX_FLAG_CHARS):
+        self.transitions: List[Dict[str, int]] = []
+        self.start = self._new()
+        state = self._literal(self.start, '{"is_child_context": ')
+        state = self._choice(state, ("true", "false"))
+        state = self._literal(state, ', "exclude_reason": "')
+        state = self._choice(state, exclude_reasons)
+        state = self._literal(state, '", "risk_flags": [')
+        state = self._flags(state, max_flags, max_flag_chars)
+        state = self._literal(state, ', "quality": "')
+        state = self._choice(state, qualities)
+        self.final = self._literal(state, '"}')
+        self.alphabet = {ch for edges in self.transitions for ch in edges}
+        self.distance = self._distances()
+
+    def _new(self) -> int:
+        self.transitions.append({})
+        return len(self.transitions) - 1
+
+    def _literal(self, state: int, text: str) -> int:
+        for ch in text:
+            nxt = self._new()
+            self.transitions[state][ch] = nxt
+            state = nxt
+        return state
+
+    def _choice(self, state: int, options: Sequence[str]) -> int:
+        """A trie of ``options`` from ``state``; returns the state after any of them"""
+        end = self._new()
+        for option in options:
+            if not option:
+                raise ValueError("choices must not be empty")
+            current = state
+            for i, ch in enumerate(option):
+                last = i == len(option) - 1
+                nxt = self.transitions[current].get(ch)
+                if nxt is None:
+                    nxt = end if last else self._new()
+                    self.transitions[current][ch] = nxt
+                elif last or nxt == end:
+                    raise ValueError(f"choices must be prefix-free, got {option!r}")
+                current = nxt
+        return end
+
+    def _flags(self, state: int, max_flags: int, max_flag_chars: int) -> int:
+        """``[]`` or ``["a", "b"]`` with up to ``max_flags`` non-empty strings of FLAG_CHARS"""
+        end = self._new()
+        self.transitions[state]["]"] = end
+        opening = state
+        for i in range(max_flags):
+            chars = [self._new() for _ in range(max_flag_chars + 1)]  # chars[k]: k characters written
+            closed = self._new()
+            self.transitions[opening]['"'] = chars[0]
+            for k, current in enumerate(chars):
+                if k < max_flag_chars:
+                    self.transitions[current].update(dict.fromkeys(FLAG_CHARS, chars[k + 1]))
+                if k > 0:
+                    self.transitions[current]['"'] = closed
+            self.transitions[closed]["]"] = end
+            if i < max_flags - 1:
+                opening = self._literal(closed, ", ")
+        return end
+
+    def _distances(self) -> List[int]:
+        """Fewest characters from each state to the accepting state (BFS over reversed edges)"""
+        incoming: List[List[int]] = [[] for _ in self.transitions]
+        for state, edges in enumerate(self.transitions):
+            for nxt in set(edges.values()):
+                incoming[nxt].append(state)
+        distance = [-1] * len(self.transitions)
+        distance[self.final] = 0
+        queue = deque([self.final])
+        while queue:
+            state = queue.popleft()
+            for prev in incoming[state]:
+                if distance[prev] < 0:
+                    distance[prev] = distance[state] + 1
+                    queue.append(prev)
+        return distance
+
+    def advance(self, state: int, text: str) -> Optional[int]:
+        for ch in text:
+            state = self.transitions[state].get(ch)
+            if state is None:
+                return None
+        return state
+
+
+class _TrieNode:
+    __slots__ = ("children", "ids")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.ids: List[int] = []
+
+
+class SchemaConstraint:
+    """
+    Maps DFA states to the vocabulary entries allowed next
+
+    Only tokens made entirely of DFA characters are indexed, in a trie
+    walked together with the DFA, so a state costs one pass over the
+    tokens that can follow it; results are cached per state. Where the
+    DFA has only one way forward, just the longest token spelling it is
+    allowed, so fixed keys take as few steps as possible; tokens that run
+    on into a choice are still allowed, so the model's own tokenization of
+    e.g. ``": true`` stays available.
+
+    Assumes tokens decode independently (byte-level BPE, as in Qwen).
+    """
+
+    def __init__(self, tokenizer, dfa: Optional[LabelDFA] = None):
+        self.dfa = dfa or LabelDFA()
+        self.eos_ids = {tokenizer.eos_token_id}
+        special = set(tokenizer.all_special_ids)
+        texts = tokenizer.batch_decode([[i] for i in range(len(tokenizer))])
+        self.texts: Dict[int, str] = {}
+        self.root = _TrieNode()
+        for token, text in enumerate(texts):
+            if not text or token in special or not set(text) <= self.dfa.alphabet:
+                continue
+            self.texts[token] = text
+            node = self.root
+            for ch in text:
+                node = node.children.setdefault(ch, _TrieNode())
+            node.ids.append(token)
+        self._walks: Dict[int, Tuple[np.ndarray, ...]] = {}
+        self._masks: Dict[Tuple[int, int, str], torch.Tensor] = {}
+        self._next: Dict[Tuple[int, int], Optional[int]] = {}
+
+    def _walk(self, state: int) -> Tuple[np.ndarray, ...]:
+        """(token ids, end-state distances, stays-deterministic flags, text lengths) for tokens valid from ``state``"""
+        cached = self._walks.get(state)
+        if cached is not None:
+            return cached
+        transitions, distance = self.dfa.transitions, self.dfa.distance
+        ids, dists, det, lengths = [], [], [], []
+        stack = [(self.root, state, True, 0)]
+        while stack:
+            node, current, deterministic, depth = stack.pop()
+            deterministic = deterministic and len(transitions[current]) == 1
+            for ch, child in node.children.items():
+                nxt = transitions[current].get(ch)
+                if nxt is None:
+                    continue
+                for token in child.ids:
+                    ids.append(token)
+                    dists.append(distance[nxt])
+                    det.append(deterministic)
+                    lengths.append(depth + 1)
+                stack.append((child, nxt, deterministic, depth + 1))
+        walk = (np.array(ids, dtype=np.int64), np.array(dists), np.array(det, dtype=bool), np.array(lengths))
+        self._walks[state] = walk
+        return walk
+
+    def next_state(self, state: int, token: int) -> Optional[int]:
+        """The DFA state after ``token`` (None after EOS or a token the DFA rejects)"""
+        key = (state, token)
+        if key not in self._next:
+            text = self.texts.get(token)
+            self._next[key] = self.dfa.advance(state, text) if text is not None else None
+        return self._next[key]
+
+    def mask(self, state: Optional[int], remaining: int, vocab_size: int, device) -> torch.Tensor:
+        """
+        Allowed tokens from ``state`` with ``remaining`` generation steps left
+
+        A token is allowed only if the object can still be closed afterwards
+        even one character per step; near the limit this forces the shortest
+        way out. ``state=None`` (row finished) allows everything.
+        """
+        ids, dists, det, lengths = self._walk(state) if state is not None else (None,) * 4
+        binding = state is not None and len(dists) and dists.max() > remaining - 1
+        key = (-1 if state is None else state, vocab_size, str(device))
+        if not binding and key in self._masks:
+            return self._masks[key]
+
+        mask = torch.zeros(vocab_size, dtype=torch.bool)
+        if state is None:
+            mask[:] = True
+        elif state == self.dfa.final:
+            mask[list(self.eos_ids)] = True
+        else:
+            keep = dists <= remaining - 1
+            if not keep.any():  # fewer steps left than characters needed: get as close as possible
+                keep = dists == dists.min()
+            if len(self.dfa.transitions[state]) == 1 and (keep & det).any():
+                longest = np.where(keep & det, lengths, -1).argmax()
+                keep &= ~det
+                keep[longest] = True
+            mask[torch.from_numpy(ids[keep])] = True
+        mask = mask.to(device)
+        if not binding:
+            self._masks[key] = mask
+        return mask
+
+
+class SchemaLogitsProcessor(LogitsProcessor):
+    """
+    Masks each row's logits to the tokens SchemaConstraint allows next
+
+    Rows start at the DFA's start state (no preamble), follow the tokens
+    they generate, and may only emit EOS once the object is closed. Given
+    ``max_new_tokens`` of at least the DFA's shortest path, every row ends
+    with a complete label.
+    """
+
+    def __init__(self, constraint: SchemaConstraint, batch_size: int, prompt_length: int, max_new_tokens: int):
+        self.constraint = constraint
+        self.prompt_length = prompt_length
+        self.max_new_tokens = max_new_tokens
+        self.states: List[Optional[int]] = [constraint.dfa.start] * batch_size
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        step = input_ids.shape[1] - self.prompt_length
+        if step > 0:
+            for row, token in enumerate(input_ids[:, -1].tolist()):
+                if self.states[row] is not None:
+                    self.states[row] = self.constraint.next_state(self.states[row], token)
+        remaining = self.max_new_tokens - step
+        masks = torch.stack([
+            self.constraint.mask(state, remaining, scores.shape[-1], scores.device) for state in self.states
+        ])
+        return scores.masked_fill(~masks, float("-inf"))
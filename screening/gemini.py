@@ -0,0 +1,328 @@
+"""
+Concurrent Gemini screening client
+Keeps a fixed number of requests in flight under a token-bucket rate limit that adapts to 429s
+"""
+
+import asyncio
+import random
+import re
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Sequence
+
+import httpx
+
+from .cache import LabelCache
+from .labels import SYSTEM_INSTRUCTION, JSON_FALLBACK, RESPONSE_SCHEMA, make_prompt, parse_label
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com"
+
+# on_result(index, example, label) is called as each item finishes (in completion order)
+ResultCallback = Callable[[int, Dict, Dict], None]
+
+
+class TokenBucket:
+    """
+    Async token bucket: ``rate`` requests/sec on average, bursts up to ``capacity``
+
+    ``penalize`` halves the rate (down to ``min_rate``) and pauses all callers,
+    e.g. for a 429's Retry-After; every ``recover_after`` successes the rate
+    grows back by ``recover_step`` of the configured maximum (AIMD).
+
+    ``acquire`` returns the current epoch; a 429 for a request sent before the
+    last decrease only extends the pause, so a burst of in-flight requests
+    hitting the limit together halves the rate once, not once per request.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0, min_rate: float = 0.1, recover_after: int = 10,
+                 recover_step: float = 0.05):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.min_rate = min(min_rate, rate)
+        self.recover_after = recover_after
+        self.recover_step = recover_step
+
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._successes = 0
+        self._epoch = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> int:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return self._epoch
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+    def penalize(self, epoch: int, pause_seconds: float = 0.0):
+        now = time.monotonic()
+        self._refill(now)
+        if epoch >= self._epoch:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._epoch += 1
+        self._tokens = 0.0
+        self._paused_until = max(self._paused_until, now + pause_seconds)
+        self._successes = 0
+
+    def reward(self):
+        self._successes += 1
+        if self._successes >= self.recover_after and self.rate < self.max_rate:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.recover_step * self.max_rate)
+            self._successes = 0
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds to wait from a Retry-After header or a google.rpc.RetryInfo retryDelay"""
+    header = response.headers.get("retry-after")
+    if header:
+        try:
+            return float(header)
+        except ValueError:
+            pass
+    m = re.search(r'"retryDelay"\s*:\s*"([\d.]+)s"', response.text or "")
+    return float(m.group(1)) if m else None
+
+
+def _reply_text(payload: Dict) -> str:
+    texts = []
+    for candidate in payload.get("candidates") or []:
+        for part in (candidate.get("content") or {}).get("parts") or []:
+            if part.get("text"):
+                texts.append(part["text"])
+    return "\n".join(texts)
+
+
+class GeminiScreener:
+    """
+    Screens questions with Gemini's generateContent REST endpoint
+
+    ``concurrency`` requests are kept in flight, started no faster than
+    ``requests_per_minute`` (a token bucket). A 429 halves the request rate
+    and pauses for its Retry-After before retrying; the rate creeps back up
+    after a run of successes. 5xx errors, timeouts and unparseable replies
+    are retried per item with jittered exponential backoff; after
+    ``max_retries`` retries the item gets the JSON_FALLBACK label. 429s do
+    not use up those retries (the limiter has already slowed down), up to
+    ``max_rate_limit_retries`` per item. Other 4xx errors (bad key or model)
+    stop the run.
+
+    ``base_url`` can point at a local MockGeminiServer (screening/mock_server.py).
+    """
+
+    def __init__(self, api_key: str, model: str, base_url: str = GEMINI_BASE_URL, concurrency: int = 8,
+                 requests_per_minute: float = 600, burst: Optional[int] = None, max_retries: int = 4,
+                 max_rate_limit_retries: int = 20,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0, timeout: float = 60.0):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst or concurrency
+
+        self.limiter: Optional[TokenBucket] = None
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self.total = 0
+        self.cache_hits = 0
+        self.duplicates = 0
+        self.questions = 0
+        self.items = 0
+        self.failed = 0
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.server_errors = 0
+        self.network_errors = 0
+        self.parse_errors = 0
+        self.latencies: deque = deque(maxlen=10000)
+        self.elapsed = 0.0
+
+    def _request_body(self, question: str) -> Dict:
+        return {
+            "systemInstruction": {"parts": [{"text": SYSTEM_INSTRUCTION}]},
+            "contents": [{"role": "user", "parts": [{"text": make_prompt(question)}]}],
+            "generationConfig": {
+                "temperature": 0,
+                "responseMimeType": "application/json",
+                "responseSchema": RESPONSE_SCHEMA,
+            },
+        }
+
+    def _backoff(self, attempt: int) -> float:
+        return min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    async def classify(self, client: httpx.AsyncClient, question: str) -> Dict:
+        """Label one question (JSON_FALLBACK after ``max_retries`` failed retries)"""
+        url = f"{self.base_url}/v1beta/models/{self.model}:generateContent"
+        body = self._request_body(question)
+        attempt = throttled = 0
+        while True:
+            epoch = await self.limiter.acquire()
+            self.requests += 1
+            start = time.perf_counter()
+            delay = None
+            try:
+                response = await client.post(url, json=body, headers={"x-goog-api-key": self.api_key})
+                if response.status_code == 429:
+                    self.rate_limited += 1
+                    self.limiter.penalize(epoch, _retry_after(response) or self._backoff(throttled))
+                    throttled += 1
+                    if throttled <= self.max_rate_limit_retries:
+                        self.retries += 1
+                        continue
+                elif response.status_code >= 500:
+                    self.server_errors += 1
+                    delay = self._backoff(attempt)
+                elif response.status_code >= 400:
+                    raise RuntimeError(f"Gemini request failed ({response.status_code}): {response.text[:200]}")
+                else:
+                    self.latencies.append(time.perf_counter() - start)
+                    label = parse_label(_reply_text(response.json()))
+                    if label is not None:
+                        self.limiter.reward()
+                        return label
+                    self.parse_errors += 1
+            except httpx.TransportError:
+                self.network_errors += 1
+                delay = self._backoff(attempt)
+
+            if attempt >= self.max_retries:
+                self.failed += 1
+                return JSON_FALLBACK.copy()
+            attempt += 1
+            self.retries += 1
+            if delay:
+                await asyncio.sleep(delay)
+
+    async def screen(self, examples: Sequence[Dict], on_result: Optional[ResultCallback] = None,
+                     progress: bool = True, cache: Optional[LabelCache] = None) -> List[Dict]:
+        """
+        Label the ``questionText`` of every example
+
+        Returns the labels in input order. Rows sharing a question (CounselChat
+        has several answers per question) are sent once. ``on_result`` sees
+        each new label as soon as it is ready. With a ``cache``, questions it
+        already holds are not sent again and each new label is stored as it
+        arrives, so re-running after an interruption only pays for the rest.
+        """
+        if cache is not None and cache.model != self.model:
+            raise ValueError(f"LabelCache is for model {cache.model!r}, not {self.model!r}")
+
+        self._reset_metrics()
+        self.total = len(examples)
+        self.limiter = TokenBucket(self.requests_per_minute / 60.0, capacity=self.burst)
+        questions = [(ex.get("questionText") or "").strip() for ex in examples]
+        labels: List[Optional[Dict]] = [None] * len(examples)
+        if cache is not None:
+            labels = cache.get_many(questions)
+            self.cache_hits = sum(label is not None for label in labels)
+
+        pending: Dict[str, List[int]] = {}  # question -> indices of the rows asking it
+        for index, label in enumerate(labels):
+            if label is None:
+                pending.setdefault(questions[index], []).append(index)
+        self.duplicates = self.total - self.cache_hits - len(pending)
+        queue: asyncio.Queue = asyncio.Queue()
+        for question in pending:
+            queue.put_nowait(question)
+
+        bar = None
+        if progress:
+            try:
+                from tqdm.auto import tqdm
+                bar = tqdm(total=len(examples), initial=self.cache_hits, desc="Stage 2 LLM Screening")
+            except ImportError:
+                pass
+
+        async def worker(client: httpx.AsyncClient):
+            while True:
+                try:
+                    question = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                label = await self.classify(client, question)
+                self.questions += 1
+                if cache is not None:
+                    cache.put(question, label)
+                for index in pending[question]:
+                    labels[index] = label
+                    self.items += 1
+                    if on_result is not None:
+                        on_result(index, examples[index], label)
+                if bar is not None:
+                    bar.update(len(pending[question]))
+                    bar.set_postfix(rpm=f"{self.limiter.rate * 60:.0f}", failed=self.failed, refresh=False)
+
+        start = time.perf_counter()
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout, limits=limits) as client:
+                tasks = [asyncio.ensure_future(worker(client)) for _ in range(min(self.concurrency, queue.qsize()) or 1)]
+                try:
+                    await asyncio.gather(*tasks)
+                except BaseException:
+                    for task in tasks:
+                        task.cancel()
+                    raise
+        finally:
+            self.elapsed = time.perf_counter() - start
+            if bar is not None:
+                bar.close()
+        return labels
+
+    def metrics(self) -> Dict:
+        """
+        Cache hits, throughput, error rates and latency of the last ``screen`` run
+
+        ``items`` counts rows labelled this run (cache hits excluded) and
+        ``questions`` the distinct questions sent for them; the other
+        ``duplicates`` rows reused another row's label.
+        """
+        latencies = sorted(self.latencies)
+
+        def pct(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else None
+
+        return {
+            "total": self.total,
+            "cache_hits": self.cache_hits,
+            "cache_hit_rate": self.cache_hits / self.total if self.total else None,
+            "duplicates": self.duplicates,
+            "items": self.items,
+            "questions": self.questions,
+            "seconds": self.elapsed,
+            "items_per_sec": self.items / self.elapsed if self.elapsed else None,
+            "requests": self.requests,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "server_errors": self.server_errors,
+            "network_errors": self.network_errors,
+            "parse_errors": self.parse_errors,
+            "failed": self.failed,
+            "failure_rate": self.failed / self.questions if self.questions else None,
+            "error_rate": (self.requests - (self.questions - self.failed)) / self.requests if self.requests else None,
+            "final_rpm": self.limiter.rate * 60 if self.limiter else None,
+            "latency_p50_ms": pct(0.5),
+            "latency_p95_ms": pct(0.95),
+        }
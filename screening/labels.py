@@ -0,0 +1,110 @@
+"""
+Stage 2 screening labels
+The label schema, the screening prompt and the tolerant parsing both screeners share
+"""
+
+import json
+import re
+from typing import Optional, Dict
+
+EXCLUDE_REASONS = ("none", "adult_sexual_topic", "general_adult", "off_topic", "unsafe", "pii_leak")
+QUALITIES = ("high", "medium", "low")
+
+SYSTEM_INSTRUCTION = (
+    "You are a data screener for training a child-psychology assistant. "
+    "Return ONLY valid JSON matching exactly this schema:\n"
+    "{\n"
+    '  "is_child_context": <bool>,\n'
+    '  "exclude_reason": "<string>",  // one of: "none","adult_sexual_topic","general_adult","off_topic","unsafe","pii_leak"\n'
+    '  "risk_flags": ["<string>", ...],\n'
+    '  "quality": "<string>"          // one of: "high","medium","low"\n'
+    "}\n"
+    'If content is acceptable for a child/parent/teacher context, set is_child_context=true and exclude_reason="none". '
+    "Return JSON only, no extra text."
+)
+
+INSTRUCTIONS = (
+    "Return JSON only. Keys exactly: is_child_context (bool), exclude_reason (string), "
+    "risk_flags (list[string]), quality (string: high|medium|low)."
+)
+
+# Bump when the prompt or schema changes: cached labels are keyed by it
+PROMPT_VERSION = "v2"
+
+# The label schema as a Gemini responseSchema (OpenAPI subset), so the API itself enforces the enums
+RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "is_child_context": {"type": "BOOLEAN"},
+        "exclude_reason": {"type": "STRING", "enum": list(EXCLUDE_REASONS)},
+        "risk_flags": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "quality": {"type": "STRING", "enum": list(QUALITIES)},
+    },
+    "required": ["is_child_context", "exclude_reason", "risk_flags", "quality"],
+    "propertyOrdering": ["is_child_context", "exclude_reason", "risk_flags", "quality"],
+}
+
+JSON_FALLBACK = {
+    "is_child_context": False,
+    "exclude_reason": "llm_error",
+    "risk_flags": [],
+    "quality": "low",
+}
+
+
+def make_prompt(question: str) -> str:
+    return f"{INSTRUCTIONS}\n\nQUESTION:\n{(question or '').strip()}\n\nJSON ONLY:"
+
+
+def safe_json_parse(txt: str) -> Optional[Dict]:
+    """Parse a JSON object, tolerating code fences and text around it"""
+    if not txt:
+        return None
+    txt = re.sub(r"^```(?:json)?\s*|\s*```$", "", txt.strip())
+    try:
+        return json.loads(txt)
+    except Exception:
+        m = re.search(r"\{.*\}", txt, flags=re.S)
+        if m:
+            try:
+                return json.loads(m.group(0))
+            except Exception:
+                return None
+        return None
+
+
+def parse_label(txt: str) -> Optional[Dict]:
+    """The label in a model reply, or None if it is not a JSON object with is_child_context"""
+    data = safe_json_parse(txt)
+    return data if isinstance(data, dict) and "is_child_context" in data else None
+
+
+# --- Normalizers to avoid "0 kept" issues ---
+def as_bool(x) -> bool:
+    if x is True: return True
+    if x is False: return False
+    if isinstance(x, str): return x.strip().lower() in ("true", "yes", "y", "1")
+    if isinstance(x, (int, float)): return x != 0
+    return False
+
+
+def norm_str(x, default="") -> str:
+    if x is None: return default
+    return str(x).strip().lower()
+
+
+ACCEPT_REASONS = {"", "none", "ok", "pass"}
+GOOD_QUALITY = {"high", "medium", ""}  # treat missing as medium
+
+
+def is_acceptable(lab: Dict) -> bool:
+    return (
+        as_bool(lab.get("is_child_context"))
+        and norm_str(lab.get("exclude_reason")) in ACCEPT_REASONS
+        and norm_str(lab.get("quality"), "medium") in GOOD_QUALITY
+    )
+
+
+def is_failure(lab: Dict) -> bool:
+    """True for the fallback label given when the model never produced a usable answer"""
+    return norm_str(lab.get("exclude_reason")) == "llm_error"
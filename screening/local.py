@@ -0,0 +1,302 @@
+"""
+Local (transformers) Stage 2 screening
+Length-bucketed batches sized by a token budget, schema-constrained output, each row stopping once its JSON object closes
+"""
+
+import time
+from typing import Dict, List, Optional, Sequence
+
+import torch
+from transformers import LogitsProcessorList, StoppingCriteria, StoppingCriteriaList
+
+from .cache import LabelCache
+from .constrained import LabelDFA, SchemaConstraint, SchemaLogitsProcessor
+from .labels import EXCLUDE_REASONS, JSON_FALLBACK, parse_label
+
+LOCAL_SYSTEM_PROMPT = (
+    "You are a data screener for training a child-psychology assistant. "
+    "Analyze the question and return ONLY a JSON object with these exact keys:\n"
+    "- is_child_context (boolean): true if appropriate for child/family counseling\n"
+    f"- exclude_reason (string): one of {', '.join(EXCLUDE_REASONS)} ('none' if included)\n"
+    "- risk_flags (array): short lowercase phrases for concerning elements, if any\n"
+    "- quality (string): 'high', 'medium', or 'low'\n\n"
+    "Exclude adult-only sexual topics, erectile dysfunction, marital/couples counseling, etc."
+)
+
+# Bump when LOCAL_SYSTEM_PROMPT or the user message changes: cached labels are keyed by it
+LOCAL_PROMPT_VERSION = "local-v2"
+
+
+def plan_batches(lengths: Sequence[int], max_batch_tokens: int, max_batch_size: int,
+                 max_new_tokens: int) -> List[List[int]]:
+    """
+    Group prompt indices into batches of similar length
+
+    Prompts are taken longest first, and a batch is closed when one more row
+    would push rows * (longest prompt + max_new_tokens) past
+    ``max_batch_tokens`` (roughly the KV cache the batch needs) or the batch
+    reaches ``max_batch_size`` rows. Neighbours in sorted order have nearly
+    the same length, so little of each batch is padding, and short prompts
+    get large batches. The first batch is the most memory-hungry one, so an
+    over-large budget fails straight away rather than midway through a run.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    batches: List[List[int]] = []
+    current: List[int] = []
+    for index in order:
+        if current:
+            width = lengths[current[0]] + max_new_tokens
+            if len(current) >= max_batch_size or (len(current) + 1) * width > max_batch_tokens:
+                batches.append(current)
+                current = []
+        current.append(index)
+    if current:
+        batches.append(current)
+    return batches
+
+
+class JsonObjectClosed(StoppingCriteria):
+    """
+    Stops each row once its generated text holds a complete JSON object
+
+    Tracks brace depth per row (ignoring braces inside strings) from the
+    newest token only, so a step costs O(batch). Rows also stop on an EOS
+    token. ``finished_at[row]`` is the number of tokens the row generated.
+    """
+
+    def __init__(self, tokenizer, batch_size: int, prompt_length: int, eos_ids: set):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.eos_ids = eos_ids
+        self.depth = [0] * batch_size
+        self.in_string = [False] * batch_size
+        self.escaped = [False] * batch_size
+        self.closed = [False] * batch_size
+        self.finished_at: List[Optional[int]] = [None] * batch_size
+        self._token_text: Dict[int, str] = {}
+
+    def _text(self, token: int) -> str:
+        text = self._token_text.get(token)
+        if text is None:
+            text = self._token_text[token] = self.tokenizer.decode([token])
+        return text
+
+    def _feed(self, row: int, text: str) -> bool:
+        for ch in text:
+            if self.in_string[row]:
+                if self.escaped[row]:
+                    self.escaped[row] = False
+                elif ch == "\\":
+                    self.escaped[row] = True
+                elif ch == '"':
+                    self.in_string[row] = False
+            elif ch == '"':
+                self.in_string[row] = self.depth[row] > 0
+            elif ch == "{":
+                self.depth[row] += 1
+            elif ch == "}" and self.depth[row] > 0:
+                self.depth[row] -= 1
+                if self.depth[row] == 0:
+                    return True
+        return False
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        step = input_ids.shape[1] - self.prompt_length
+        for row, token in enumerate(input_ids[:, -1].tolist()):
+            if self.finished_at[row] is not None:
+                continue
+            if token in self.eos_ids:
+                self.finished_at[row] = step
+            elif self._feed(row, self._text(token)):
+                self.closed[row] = True
+                self.finished_at[row] = step
+        return torch.tensor([f is not None for f in self.finished_at], dtype=torch.bool, device=input_ids.device)
+
+
+class LocalScreener:
+    """
+    Screens questions with a local causal LM (e.g. Qwen2.5-7B-Instruct in 8-bit)
+
+    Prompts are sorted by token length and batched by ``max_batch_tokens``
+    rather than a fixed row count (see ``plan_batches``), and generation
+    stops for each row once it has written a closed JSON object instead of
+    always running ``max_new_tokens``. Questions longer than
+    ``max_question_tokens`` are cut before the chat template is applied, so
+    the assistant header is never truncated away.
+
+    With ``constrained`` (the default) a SchemaLogitsProcessor
+    (screening/constrained.py) only lets the model write the label schema,
+    with enum values and no preamble, so every reply parses.
+
+    ``metrics()`` reports items/sec, the share of prompt tokens that were
+    padding and the share of decode slots spent on rows that had already
+    finished.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_tokens: int = 16384, max_batch_size: int = 64,
+                 max_new_tokens: int = 128, max_question_tokens: int = 384,
+                 system_prompt: str = LOCAL_SYSTEM_PROMPT, constrained: bool = True):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_new_tokens = max_new_tokens
+        self.max_question_tokens = max_question_tokens
+        self.system_prompt = system_prompt
+        self.constrained = constrained
+
+        self._dfa = LabelDFA() if constrained else None
+        self._constraint: Optional[SchemaConstraint] = None  # indexes the vocabulary on first use
+        if constrained and max_new_tokens < self._dfa.distance[self._dfa.start]:
+            raise ValueError(f"max_new_tokens must be at least {self._dfa.distance[self._dfa.start]} "
+                             "to fit the shortest label")
+
+        # Decoder-only models need left padding so every row's next token is at the end
+        tokenizer.padding_side = "left"
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        self.eos_ids = {tokenizer.eos_token_id}
+        eos = getattr(getattr(model, "generation_config", None), "eos_token_id", None)
+        self.eos_ids.update(eos if isinstance(eos, list) else [eos] if eos is not None else [])
+        self._reset_metrics()
+
+    def _reset_metrics(self):
+        self.total = 0
+        self.cache_hits = 0
+        self.questions = 0
+        self.batches = 0
+        self.prompt_tokens = 0
+        self.padding_tokens = 0
+        self.generated_tokens = 0
+        self.decode_slots = 0
+        self.closed_early = 0
+        self.failed = 0
+        self.elapsed = 0.0
+
+    @property
+    def prompt_version(self) -> str:
+        """Cache key part for labels from this screener (constrained output differs from free-form)"""
+        return LOCAL_PROMPT_VERSION + ("+schema" if self.constrained else "")
+
+    def build_prompt(self, question: str) -> str:
+        ids = self.tokenizer((question or "").strip(), add_special_tokens=False)["input_ids"]
+        if len(ids) > self.max_question_tokens:
+            question = self.tokenizer.decode(ids[:self.max_question_tokens])
+        messages = [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": f"Analyze this question and return JSON only:\n\n{question}"},
+        ]
+        return self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True,
+                                                  enable_thinking=False)
+
+    @torch.inference_mode()
+    def classify_batch(self, prompts: Sequence[str]) -> List[Dict]:
+        """Labels for already-built prompts (JSON_FALLBACK where the reply does not parse)"""
+        inputs = self.tokenizer(list(prompts), return_tensors="pt", padding=True).to(self.model.device)
+        batch_size, prompt_length = inputs["input_ids"].shape
+        real = int(inputs["attention_mask"].sum())
+        self.prompt_tokens += batch_size * prompt_length
+        self.padding_tokens += batch_size * prompt_length - real
+
+        stop = JsonObjectClosed(self.tokenizer, batch_size, prompt_length, self.eos_ids)
+        processors = LogitsProcessorList()
+        if self.constrained:
+            if self._constraint is None:
+                self._constraint = SchemaConstraint(self.tokenizer, self._dfa)
+            processors.append(SchemaLogitsProcessor(self._constraint, batch_size, prompt_length, self.max_new_tokens))
+        output = self.model.generate(
+            **inputs,
+            max_new_tokens=self.max_new_tokens,
+            do_sample=False,
+            logits_processor=processors,
+            stopping_criteria=StoppingCriteriaList([stop]),
+            pad_token_id=self.tokenizer.pad_token_id,
+        )
+        generated = output[:, prompt_length:]
+        steps = generated.shape[1]
+        lengths = [f if f is not None else steps for f in stop.finished_at]
+        self.batches += 1
+        self.generated_tokens += sum(lengths)
+        self.decode_slots += batch_size * steps
+        self.closed_early += sum(stop.closed)
+
+        labels = []
+        for row, length in enumerate(lengths):
+            label = parse_label(self.tokenizer.decode(generated[row, :length], skip_special_tokens=True))
+            if label is None:
+                self.failed += 1
+                label = JSON_FALLBACK.copy()
+            labels.append(label)
+        return labels
+
+    def screen(self, examples: Sequence[Dict], cache: Optional[LabelCache] = None,
+               progress: bool = True) -> List[Dict]:
+        """
+        Label the ``questionText`` of every example, in input order
+
+        Each distinct question is classified once. With a ``cache``, questions
+        it already holds are skipped and every batch is stored as soon as it
+        finishes, so an interrupted run resumes where it stopped.
+        """
+        self._reset_metrics()
+        self.total = len(examples)
+        questions = [(ex.get("questionText") or "").strip() for ex in examples]
+        labels: List[Optional[Dict]] = [None] * len(examples)
+        if cache is not None:
+            labels = cache.get_many(questions)
+            self.cache_hits = sum(label is not None for label in labels)
+
+        pending: Dict[str, List[int]] = {}  # question -> indices of the rows asking it
+        for index, label in enumerate(labels):
+            if label is None:
+                pending.setdefault(questions[index], []).append(index)
+        todo = list(pending)
+        prompts = [self.build_prompt(q) for q in todo]
+        lengths = [len(ids) for ids in self.tokenizer(prompts, add_special_tokens=False)["input_ids"]] if prompts else []
+        batches = plan_batches(lengths, self.max_batch_tokens, self.max_batch_size, self.max_new_tokens)
+
+        bar = None
+        if progress:
+            try:
+                from tqdm.auto import tqdm
+                bar = tqdm(total=len(todo), desc="Stage 2 (local screening)")
+            except ImportError:
+                pass
+
+        start = time.perf_counter()
+        try:
+            for batch in batches:
+                batch_labels = self.classify_batch([prompts[i] for i in batch])
+                batch_questions = [todo[i] for i in batch]
+                if cache is not None:
+                    cache.put_many(batch_questions, batch_labels)
+                for question, label in zip(batch_questions, batch_labels):
+                    for index in pending[question]:
+                        labels[index] = label
+                self.questions += len(batch)
+                if bar is not None:
+                    bar.update(len(batch))
+        finally:
+            self.elapsed = time.perf_counter() - start
+            if bar is not None:
+                bar.close()
+        return labels
+
+    def metrics(self) -> Dict:
+        """Cache hits, throughput and batching waste of the last ``screen`` run"""
+        return {
+            "total": self.total,
+            "cache_hits": self.cache_hits,
+            "cache_hit_rate": self.cache_hits / self.total if self.total else None,
+            "questions": self.questions,
+            "seconds": self.elapsed,
+            "items_per_sec": self.questions / self.elapsed if self.elapsed else None,
+            "batches": self.batches,
+            "avg_batch_size": self.questions / self.batches if self.batches else None,
+            "padding_waste": self.padding_tokens / self.prompt_tokens if self.prompt_tokens else None,
+            "generated_tokens": self.generated_tokens,
+            "tokens_per_item": self.generated_tokens / self.questions if self.questions else None,
+            "decode_waste": 1 - self.generated_tokens / self.decode_slots if self.decode_slots else None,
+            "closed_early": self.closed_early,
+            "failed": self.failed,
+        }
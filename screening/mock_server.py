@@ -0,0 +1,147 @@
+"""
+Local stand-in for Gemini's generateContent endpoint
+Fixed latency, a server-side request quota answered with 429s, and injectable errors
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+CHILD_WORDS = re.compile(r"\b(child|children|kid|kids|son|daughter|teen|teenager|school|student|parent|toddler|"
+                         r"baby|boy|girl|grade|middle school|high school|\d{1,2} ?(year|yr)s? old)\b", re.I)
+ADULT_WORDS = re.compile(r"\b(wife|husband|marriage|married|sex|affair|girlfriend|boyfriend|divorce|job|boss)\b", re.I)
+
+
+def mock_label(question: str) -> Dict:
+    """Deterministic keyword label, so runs against the mock are reproducible"""
+    child = bool(CHILD_WORDS.search(question))
+    adult = bool(ADULT_WORDS.search(question))
+    return {
+        "is_child_context": child and not adult,
+        "exclude_reason": "none" if child and not adult else "general_adult",
+        "risk_flags": [],
+        "quality": "high" if len(question) > 200 else "medium",
+    }
+
+
+class MockGeminiServer:
+    """
+    Threaded HTTP server answering POST /v1beta/models/<model>:generateContent
+
+    Each request takes ``latency`` seconds. Beyond ``requests_per_second``
+    (a server-side token bucket, None = unlimited) requests get a 429 with
+    a Retry-After header and a RetryInfo body like the real API. A fraction
+    ``error_rate`` of requests fail with a 503 and ``malformed_rate`` return
+    text that is not JSON.
+
+    Usage:
+        with MockGeminiServer(requests_per_second=20) as server:
+            screener = GeminiScreener("test-key", "mock", base_url=server.base_url)
+    """
+
+    def __init__(self, latency: float = 0.05, requests_per_second: float = None, error_rate: float = 0.0,
+                 malformed_rate: float = 0.0, seed: int = 0, port: int = 0):
+        self.latency = latency
+        self.requests_per_second = requests_per_second
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = requests_per_second or 0.0
+        self._updated = time.monotonic()
+        self.counts = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "malformed": 0}
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                status, payload, headers = server._respond(self.path, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up (timeout or cancelled run)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def _admit(self) -> bool:
+        if not self.requests_per_second:
+            return True
+        now = time.monotonic()
+        self._tokens = min(self.requests_per_second, self._tokens + (now - self._updated) * self.requests_per_second)
+        self._updated = now
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return True
+        return False
+
+    def _respond(self, path: str, body: Dict):
+        with self._lock:
+            self.counts["requests"] += 1
+            admitted = self._admit()
+            roll = self._random.random()
+        if not admitted:
+            with self._lock:
+                self.counts["rate_limited"] += 1
+            retry = max(1.0 / self.requests_per_second, 0.05)
+            return 429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED", "details": [
+                {"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{retry:.2f}s"}
+            ]}}, {"Retry-After": f"{retry:.2f}"}
+
+        time.sleep(self.latency)
+        if not path.endswith(":generateContent"):
+            return 404, {"error": {"code": 404, "status": "NOT_FOUND"}}, {}
+        if roll < self.error_rate:
+            with self._lock:
+                self.counts["errors"] += 1
+            return 503, {"error": {"code": 503, "status": "UNAVAILABLE"}}, {}
+
+        prompt = body["contents"][0]["parts"][0]["text"]
+        question = prompt.split("QUESTION:\n", 1)[-1].rsplit("\n\nJSON ONLY:", 1)[0]
+        if roll < self.error_rate + self.malformed_rate:
+            with self._lock:
+                self.counts["malformed"] += 1
+            text = "Sure! Here is my assessment of the question"
+        else:
+            with self._lock:
+                self.counts["ok"] += 1
+            text = json.dumps(mock_label(question))
+        return 200, {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+            "usageMetadata": {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(text) // 4},
+        }, {}
+
+    def start(self) -> "MockGeminiServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-gemini", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockGeminiServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
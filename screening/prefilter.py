@@ -0,0 +1,365 @@
+"""
+Stage 2 pre-filter
+A hashed n-gram logistic regression that settles obvious questions so only the uncertain band goes to the LLM
+"""
+
+import json
+import os
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .cache import LabelCache
+from .labels import is_failure
+
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+EMAIL_RE = re.compile(r"\b[\w\.-]+@[\w\.-]+\.\w+\b")
+LINK_RE = re.compile(r"(https?://\S+)")
+PHONE_RE = re.compile(r"\b\d{3}[-.\s]?\d{3}[-.\s]?\d{4}\b")
+
+ACCEPT, REJECT, LLM = 1, 0, -1
+
+
+def scrub(text: str) -> str:
+    """
+    The notebook's training-set scrub: collapse whitespace, mask emails, links and phone numbers
+
+    Accepted questions are only kept in this form (the chat JSONL), so every
+    text is scrubbed before featurizing; otherwise the masks themselves
+    would separate the classes. Scrubbing is idempotent.
+    """
+    text = " ".join(str(text or "").split())
+    text = EMAIL_RE.sub("[redacted_email]", text)
+    text = LINK_RE.sub("[link]", text)
+    return PHONE_RE.sub("[phone]", text)
+
+
+def _hash(feature: str) -> int:
+    return zlib.crc32(feature.encode("utf-8"))
+
+
+class HashedFeatures:
+    """
+    Sparse rows of hashed word and character n-gram counts (COO arrays)
+
+    Words give the topic; character 3-5-grams (within and across word
+    boundaries) carry it over spelling variants and word forms, which
+    matters with only a few hundred labelled questions. Values are
+    log-scaled counts; ``weighted`` applies IDF weights and L2-normalizes
+    each row. The two products logistic regression needs, ``X @ w`` and
+    ``X.T @ r``, are single ``np.bincount`` calls, so no sparse-matrix
+    library is needed.
+    """
+
+    def __init__(self, texts: Sequence[str], n_features: int = 2 ** 18, ngrams: int = 1,
+                 char_ngrams: Sequence[int] = (3, 4, 5)):
+        rows: List[int] = []
+        cols: List[int] = []
+        vals: List[float] = []
+        for row, text in enumerate(texts):
+            words = TOKEN_RE.findall((text or "").lower())
+            counts: Dict[int, int] = defaultdict(int)
+            for n in range(1, ngrams + 1):
+                for i in range(len(words) - n + 1):
+                    counts[_hash(" ".join(words[i:i + n])) % n_features] += 1
+            padded = f" {' '.join(words)} "
+            for n in char_ngrams:
+                for i in range(len(padded) - n + 1):
+                    counts[_hash("#" + padded[i:i + n]) % n_features] += 1
+            rows.extend([row] * len(counts))
+            cols.extend(counts.keys())
+            vals.extend(counts.values())
+        self.n_rows = len(texts)
+        self.n_features = n_features
+        self.rows = np.array(rows, dtype=np.int64)
+        self.cols = np.array(cols, dtype=np.int64)
+        self.vals = np.log1p(np.array(vals, dtype=np.float64))
+
+    def document_frequency(self) -> np.ndarray:
+        return np.bincount(self.cols, minlength=self.n_features).astype(np.float64)
+
+    def weighted(self, idf: np.ndarray) -> "HashedFeatures":
+        """A copy scaled by ``idf`` per feature, each row L2-normalized"""
+        vals = self.vals * idf[self.cols]
+        norms = np.sqrt(np.bincount(self.rows, weights=vals ** 2, minlength=self.n_rows))
+        return self._with(self.n_rows, self.rows, self.cols, vals / np.maximum(norms[self.rows], 1e-12))
+
+    def dot(self, w: np.ndarray) -> np.ndarray:
+        return np.bincount(self.rows, weights=self.vals * w[self.cols], minlength=self.n_rows)
+
+    def tdot(self, r: np.ndarray) -> np.ndarray:
+        return np.bincount(self.cols, weights=self.vals * r[self.rows], minlength=self.n_features)
+
+    def take(self, index: np.ndarray) -> "HashedFeatures":
+        """The given rows, renumbered from 0"""
+        position = np.full(self.n_rows, -1, dtype=np.int64)
+        position[index] = np.arange(len(index))
+        keep = position[self.rows] >= 0
+        return self._with(len(index), position[self.rows[keep]], self.cols[keep], self.vals[keep])
+
+    def _with(self, n_rows: int, rows: np.ndarray, cols: np.ndarray, vals: np.ndarray) -> "HashedFeatures":
+        other = object.__new__(HashedFeatures)
+        other.n_rows, other.n_features = n_rows, self.n_features
+        other.rows, other.cols, other.vals = rows, cols, vals
+        return other
+
+
+def _idf(X: HashedFeatures) -> np.ndarray:
+    return np.log((1.0 + X.n_rows) / (1.0 + X.document_frequency())) + 1.0
+
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+def _train(X: HashedFeatures, y: np.ndarray, l2: float, iterations: int,
+           learning_rate: float) -> Tuple[np.ndarray, float]:
+    """L2-regularized logistic regression by full-batch gradient descent with Nesterov momentum"""
+    w = np.zeros(X.n_features)
+    b = 0.0
+    velocity_w = np.zeros_like(w)
+    velocity_b = 0.0
+    n = len(y)
+    for _ in range(iterations):
+        look_w = w + 0.9 * velocity_w
+        look_b = b + 0.9 * velocity_b
+        error = _sigmoid(X.dot(look_w) + look_b) - y
+        grad_w = X.tdot(error) / n + l2 * look_w
+        grad_b = error.mean()
+        velocity_w = 0.9 * velocity_w - learning_rate * grad_w
+        velocity_b = 0.9 * velocity_b - learning_rate * grad_b
+        w += velocity_w
+        b += velocity_b
+    return w, b
+
+
+def _wilson_lower(successes: np.ndarray, n: np.ndarray, z: float) -> np.ndarray:
+    """Lower end of the Wilson score interval for a proportion"""
+    phat = successes / n
+    centre = phat + z * z / (2 * n)
+    margin = z * np.sqrt(phat * (1 - phat) / n + z * z / (4 * n * n))
+    return (centre - margin) / (1 + z * z / n)
+
+
+def _thresholds(p: np.ndarray, y: np.ndarray, target: float, min_support: int,
+                z: float) -> Tuple[float, float]:
+    """
+    Widest (reject_below, accept_above) band edges whose decisions agree with ``y`` at least ``target``
+
+    Walks out-of-fold probabilities from each end and keeps the largest
+    group (of at least ``min_support`` items) whose precision is >= target
+    with confidence: the Wilson lower bound at ``z`` must clear it, not the
+    observed precision, which is optimistic for the group it was picked on.
+    """
+    count = np.arange(1, len(p) + 1)
+
+    order = np.argsort(-p)
+    ok = np.nonzero(_wilson_lower(np.cumsum(y[order]), count, z) >= target)[0]
+    ok = ok[ok + 1 >= min_support]
+    accept_above = p[order[ok[-1]]] if len(ok) else np.inf
+
+    order = np.argsort(p)
+    ok = np.nonzero(_wilson_lower(np.cumsum(1 - y[order]), count, z) >= target)[0]
+    ok = ok[ok + 1 >= min_support]
+    reject_below = p[order[ok[-1]]] if len(ok) else -np.inf
+
+    if reject_below >= accept_above:  # only possible for target <= 0.5
+        reject_below = accept_above = float(np.median(p))
+    return float(reject_below), float(accept_above)
+
+
+class PreFilter:
+    """
+    Routes questions to auto-accept, auto-reject or the LLM
+
+    ``fit`` trains on earlier LLM labels and picks the two probability
+    thresholds from ``folds``-fold out-of-fold predictions, so that the
+    auto-decided items agree with the LLM at least ``target_agreement`` of
+    the time at one-sided confidence ``z`` (Wilson bound); everything
+    between them goes to the LLM. An untrained pre-filter sends everything
+    to the LLM. Texts are scrubbed (``scrub``) before featurizing.
+
+    Usage:
+        prefilter = PreFilter().fit(texts, labels, target_agreement=0.97)
+        labels, pending = prefilter.split(kept_stage1, cache)   # pending: indices still needing the LLM
+    """
+
+    def __init__(self, n_features: int = 2 ** 18, ngrams: int = 1, l2: float = 1e-4, iterations: int = 300,
+                 learning_rate: float = 2.0):
+        self.n_features = n_features
+        self.ngrams = ngrams
+        self.l2 = l2
+        self.iterations = iterations
+        self.learning_rate = learning_rate
+
+        self.weights: Optional[np.ndarray] = None
+        self.idf: Optional[np.ndarray] = None
+        self.bias = 0.0
+        self.reject_below = -np.inf
+        self.accept_above = np.inf
+        self.oof_agreement: Optional[float] = None
+        self.oof_coverage: Optional[float] = None
+
+    def _features(self, texts: Sequence[str]) -> HashedFeatures:
+        return HashedFeatures([scrub(t) for t in texts], self.n_features, self.ngrams)
+
+    def fit(self, texts: Sequence[str], labels: Sequence[int], target_agreement: float = 0.97, folds: int = 5,
+            min_support: int = 10, z: float = 1.0, seed: int = 0) -> "PreFilter":
+        """Train on ``labels`` (1 = the LLM accepted, 0 = rejected) and calibrate the thresholds"""
+        X = self._features(texts)
+        y = np.asarray(labels, dtype=np.float64)
+        rng = np.random.default_rng(seed)
+        fold = rng.permutation(len(y)) % folds
+        oof = np.zeros(len(y))
+        for k in range(folds):
+            train, test = X.take(np.nonzero(fold != k)[0]), X.take(np.nonzero(fold == k)[0])
+            idf = _idf(train)
+            w, b = _train(train.weighted(idf), y[fold != k], self.l2, self.iterations, self.learning_rate)
+            oof[fold == k] = _sigmoid(test.weighted(idf).dot(w) + b)
+
+        self.reject_below, self.accept_above = _thresholds(oof, y, target_agreement, min_support, z)
+        decided = (oof < self.reject_below) | (oof >= self.accept_above)
+        self.oof_coverage = float(decided.mean())
+        self.oof_agreement = float(((oof >= self.accept_above) == (y == 1))[decided].mean()) if decided.any() else None
+        self.idf = _idf(X)
+        self.weights, self.bias = _train(X.weighted(self.idf), y, self.l2, self.iterations, self.learning_rate)
+        return self
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        """Probability the LLM would accept each question"""
+        if self.weights is None:
+            return np.full(len(texts), 0.5)
+        return _sigmoid(self._features(texts).weighted(self.idf).dot(self.weights) + self.bias)
+
+    def route(self, texts: Sequence[str]) -> np.ndarray:
+        """ACCEPT, REJECT or LLM per question"""
+        p = self.predict_proba(texts)
+        return np.where(p >= self.accept_above, ACCEPT, np.where(p < self.reject_below, REJECT, LLM))
+
+    def split(self, examples: Sequence[Dict],
+              cache: Optional[LabelCache] = None) -> Tuple[List[Optional[Dict]], List[int]]:
+        """
+        Pre-filter labels for settled examples (None for the rest) and the indices still needing the LLM
+
+        With a ``cache``, questions it already holds an LLM label for are
+        never pre-filtered: they stay with the LLM stage, which serves them
+        from the cache for free.
+        """
+        texts = [(ex.get("questionText") or "").strip() for ex in examples]
+        cached = cache.contains_many(texts) if cache is not None else [False] * len(texts)
+        fresh = [i for i, hit in enumerate(cached) if not hit]
+        p = np.full(len(texts), 0.5)
+        p[fresh] = self.predict_proba([texts[i] for i in fresh])
+        labels: List[Optional[Dict]] = []
+        pending: List[int] = []
+        for index, prob in enumerate(p):
+            if not cached[index] and (prob >= self.accept_above or prob < self.reject_below):
+                labels.append(prefilter_label(prob >= self.accept_above, prob))
+            else:
+                labels.append(None)
+                pending.append(index)
+        return labels, pending
+
+    def save(self, path: str):
+        np.savez_compressed(
+            path, weights=self.weights, idf=self.idf, bias=self.bias, thresholds=[self.reject_below, self.accept_above],
+            config=[self.n_features, self.ngrams],
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "PreFilter":
+        data = np.load(path)
+        n_features, ngrams = (int(v) for v in data["config"])
+        prefilter = cls(n_features=n_features, ngrams=ngrams)
+        prefilter.weights = data["weights"]
+        prefilter.idf = data["idf"]
+        prefilter.bias = float(data["bias"])
+        prefilter.reject_below, prefilter.accept_above = (float(v) for v in data["thresholds"])
+        return prefilter
+
+
+def prefilter_label(accept: bool, probability: float) -> Dict:
+    """The label recorded for an item the pre-filter settled (``source`` keeps it out of retraining)"""
+    return {
+        "is_child_context": bool(accept),
+        "exclude_reason": "none" if accept else "prefilter",
+        "risk_flags": [],
+        "quality": "medium",
+        "source": "prefilter",
+        "p_accept": round(float(probability), 4),
+    }
+
+
+def load_labelled(rejected_path: str, screened_path: str) -> Tuple[List[str], List[int]]:
+    """
+    Distinct questions with the LLM's verdict from a previous run's outputs
+
+    Negatives come from rejected_stage2.jsonl, positives from the screened
+    chat JSONL; fallback labels, rows the pre-filter decided (``source`` is
+    "prefilter" in either file) and unreadable lines are skipped. Chat rows
+    without a ``source`` predate the pre-filter and count as LLM labels. The
+    chat JSONL only holds scrubbed questions, so both are returned scrubbed. Questions with several answers are counted once by
+    majority vote; ties are dropped.
+    """
+    votes: Dict[str, List[int]] = defaultdict(list)
+    with open(rejected_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+                label = row["_screen"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            if is_failure(label) or label.get("source") == "prefilter":
+                continue
+            question = scrub(row.get("questionText"))
+            if question:
+                votes[question].append(0)
+    with open(screened_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+                question = scrub(row["messages"][0]["content"])
+            except (ValueError, KeyError, IndexError, TypeError):
+                continue
+            if row.get("source") == "prefilter":
+                continue
+            if question:
+                votes[question].append(1)
+
+    texts, labels = [], []
+    for question, v in votes.items():
+        if 2 * sum(v) != len(v):
+            texts.append(question)
+            labels.append(int(2 * sum(v) > len(v)))
+    return texts, labels
+
+
+def load_or_fit(path: str, rejected_path: str, screened_path: str,
+                target_agreement: float = 0.97) -> Optional[PreFilter]:
+    """
+    The pre-filter saved at ``path``, or one fitted on a previous run's outputs and saved there
+
+    It is trained once; delete ``path`` to retrain, which learns only from
+    the LLM's labels since both outputs mark the pre-filter's own. Returns
+    None when there are no earlier LLM labels to learn from.
+    """
+    if os.path.exists(path):
+        prefilter = PreFilter.load(path)
+        print(f"Loaded pre-filter from {path}")
+        return prefilter
+    if not (os.path.exists(rejected_path) and os.path.exists(screened_path)):
+        print("No earlier Stage 2 labels to train the pre-filter on; sending everything to the LLM.")
+        return None
+    texts, labels = load_labelled(rejected_path, screened_path)
+    if len(set(labels)) < 2:
+        print("Earlier Stage 2 labels have only one class; sending everything to the LLM.")
+        return None
+    prefilter = PreFilter().fit(texts, labels, target_agreement=target_agreement)
+    prefilter.save(path)
+    agreement = f"{prefilter.oof_agreement:.1%}" if prefilter.oof_agreement is not None else "n/a"
+    print(f"Trained pre-filter on {len(texts)} labelled questions: would settle {prefilter.oof_coverage:.1%} "
+          f"with {agreement} agreement (cross-validated); saved to {path}")
+    return prefilter
@@ -0,0 +1,173 @@
+"""
+Benchmark: Stage 2 Gemini screening, sequential loop vs the concurrent client
+
+Both run against a local MockGeminiServer (screening/mock_server.py) with a
+server-side request quota, per-request latency and injected 503s and
+malformed replies:
+
+- sequential: the notebook's original loop, one request at a time with up
+              to 3 attempts (1 s, 2 s backoff) and RATE_LIMIT_SEC of sleep
+              after every item
+- concurrent: screening.GeminiScreener, N requests in flight under a token
+              bucket that halves its rate on 429s
+
+Reports items/sec, error and failure rates, 429s and the projected wall time
+for the full CounselChat Stage 2 set (distinct questions, so every item costs
+a request).
+
+Then a resume check on rows as they come (several answers per question): a
+run with a LabelCache is interrupted halfway and started again, and a third
+run finds everything cached.
+
+Usage:
+    python scripts/bench_gemini_screening.py --items 200 --quota-rps 20 --latency 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from screening import GeminiScreener, LabelCache, MockGeminiServer, JSON_FALLBACK, parse_label, is_failure  # noqa: E402
+from screening.gemini import _reply_text  # noqa: E402
+from screening.labels import SYSTEM_INSTRUCTION, make_prompt  # noqa: E402
+
+STAGE2_ITEMS = 2201  # CounselChat rows that pass Stage 1
+
+
+def load_rows():
+    """Stage 2 questions as rows, one per CounselChat answer"""
+    questions = []
+    with open("data/1/rejected_stage2.jsonl", encoding="utf-8") as f:
+        for line in f:
+            try:
+                questions.append(json.loads(line)["questionText"] or "")
+            except (ValueError, KeyError):
+                continue
+    with open("data/1/counselchat_child_subset_chat_screened.jsonl", encoding="utf-8") as f:
+        questions += [json.loads(line)["messages"][0]["content"] for line in f]
+    return [{"questionText": q} for q in questions]
+
+
+def load_questions(limit: int):
+    """``limit`` distinct questions (cycled if there are fewer)"""
+    questions = list(dict.fromkeys(row["questionText"].strip() for row in load_rows()))
+    return [{"questionText": questions[i % len(questions)] + (f" ({i})" if i >= len(questions) else "")}
+            for i in range(limit)]
+
+
+def sequential(base_url: str, examples, rate_limit_sec: float):
+    """The notebook's original loop"""
+    failed = requests = 0
+    body = lambda q: {  # noqa: E731
+        "systemInstruction": {"parts": [{"text": SYSTEM_INSTRUCTION}]},
+        "contents": [{"role": "user", "parts": [{"text": make_prompt(q)}]}],
+        "generationConfig": {"temperature": 0, "responseMimeType": "application/json"},
+    }
+    start = time.perf_counter()
+    with httpx.Client(timeout=60) as client:
+        for ex in examples:
+            label = None
+            for attempt in range(3):
+                requests += 1
+                try:
+                    response = client.post(f"{base_url}/v1beta/models/mock:generateContent", json=body(ex["questionText"]))
+                    response.raise_for_status()
+                    label = parse_label(_reply_text(response.json()))
+                    if label is not None:
+                        break
+                    raise ValueError("non-json or missing keys")
+                except Exception:
+                    if attempt < 2:
+                        time.sleep(2 ** attempt)  # 1s, 2s
+            if label is None:
+                failed += 1
+                label = JSON_FALLBACK.copy()
+            time.sleep(rate_limit_sec)
+    elapsed = time.perf_counter() - start
+    return {"items_per_sec": len(examples) / elapsed, "seconds": elapsed, "requests": requests,
+            "failed": failed, "error_rate": (requests - len(examples) + failed) / requests}
+
+
+class Interrupted(Exception):
+    pass
+
+
+def resume(mock, rows, concurrency: int, rpm: float):
+    """Interrupt a cached run halfway, then run again twice"""
+    path = os.path.join(tempfile.mkdtemp(), "label_cache.sqlite")
+
+    def interrupt(index, example, label, seen=[0]):
+        seen[0] += 1
+        if seen[0] >= len(rows) // 2:
+            raise Interrupted
+
+    print(f"\nresume: {len(rows)} rows, {len(set(r['questionText'].strip() for r in rows))} distinct questions")
+    print(f"{'run':<16} {'rows':>6} {'cached':>7} {'hit rate':>9} {'dup rows':>9} {'requests':>9} {'seconds':>8}")
+    with MockGeminiServer(**mock) as server:
+        screener = GeminiScreener("test-key", "mock", base_url=server.base_url, concurrency=concurrency,
+                                  requests_per_minute=rpm, backoff_base=0.5)
+        for name, callback in (("interrupted", interrupt), ("resumed", None), ("re-run", None)):
+            with LabelCache(path, "mock") as cache:
+                try:
+                    labels = asyncio.run(screener.screen(rows, on_result=callback, progress=False, cache=cache))
+                    assert all(label is not None for label in labels)
+                except Interrupted:
+                    pass
+                m = screener.metrics()
+            print(f"{name:<16} {m['items'] + m['cache_hits']:>6} {m['cache_hits']:>7} {m['cache_hit_rate']:>9.1%} "
+                  f"{m['duplicates']:>9} {m['requests']:>9} {m['seconds']:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--sequential-items", type=int, default=20, help="the sequential loop is slow; time fewer items")
+    parser.add_argument("--latency", type=float, default=0.3, help="mock seconds per request")
+    parser.add_argument("--quota-rps", type=float, default=20, help="mock server quota (429 beyond it)")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="fraction of 503s")
+    parser.add_argument("--malformed-rate", type=float, default=0.02, help="fraction of non-JSON replies")
+    parser.add_argument("--rate-limit-sec", type=float, default=1.0, help="sequential loop's sleep per item")
+    parser.add_argument("--concurrency", default="8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--rpm", type=float, default=1800, help="client token-bucket rate (requests/minute)")
+    parser.add_argument("--resume-rows", type=int, default=600, help="rows for the resume check (0 to skip)")
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    examples = load_questions(args.items)
+    mock = dict(latency=args.latency, requests_per_second=args.quota_rps,
+                error_rate=args.error_rate, malformed_rate=args.malformed_rate)
+
+    print(f"mock: {args.latency * 1000:.0f} ms/request, quota {args.quota_rps} req/s, "
+          f"{args.error_rate:.0%} 503s, {args.malformed_rate:.0%} malformed")
+    print(f"{'mode':<16} {'items/s':>8} {'requests':>9} {'429s':>6} {'err rate':>9} {'failed':>7} {'full run':>9}")
+
+    with MockGeminiServer(**mock) as server:
+        r = sequential(server.base_url, examples[:args.sequential_items], args.rate_limit_sec)
+    print(f"{'sequential':<16} {r['items_per_sec']:>8.2f} {r['requests']:>9} {0:>6} {r['error_rate']:>9.1%} "
+          f"{r['failed']:>7} {STAGE2_ITEMS / r['items_per_sec'] / 60:>7.1f} m")
+
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        with MockGeminiServer(**mock) as server:
+            screener = GeminiScreener("test-key", "mock", base_url=server.base_url, concurrency=concurrency,
+                                      requests_per_minute=args.rpm, backoff_base=0.5)
+            labels = asyncio.run(screener.screen(examples, progress=False))
+            m = screener.metrics()
+        assert sum(map(is_failure, labels)) == m["failed"]
+        print(f"{'concurrent x' + str(concurrency):<16} {m['items_per_sec']:>8.2f} {m['requests']:>9} "
+              f"{m['rate_limited']:>6} {m['error_rate']:>9.1%} {m['failed']:>7} "
+              f"{STAGE2_ITEMS / m['items_per_sec'] / 60:>7.1f} m   (ends at {m['final_rpm']:.0f} rpm)")
+
+    if args.resume_rows:
+        resume(mock, load_rows()[:args.resume_rows], int(args.concurrency.split(",")[0]), args.rpm)
+
+
+if __name__ == "__main__":
+    main()
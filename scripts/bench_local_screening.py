@@ -0,0 +1,109 @@
+"""
+Benchmark: local Stage 2 screening, fixed batches vs length-bucketed batches
+
+All modes classify the same distinct Stage 2 questions with the same model:
+
+- fixed:    the notebook's original classify_batch, BATCH_SIZE rows in
+            dataset order, padded to the longest prompt in the batch, always
+            generating MAX_NEW_TOKENS
+- bucketed: screening.LocalScreener, prompts sorted by length and batched by
+            a token budget, each row stopping once its JSON object closes
+- schema:   the same, with schema-constrained decoding (screening/constrained.py)
+
+Reports items/sec, prompt padding waste, decode slots spent on finished
+rows, generated tokens per item and how many labels parse. Runs on CPU
+with a small model.
+
+Usage:
+    python scripts/bench_local_screening.py --model Qwen/Qwen2.5-0.5B-Instruct --items 64
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from screening.labels import JSON_FALLBACK, parse_label, is_failure  # noqa: E402
+from screening.local import LocalScreener  # noqa: E402
+from bench_gemini_screening import load_rows  # noqa: E402
+
+
+def fixed(screener: LocalScreener, questions, batch_size: int, max_new_tokens: int):
+    """The notebook's original loop"""
+    tok, model = screener.tokenizer, screener.model
+    prompt_tokens = padding = generated = slots = failed = 0
+    start = time.perf_counter()
+    for i in range(0, len(questions), batch_size):
+        prompts = [screener.build_prompt(q) for q in questions[i:i + batch_size]]
+        inputs = tok(prompts, return_tensors="pt", padding=True, truncation=True, max_length=512).to(model.device)
+        with torch.no_grad():
+            out = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False,
+                                 pad_token_id=tok.pad_token_id, eos_token_id=tok.eos_token_id)
+        rows, width = inputs["input_ids"].shape
+        prompt_tokens += rows * width
+        padding += rows * width - int(inputs["attention_mask"].sum())
+        gen = out[:, width:]
+        slots += gen.numel()
+        for row in gen.tolist():
+            length = next((n + 1 for n, t in enumerate(row) if t == tok.eos_token_id), len(row))
+            generated += length
+        for text in tok.batch_decode(gen, skip_special_tokens=True):
+            failed += parse_label(text) is None
+    seconds = time.perf_counter() - start
+    return {"items_per_sec": len(questions) / seconds, "seconds": seconds, "padding_waste": padding / prompt_tokens,
+            "decode_waste": 1 - generated / slots, "tokens_per_item": generated / len(questions),
+            "failed": failed, "batches": -(-len(questions) // batch_size)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="Qwen/Qwen2.5-0.5B-Instruct")
+    parser.add_argument("--items", type=int, default=64, help="distinct questions to classify")
+    parser.add_argument("--batch-size", type=int, default=8, help="fixed batch size (the notebook's BATCH_SIZE)")
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--max-batch-tokens", type=int, default=16384, help="bucketed token budget per batch")
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    questions = list(dict.fromkeys(row["questionText"].strip() for row in load_rows()))[:args.items]
+    examples = [{"questionText": q} for q in questions]
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model, dtype=torch.float32).eval()
+    screeners = {
+        name: LocalScreener(model, tokenizer, max_batch_tokens=args.max_batch_tokens,
+                            max_batch_size=args.max_batch_size, max_new_tokens=args.max_new_tokens,
+                            constrained=constrained)
+        for name, constrained in (("bucketed", False), ("schema", True))
+    }
+    for screener in screeners.values():
+        screener.screen(examples[:2], progress=False)  # warm-up (and vocabulary index for the schema)
+
+    print(f"{len(questions)} questions, max_new_tokens={args.max_new_tokens}, threads={torch.get_num_threads()}")
+    print(f"{'mode':<22} {'items/s':>8} {'batches':>8} {'pad waste':>10} {'decode waste':>13} "
+          f"{'tok/item':>9} {'unparsed':>9}")
+
+    r = fixed(screeners["bucketed"], questions, args.batch_size, args.max_new_tokens)
+    print(f"{'fixed x' + str(args.batch_size):<22} {r['items_per_sec']:>8.2f} {r['batches']:>8} "
+          f"{r['padding_waste']:>10.1%} {r['decode_waste']:>13.1%} {r['tokens_per_item']:>9.1f} {r['failed']:>9}")
+
+    for name, screener in screeners.items():
+        labels = screener.screen(examples, progress=False)
+        m = screener.metrics()
+        assert sum(map(is_failure, labels)) == m["failed"] and all(label is not JSON_FALLBACK for label in labels)
+        print(f"{name + ' ' + str(args.max_batch_tokens) + ' tok':<22} {m['items_per_sec']:>8.2f} {m['batches']:>8} "
+              f"{m['padding_waste']:>10.1%} {m['decode_waste']:>13.1%} {m['tokens_per_item']:>9.1f} {m['failed']:>9}"
+              f"   ({m['closed_early']} rows stopped at a closed JSON object)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark: the Stage 2 pre-filter on held-out LLM labels
+
+Trains screening.PreFilter on the previous run's LLM labels
+(data/1/rejected_stage2.jsonl and the screened chat JSONL) with an outer
+k-fold split over distinct questions. For each agreement target it reports,
+on the held-out folds:
+
+- avoided:   fraction of questions settled without an LLM call
+- agreement: how often those auto-decisions match the LLM's label
+- overall:   agreement of the whole Stage 2 output (LLM-routed items count
+             as agreeing), i.e. what the pre-filter costs in label quality
+
+plus the raw classifier's accuracy and ROC AUC, and training and routing
+time.
+
+Usage:
+    python scripts/bench_prefilter.py --targets 0.95,0.97,0.99
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from screening.prefilter import PreFilter, load_labelled, ACCEPT, LLM  # noqa: E402
+
+
+def roc_auc(p: np.ndarray, y: np.ndarray) -> float:
+    ranks = np.empty(len(p))
+    ranks[np.argsort(p)] = np.arange(1, len(p) + 1)
+    positives = y.sum()
+    return float((ranks[y == 1].sum() - positives * (positives + 1) / 2) / (positives * (len(y) - positives)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rejected", default="data/1/rejected_stage2.jsonl")
+    parser.add_argument("--screened", default="data/1/counselchat_child_subset_chat_screened.jsonl")
+    parser.add_argument("--targets", default="0.95,0.97,0.99", help="comma-separated agreement targets")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=3, help="outer splits with different seeds")
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    texts, labels = load_labelled(args.rejected, args.screened)
+    y = np.array(labels)
+    print(f"{len(texts)} distinct questions with LLM labels ({y.sum()} accepted, {len(y) - y.sum()} rejected), "
+          f"{args.folds}-fold x {args.repeats}")
+
+    # Raw classifier quality (threshold 0.5) on out-of-fold predictions
+    p = np.zeros(len(y))
+    for train, test in _splits(len(y), args.folds, seed=0):
+        model = PreFilter().fit([texts[i] for i in train], y[train])
+        p[test] = model.predict_proba([texts[i] for i in test])
+    print(f"classifier: accuracy {((p >= 0.5) == y).mean():.1%}, ROC AUC {roc_auc(p, y):.3f}\n")
+
+    print(f"{'target':>7} {'avoided':>8} {'agreement':>10} {'overall':>8} {'accept':>7} {'reject':>7}")
+    fits = routed = 0
+    fit_seconds = route_seconds = 0.0
+    for target in [float(t) for t in args.targets.split(",")]:
+        decided = agree = accepted = rejected = total = 0
+        for repeat in range(args.repeats):
+            for train, test in _splits(len(y), args.folds, seed=repeat):
+                start = time.perf_counter()
+                model = PreFilter().fit([texts[i] for i in train], y[train], target_agreement=target)
+                fit_seconds += time.perf_counter() - start
+                fits += 1
+                start = time.perf_counter()
+                routes = model.route([texts[i] for i in test])
+                route_seconds += time.perf_counter() - start
+                routed += len(test)
+                settled = routes != LLM
+                decided += settled.sum()
+                agree += ((routes == ACCEPT) == (y[test] == 1))[settled].sum()
+                accepted += (routes == ACCEPT).sum()
+                rejected += settled.sum() - (routes == ACCEPT).sum()
+                total += len(test)
+        agreement = f"{agree / decided:.1%}" if decided else "-"
+        print(f"{target:>7.2f} {decided / total:>8.1%} {agreement:>10} "
+              f"{1 - (decided - agree) / total:>8.1%} {accepted:>7} {rejected:>7}")
+    print(f"\nfit (incl. {args.folds}-fold calibration): {fit_seconds / fits:.2f} s, "
+          f"routing: {routed / route_seconds:.0f} questions/s")
+
+
+def _splits(n: int, folds: int, seed: int):
+    fold = np.random.default_rng(1000 + seed).permutation(n) % folds
+    for k in range(folds):
+        yield np.nonzero(fold != k)[0], np.nonzero(fold == k)[0]
+
+
+if __name__ == "__main__":
+    main()
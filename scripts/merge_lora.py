@@ -0,0 +1,93 @@
+"""
+Merge the PsychAI LoRA adapter into the base model and export safetensors shards
+
+The merged checkpoint loads like any plain model: no PeftModel wrapping at
+start-up and no LoRA matmuls in the forward pass. Shards are written as
+safetensors, which transformers memory-maps on load, so cold start is bound
+by disk reads instead of adapter application.
+
+Point the app at the output with `merged_model` in the [model] section of
+website/.streamlit/secrets.toml (or PSYCHAI_MERGED_MODEL).
+
+Usage:
+    python scripts/merge_lora.py --adapter psychai-lora-out --output psychai-merged
+    python scripts/merge_lora.py --adapter kavin-ravi/qwen3-8b-psychai-lora --output psychai-merged --check
+"""
+
+import argparse
+import json
+import os
+import time
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+from peft import PeftModel
+
+DTYPES = {"bfloat16": torch.bfloat16, "float16": torch.float16, "float32": torch.float32}
+
+CHECK_PROMPT = [{"role": "user", "content": "I've been feeling really anxious about school lately."}]
+
+
+def merge(base_model: str, adapter: str, output: str, dtype: torch.dtype, max_shard_size: str):
+    start = time.perf_counter()
+    # Merging needs unquantized weights: load on CPU in the target dtype
+    model = AutoModelForCausalLM.from_pretrained(base_model, torch_dtype=dtype, low_cpu_mem_usage=True)
+    model = PeftModel.from_pretrained(model, adapter)
+    print(f"Loaded base + adapter in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    model = model.merge_and_unload()
+    print(f"Merged adapter in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    model.save_pretrained(output, safe_serialization=True, max_shard_size=max_shard_size)
+    # The adapter repo ships the tokenizer used during fine-tuning
+    AutoTokenizer.from_pretrained(adapter).save_pretrained(output)
+    with open(os.path.join(output, "merge_info.json"), "w") as f:
+        json.dump({"base_model": base_model, "adapter": adapter, "dtype": str(dtype).replace("torch.", "")}, f, indent=2)
+    print(f"Saved merged checkpoint to {output} in {time.perf_counter() - start:.1f}s")
+
+
+def check(base_model: str, adapter: str, output: str, dtype: torch.dtype):
+    """Compare cold-load time and next-token logits of base + adapter vs the merged checkpoint"""
+    tokenizer = AutoTokenizer.from_pretrained(output)
+    prompt = tokenizer.apply_chat_template(CHECK_PROMPT, tokenize=False, add_generation_prompt=True)
+    inputs = tokenizer(prompt, return_tensors="pt")
+
+    start = time.perf_counter()
+    reference = PeftModel.from_pretrained(
+        AutoModelForCausalLM.from_pretrained(base_model, torch_dtype=dtype, low_cpu_mem_usage=True), adapter
+    ).eval()
+    adapter_seconds = time.perf_counter() - start
+    with torch.no_grad():
+        expected = reference(**inputs).logits[0, -1].float()
+    del reference
+
+    start = time.perf_counter()
+    merged = AutoModelForCausalLM.from_pretrained(output, torch_dtype=dtype, low_cpu_mem_usage=True).eval()
+    merged_seconds = time.perf_counter() - start
+    with torch.no_grad():
+        actual = merged(**inputs).logits[0, -1].float()
+
+    print(f"Load base + adapter: {adapter_seconds:.1f}s, load merged: {merged_seconds:.1f}s")
+    print(f"Max next-token logit difference: {(expected - actual).abs().max().item():.4f} "
+          f"(same top token: {expected.argmax().item() == actual.argmax().item()})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-model", default="Qwen/Qwen3-8B")
+    parser.add_argument("--adapter", default="psychai-lora-out", help="adapter directory or hub id")
+    parser.add_argument("--output", default="psychai-merged")
+    parser.add_argument("--dtype", default="bfloat16", choices=sorted(DTYPES))
+    parser.add_argument("--max-shard-size", default="2GB")
+    parser.add_argument("--check", action="store_true", help="compare load time and logits against base + adapter")
+    args = parser.parse_args()
+
+    merge(args.base_model, args.adapter, args.output, DTYPES[args.dtype], args.max_shard_size)
+    if args.check:
+        check(args.base_model, args.adapter, args.output, DTYPES[args.dtype])
+
+
+if __name__ == "__main__":
+    main()
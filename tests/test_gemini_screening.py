@@ -0,0 +1,183 @@
+"""
+Tests for the Gemini screening client, its rate limiter and the label cache,
+run against the local mock server
+
+Run from the repository root:
+    python -m pytest tests
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("httpx")
+
+from screening import GeminiScreener, LabelCache, MockGeminiServer, TokenBucket  # noqa: E402
+from screening.mock_server import mock_label  # noqa: E402
+
+QUESTIONS = [
+    "My son is 12 and refuses to go to school. What should I do?",
+    "My wife and I argue about money every week.",
+    "How do I help my teenage daughter with exam anxiety?",
+    "I hate my job and my boss ignores me.",
+    "Our toddler bites other kids at daycare.",
+    "My 8 year old is scared of the dark.",
+]
+
+
+def examples(repeats=1):
+    return [{"questionText": q} for q in QUESTIONS] * repeats
+
+
+def screener(server, **kwargs):
+    options = {"concurrency": 4, "requests_per_minute": 6000, "backoff_base": 0.01, "backoff_max": 0.05}
+    options.update(kwargs)
+    return GeminiScreener("test-key", "mock", base_url=server.base_url, **options)
+
+
+# ---- TokenBucket ----
+
+def test_token_bucket_spaces_requests_at_the_rate():
+    async def run():
+        bucket = TokenBucket(rate=50, capacity=1)
+        start = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # The first token is there already; five more take 5/50 s
+    assert asyncio.run(run()) >= 0.09
+
+
+def test_rate_limit_halves_the_rate_once_per_burst_and_pauses():
+    async def run():
+        bucket = TokenBucket(rate=100, capacity=4)
+        epochs = [await bucket.acquire() for _ in range(3)]
+        # Three in-flight requests all come back 429
+        for epoch in epochs:
+            bucket.penalize(epoch, pause_seconds=0.1)
+        rate = bucket.rate
+        start = time.monotonic()
+        await bucket.acquire()
+        return rate, time.monotonic() - start, bucket
+
+    rate, waited, bucket = asyncio.run(run())
+    assert rate == 50
+    assert waited >= 0.09
+    # A 429 for a request sent after the decrease halves it again
+    bucket.penalize(bucket._epoch)
+    assert bucket.rate == 25
+
+
+def test_rate_recovers_additively_after_successes():
+    bucket = TokenBucket(rate=100, min_rate=10, recover_after=3, recover_step=0.1)
+    for _ in range(5):
+        bucket.penalize(bucket._epoch)
+    assert bucket.rate == 10  # never below min_rate
+
+    for _ in range(3):
+        bucket.reward()
+    assert bucket.rate == pytest.approx(20)
+    for _ in range(3 * 20):
+        bucket.reward()
+    assert bucket.rate == 100  # capped at the configured rate
+
+
+# ---- GeminiScreener against MockGeminiServer ----
+
+def test_labels_match_the_server_and_duplicates_are_sent_once():
+    with MockGeminiServer(latency=0.01) as server:
+        client = screener(server)
+        labels = asyncio.run(client.screen(examples(repeats=3), progress=False))
+
+    assert labels == [mock_label(q) for q in QUESTIONS] * 3
+    metrics = client.metrics()
+    assert metrics["requests"] == len(QUESTIONS) == server.counts["requests"]
+    assert metrics["duplicates"] == 2 * len(QUESTIONS)
+    assert metrics["failed"] == 0
+
+
+def test_server_rate_limit_slows_the_client_down_without_failures():
+    with MockGeminiServer(latency=0.01, requests_per_second=20) as server:
+        client = screener(server, concurrency=8, burst=8)
+        labels = asyncio.run(client.screen(examples() + [{"questionText": f"My child has question {i}"} for i in range(30)],
+                                           progress=False))
+
+    metrics = client.metrics()
+    assert metrics["rate_limited"] > 0 and metrics["failed"] == 0
+    assert metrics["final_rpm"] < 6000
+    assert labels[:len(QUESTIONS)] == [mock_label(q) for q in QUESTIONS]
+
+
+def test_server_errors_and_malformed_replies_are_retried():
+    with MockGeminiServer(latency=0.01, error_rate=0.2, malformed_rate=0.2, seed=3) as server:
+        client = screener(server, max_retries=10)
+        labels = asyncio.run(client.screen(examples(), progress=False))
+
+    assert labels == [mock_label(q) for q in QUESTIONS]
+    metrics = client.metrics()
+    assert metrics["server_errors"] + metrics["parse_errors"] > 0
+    assert metrics["failed"] == 0
+
+
+def test_items_out_of_retries_get_the_fallback_label():
+    with MockGeminiServer(latency=0.0, error_rate=1.0) as server:
+        client = screener(server, max_retries=2)
+        labels = asyncio.run(client.screen(examples(), progress=False))
+
+    assert all(label["exclude_reason"] == "llm_error" for label in labels)
+    assert client.metrics()["failed"] == len(QUESTIONS)
+    assert server.counts["requests"] == 3 * len(QUESTIONS)
+
+
+# ---- LabelCache ----
+
+def test_cached_labels_skip_the_request(tmp_path):
+    path = str(tmp_path / "labels.sqlite")
+    with MockGeminiServer(latency=0.01) as server:
+        with LabelCache(path, model="mock") as cache:
+            first = asyncio.run(screener(server).screen(examples(), progress=False, cache=cache))
+        sent = server.counts["requests"]
+
+        # A new question is a miss; everything else comes from the reopened cache
+        with LabelCache(path, model="mock") as cache:
+            client = screener(server)
+            second = asyncio.run(client.screen(examples() + [{"questionText": "My kid lies a lot"}],
+                                               progress=False, cache=cache))
+            assert cache.metrics()["hits"] == len(QUESTIONS) and cache.metrics()["misses"] == 1
+
+    assert second[:len(QUESTIONS)] == first
+    assert server.counts["requests"] == sent + 1
+    assert client.metrics()["cache_hits"] == len(QUESTIONS)
+
+
+def test_fallback_labels_are_not_cached(tmp_path):
+    with MockGeminiServer(latency=0.0, error_rate=1.0) as server:
+        with LabelCache(str(tmp_path / "labels.sqlite"), model="mock") as cache:
+            asyncio.run(screener(server, max_retries=0).screen(examples(), progress=False, cache=cache))
+            assert len(cache) == 0
+            assert cache.get(QUESTIONS[0]) is None
+
+
+def test_cache_keys_depend_on_model_and_prompt_version(tmp_path):
+    path = str(tmp_path / "labels.sqlite")
+    label = mock_label(QUESTIONS[0])
+    with LabelCache(path, model="mock") as cache:
+        cache.put(QUESTIONS[0], label)
+        # Surrounding whitespace does not change the key
+        assert cache.get(f"  {QUESTIONS[0]}\n") == label
+    with LabelCache(path, model="other") as cache:
+        assert cache.get(QUESTIONS[0]) is None
+    with LabelCache(path, model="mock", prompt_version="v0") as cache:
+        assert cache.get(QUESTIONS[0]) is None
+
+
+def test_cache_for_another_model_is_refused(tmp_path):
+    with MockGeminiServer() as server, LabelCache(str(tmp_path / "labels.sqlite"), model="other") as cache:
+        with pytest.raises(ValueError):
+            asyncio.run(screener(server).screen(examples(), progress=False, cache=cache))
@@ -0,0 +1,271 @@
+"""
+Tests for local screening: the label DFA, schema-constrained decoding,
+per-row stopping and length-bucketed batching
+
+The end-to-end tests use a tiny random Qwen2 model and a byte-level BPE
+tokenizer trained on the spot, so they need no download.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+
+import itertools
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+tokenizers = pytest.importorskip("tokenizers")
+
+from screening.constrained import MAX_FLAG_CHARS, MAX_FLAGS, LabelDFA, SchemaConstraint, SchemaLogitsProcessor  # noqa: E402
+from screening.labels import EXCLUDE_REASONS, QUALITIES, parse_label  # noqa: E402
+from screening.local import JsonObjectClosed, LocalScreener, plan_batches  # noqa: E402
+
+QUESTIONS = [
+    "My son is 12 and refuses to go to school. What should I do?",
+    "How do I help my teenage daughter with exam anxiety?",
+    "My wife and I argue about money every week.",
+    "Our toddler bites other kids at daycare.",
+    "My 8 year old is scared of the dark and won't sleep alone.",
+    "I think my student is being bullied online, how can I tell?",
+    "I hate my job.",
+    "My teenager stopped talking to us after we moved to a new city last year and spends all day in her room.",
+]
+
+
+def label_text(child=True, reason="none", flags=(), quality="high"):
+    """A label in the one layout LabelDFA accepts"""
+    return (f'{{"is_child_context": {"true" if child else "false"}, "exclude_reason": "{reason}", '
+            f'"risk_flags": [{", ".join(json.dumps(f) for f in flags)}], "quality": "{quality}"}}')
+
+
+@pytest.fixture(scope="module")
+def dfa():
+    return LabelDFA()
+
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    """Byte-level BPE (like Qwen's) trained on labels and questions"""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+
+    corpus = QUESTIONS + [
+        label_text(child, reason, flags, quality)
+        for child, reason, quality in itertools.product((True, False), EXCLUDE_REASONS, QUALITIES)
+        for flags in ((), ("self-harm",), ("bullying", "sleep"))
+    ]
+    bpe = Tokenizer(models.BPE())
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    bpe.train_from_iterator(corpus * 5, trainers.BpeTrainer(
+        vocab_size=600, special_tokens=["<|endoftext|>", "<|im_start|>", "<|im_end|>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    ))
+    fast = transformers.PreTrainedTokenizerFast(tokenizer_object=bpe, eos_token="<|im_end|>",
+                                                pad_token="<|endoftext|>")
+    fast.chat_template = (
+        "{% for m in messages %}<|im_start|>{{ m['role'] }}\n{{ m['content'] }}<|im_end|>\n{% endfor %}"
+        "{% if add_generation_prompt %}<|im_start|>assistant\n{% endif %}"
+    )
+    return fast
+
+
+@pytest.fixture(scope="module")
+def constraint(tokenizer, dfa):
+    return SchemaConstraint(tokenizer, dfa)
+
+
+@pytest.fixture(scope="module")
+def tiny_model(tokenizer):
+    torch.manual_seed(0)
+    config = transformers.Qwen2Config(
+        vocab_size=len(tokenizer), hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=1024,
+        eos_token_id=tokenizer.eos_token_id, pad_token_id=tokenizer.pad_token_id,
+    )
+    return transformers.Qwen2ForCausalLM(config).eval()
+
+
+# ---- LabelDFA ----
+
+def test_dfa_accepts_every_enum_combination(dfa):
+    for child, reason, quality in itertools.product((True, False), EXCLUDE_REASONS, QUALITIES):
+        text = label_text(child, reason, ("self-harm", "bullying"), quality)
+        assert dfa.advance(dfa.start, text) == dfa.final
+        assert parse_label(text)["exclude_reason"] == reason
+
+
+@pytest.mark.parametrize("text", [
+    label_text(reason="maybe"),
+    label_text(quality="excellent"),
+    label_text(flags=("",)),
+    label_text(flags=("UPPER",)),
+    label_text(flags=("x" * (MAX_FLAG_CHARS + 1),)),
+    label_text(flags=tuple(f"flag{i}" for i in range(MAX_FLAGS + 1))),
+    'Sure! ' + label_text(),
+    label_text().replace(", ", ","),
+])
+def test_dfa_rejects_anything_else(dfa, text):
+    state = dfa.advance(dfa.start, text)
+    assert state != dfa.final
+
+
+def test_dfa_distance_is_the_shortest_label(dfa):
+    shortest = min(len(label_text(child, reason, (), quality))
+                   for child, reason, quality in itertools.product((True, False), EXCLUDE_REASONS, QUALITIES))
+    assert dfa.distance[dfa.start] == shortest
+    assert dfa.distance[dfa.final] == 0
+    assert min(dfa.distance) == 0 and -1 not in dfa.distance  # every state can still finish
+
+
+def test_choices_must_be_prefix_free():
+    with pytest.raises(ValueError):
+        LabelDFA(qualities=("high", "higher"))
+
+
+# ---- SchemaConstraint ----
+
+def allowed(constraint, state, remaining=1000):
+    mask = constraint.mask(state, remaining, len(constraint.texts) + 1000, "cpu")
+    return [int(i) for i in torch.nonzero(mask).flatten()]
+
+
+def test_allowed_tokens_at_each_state_of_a_label(constraint, dfa):
+    text = label_text(False, "general_adult", ("money",), "medium")
+    for i in range(len(text)):
+        state = dfa.advance(dfa.start, text[:i])
+        tokens = allowed(constraint, state)
+        assert tokens, f"no token allowed after {text[:i]!r}"
+        for token in tokens:
+            # Every allowed token keeps the text inside the schema
+            assert dfa.advance(state, constraint.texts[token]) is not None
+        if len(dfa.transitions[state]) > 1:
+            # At a choice every option that has a token stays open
+            firsts = {constraint.texts[token][0] for token in tokens}
+            assert firsts == set(dfa.transitions[state]) & {t[0] for t in constraint.texts.values()}
+
+
+def test_fixed_text_is_written_with_the_longest_token(constraint, dfa):
+    tokens = allowed(constraint, dfa.start)
+    assert len(tokens) == 1
+    text = constraint.texts[tokens[0]]
+    assert len(text) > 1 and '{"is_child_context": '.startswith(text)
+
+
+def test_only_eos_once_the_object_is_closed(constraint, dfa, tokenizer):
+    assert allowed(constraint, dfa.final) == [tokenizer.eos_token_id]
+    # A finished row (state None) is left alone
+    assert len(allowed(constraint, None)) == len(constraint.texts) + 1000
+
+
+def test_tight_budget_forces_the_shortest_way_out(constraint, dfa):
+    state = dfa.advance(dfa.start, '{"is_child_context": true, "exclude_reason": "none", "risk_flags": [')
+    remaining = dfa.distance[state]
+    for token in allowed(constraint, state, remaining):
+        nxt = dfa.advance(state, constraint.texts[token])
+        assert dfa.distance[nxt] <= remaining - 1
+    # With room to spare a flag may be opened
+    assert any(constraint.texts[t].startswith('"') for t in allowed(constraint, state, remaining + 20))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_processor_always_yields_a_label_within_the_budget(constraint, dfa, tokenizer, seed):
+    max_new_tokens = dfa.distance[dfa.start]  # one character per token at worst
+    processor = SchemaLogitsProcessor(constraint, batch_size=2, prompt_length=1, max_new_tokens=max_new_tokens)
+    generator = torch.Generator().manual_seed(seed)
+    input_ids = torch.zeros((2, 1), dtype=torch.long)
+    for _ in range(max_new_tokens):
+        scores = processor(input_ids, torch.randn((2, len(tokenizer)), generator=generator))
+        input_ids = torch.cat([input_ids, scores.argmax(-1, keepdim=True)], dim=1)
+
+    for row in input_ids[:, 1:].tolist():
+        # generate() stops a row at EOS, which is only allowed once the object is closed
+        assert tokenizer.eos_token_id in row
+        text = tokenizer.decode(row[:row.index(tokenizer.eos_token_id)])
+        assert dfa.advance(dfa.start, text) == dfa.final, text
+        assert parse_label(text) is not None
+
+
+# ---- JsonObjectClosed ----
+
+def test_rows_stop_when_their_object_closes_or_on_eos(tokenizer):
+    eos = tokenizer.eos_token_id
+    rows = [
+        tokenizer.encode('{"a": "}{", "b": {"c": 1}} trailing'),  # braces in strings don't count
+        tokenizer.encode("no json here") + [eos],
+        tokenizer.encode('{"open": "never closed'),
+    ]
+    width = max(len(r) for r in rows)
+    stop = JsonObjectClosed(tokenizer, batch_size=3, prompt_length=0, eos_ids={eos})
+    done = None
+    for step in range(1, width + 1):
+        column = [r[step - 1] if step <= len(r) else tokenizer.pad_token_id for r in rows]
+        history = torch.tensor([column]).T if step == 1 else torch.cat([history, torch.tensor([column]).T], dim=1)
+        done = stop(history, None)
+
+    closing = next(i for i in range(len(rows[0])) if tokenizer.decode(rows[0][:i + 1]).endswith("}}"))
+    assert stop.finished_at[0] == closing + 1 and stop.closed[0]
+    assert stop.finished_at[1] == len(rows[1]) and not stop.closed[1]
+    assert stop.finished_at[2] is None
+    assert done.tolist() == [True, True, False]
+
+
+# ---- plan_batches ----
+
+def test_batches_hold_similar_lengths_longest_first():
+    lengths = [10, 300, 12, 290, 11, 305, 150, 9]
+    batches = plan_batches(lengths, max_batch_tokens=1400, max_batch_size=8, max_new_tokens=50)
+
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+    assert batches[0][0] == 5  # the longest prompt is in the first batch
+    flat = [lengths[i] for batch in batches for i in batch]
+    assert flat == sorted(lengths, reverse=True)
+    for batch in batches:
+        width = lengths[batch[0]] + 50
+        assert len(batch) * width <= 1400 or len(batch) == 1
+    # Three long prompts fill the budget; the 150-token one leads a batch with every short one
+    assert [len(batch) for batch in batches] == [3, 5]
+
+
+def test_batches_respect_the_row_limit():
+    batches = plan_batches([5] * 10, max_batch_tokens=10 ** 6, max_batch_size=4, max_new_tokens=10)
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+
+
+def test_prompt_over_the_budget_gets_its_own_batch():
+    batches = plan_batches([5000, 10, 10], max_batch_tokens=1000, max_batch_size=8, max_new_tokens=10)
+    assert batches == [[0], [1, 2]]
+
+
+def test_no_prompts_no_batches():
+    assert plan_batches([], 1000, 8, 10) == []
+
+
+# ---- LocalScreener end to end ----
+
+def test_constrained_decoding_never_falls_back(tiny_model, tokenizer, dfa):
+    screener = LocalScreener(tiny_model, tokenizer, max_batch_tokens=4096, max_new_tokens=128)
+    labels = screener.screen([{"questionText": q} for q in QUESTIONS], progress=False)
+
+    assert screener.metrics()["failed"] == 0
+    for label in labels:
+        assert label["exclude_reason"] in EXCLUDE_REASONS and label["quality"] in QUALITIES
+    assert screener.metrics()["closed_early"] == len(QUESTIONS)
+
+
+def test_unconstrained_random_model_falls_back(tiny_model, tokenizer):
+    screener = LocalScreener(tiny_model, tokenizer, max_batch_tokens=4096, max_new_tokens=32, constrained=False)
+    labels = screener.screen([{"questionText": q} for q in QUESTIONS], progress=False)
+
+    assert screener.metrics()["failed"] > 0
+    assert any(label["exclude_reason"] == "llm_error" for label in labels)
+
+
+def test_max_new_tokens_must_fit_the_shortest_label(tiny_model, tokenizer, dfa):
+    with pytest.raises(ValueError):
+        LocalScreener(tiny_model, tokenizer, max_new_tokens=dfa.distance[dfa.start] - 1)
@@ -0,0 +1,76 @@
+"""
+Tests for the Stage 2 pre-filter's training data
+
+Run from the repository root:
+    python -m pytest tests
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("numpy")
+pytest.importorskip("httpx")
+
+from screening.labels import JSON_FALLBACK  # noqa: E402
+from screening.prefilter import load_labelled, prefilter_label  # noqa: E402
+
+
+def llm_label(accept):
+    return {"is_child_context": accept, "exclude_reason": "none" if accept else "general_adult",
+            "risk_flags": [], "quality": "high"}
+
+
+def chat_row(question, source=None):
+    row = {"messages": [{"role": "user", "content": question}, {"role": "assistant", "content": "An answer."}]}
+    if source is not None:
+        row["source"] = source
+    return row
+
+
+def write_jsonl(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        for row in rows:
+            f.write((row if isinstance(row, str) else json.dumps(row)) + "\n")
+    return str(path)
+
+
+def test_only_llm_labels_are_learned_from(tmp_path):
+    rejected = write_jsonl(tmp_path / "rejected.jsonl", [
+        {"questionText": "I hate my job.", "_screen": llm_label(False)},
+        {"questionText": "My boss ignores me.", "_screen": prefilter_label(False, 0.01)},
+        {"questionText": "Unreadable reply.", "_screen": dict(JSON_FALLBACK)},
+        "not json",
+    ])
+    screened = write_jsonl(tmp_path / "screened.jsonl", [
+        chat_row("My son refuses to go to school.", source="llm"),
+        chat_row("Our toddler bites other kids.", source="prefilter"),
+        chat_row("My daughter has exam anxiety."),  # written before the pre-filter existed
+    ])
+
+    texts, labels = load_labelled(rejected, screened)
+
+    assert dict(zip(texts, labels)) == {
+        "I hate my job.": 0,
+        "My son refuses to go to school.": 1,
+        "My daughter has exam anxiety.": 1,
+    }
+
+
+def test_questions_are_counted_once_by_majority(tmp_path):
+    rejected = write_jsonl(tmp_path / "rejected.jsonl", [
+        {"questionText": "Tied question.", "_screen": llm_label(False)},
+    ])
+    screened = write_jsonl(tmp_path / "screened.jsonl", [
+        chat_row("Tied question."),
+        chat_row("Mostly kept  question."),
+        chat_row("Mostly kept question."),
+    ])
+
+    texts, labels = load_labelled(rejected, screened)
+
+    assert (texts, labels) == (["Mostly kept question."], [1])
@@ -0,0 +1,182 @@
+"""
+Benchmark: chat history reads with single-column vs composite indexes
+
+Seeds a scratch schema in a local Postgres with a chat_messages table shaped
+like the real one, then compares:
+
+- old: single-column indexes on user_email / chat_id / timestamp, full-history read
+- new: composite (user_email, chat_id, timestamp, id) index, keyset-paginated
+  reads of the most recent window and of an older page
+
+For each case it prints the EXPLAIN (ANALYZE, BUFFERS) plan and latency percentiles.
+
+Usage:
+    python benchmarks/bench_chat_history.py --dsn postgresql://localhost/postgres --rows 1000000
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+import psycopg2
+
+SCHEMA = "bench_chat_history"
+
+OLD_INDEXES = [
+    f"CREATE INDEX ON {SCHEMA}.chat_messages(user_email)",
+    f"CREATE INDEX ON {SCHEMA}.chat_messages(chat_id)",
+    f"CREATE INDEX ON {SCHEMA}.chat_messages(timestamp)",
+]
+NEW_INDEXES = [
+    f"CREATE INDEX ON {SCHEMA}.chat_messages(user_email, chat_id, timestamp, id)",
+    f"CREATE INDEX ON {SCHEMA}.chat_messages(timestamp)",
+]
+
+FULL_HISTORY = f"""
+    SELECT * FROM {SCHEMA}.chat_messages
+    WHERE user_email = %(user_email)s AND chat_id = %(chat_id)s
+    ORDER BY timestamp
+"""
+RECENT_WINDOW = f"""
+    SELECT * FROM {SCHEMA}.chat_messages
+    WHERE user_email = %(user_email)s AND chat_id = %(chat_id)s
+    ORDER BY timestamp DESC, id DESC
+    LIMIT %(limit)s
+"""
+OLDER_PAGE = f"""
+    SELECT * FROM {SCHEMA}.chat_messages
+    WHERE user_email = %(user_email)s AND chat_id = %(chat_id)s
+      -- same expansion the app sends through PostgREST (see _keyset_filter)
+      AND (timestamp < %(ts)s OR (timestamp = %(ts)s AND id < %(id)s))
+    ORDER BY timestamp DESC, id DESC
+    LIMIT %(limit)s
+"""
+
+
+def seed(cur, rows: int, users: int, chats_per_user: int):
+    print(f"Seeding {rows:,} messages ({users:,} users x {chats_per_user} chats)...")
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {SCHEMA}")
+    cur.execute(f"""
+        CREATE TABLE {SCHEMA}.chat_messages (
+            id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            user_email TEXT NOT NULL,
+            chat_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            metadata JSONB
+        )
+    """)
+    # Messages of one chat are spread over time and interleaved with other users,
+    # like real traffic, so rows of a chat do not sit next to each other on disk
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.chat_messages (user_email, chat_id, role, content, timestamp)
+        SELECT
+            'user' || (i %% %(users)s) || '@example.com',
+            'chat_' || ((i / %(users)s) %% %(chats)s),
+            CASE WHEN i %% 2 = 0 THEN 'user' ELSE 'assistant' END,
+            repeat('lorem ipsum ', 20),
+            NOW() - (%(rows)s - i) * INTERVAL '1 second'
+        FROM generate_series(1, %(rows)s) AS i
+    """, {"users": users, "chats": chats_per_user, "rows": rows})
+    cur.execute(f"ANALYZE {SCHEMA}.chat_messages")
+
+
+def set_indexes(cur, statements):
+    cur.execute("""
+        SELECT indexname FROM pg_indexes
+        WHERE schemaname = %s AND indexname NOT LIKE '%%_pkey'
+    """, (SCHEMA,))
+    for (name,) in cur.fetchall():
+        cur.execute(f"DROP INDEX {SCHEMA}.{name}")
+    for statement in statements:
+        cur.execute(statement)
+    cur.execute(f"ANALYZE {SCHEMA}.chat_messages")
+
+
+def explain(cur, sql: str, params: dict):
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS) " + sql, params)
+    return "\n".join("    " + row[0] for row in cur.fetchall())
+
+
+def time_query(cur, sql: str, param_sets, repeat: int):
+    latencies = []
+    for _ in range(repeat):
+        for params in param_sets:
+            start = time.perf_counter()
+            cur.execute(sql, params)
+            cur.fetchall()
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+        "mean_ms": statistics.fmean(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default="postgresql://localhost/postgres")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--chats-per-user", type=int, default=5)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--samples", type=int, default=50, help="distinct chats queried per case")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema afterwards")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    seed(cur, args.rows, args.users, args.chats_per_user)
+
+    rng = random.Random(0)
+    chats = [
+        {"user_email": f"user{rng.randrange(args.users)}@example.com",
+         "chat_id": f"chat_{rng.randrange(args.chats_per_user)}",
+         "limit": args.page_size}
+        for _ in range(args.samples)
+    ]
+    # Cursor for the older-page query: the oldest message of each chat's recent window
+    older = []
+    for params in chats:
+        cur.execute(RECENT_WINDOW, params)
+        window = cur.fetchall()
+        if window:
+            oldest = window[-1]
+            older.append(dict(params, ts=oldest[5], id=oldest[0]))
+
+    cases = [
+        ("old indexes / full history", OLD_INDEXES, FULL_HISTORY, chats),
+        ("new index / full history", NEW_INDEXES, FULL_HISTORY, chats),
+        ("new index / recent window (keyset)", NEW_INDEXES, RECENT_WINDOW, chats),
+        ("new index / older page (keyset)", NEW_INDEXES, OLDER_PAGE, older),
+    ]
+
+    results = []
+    current_indexes = None
+    for name, indexes, sql, param_sets in cases:
+        if indexes is not current_indexes:
+            set_indexes(cur, indexes)
+            current_indexes = indexes
+        print(f"\n=== {name} ===")
+        print(explain(cur, sql, param_sets[0]))
+        stats = time_query(cur, sql, param_sets, args.repeat)
+        results.append((name, stats))
+
+    print(f"\n{'case':<40} {'p50 ms':>10} {'p95 ms':>10} {'mean ms':>10}")
+    for name, stats in results:
+        print(f"{name:<40} {stats['p50_ms']:>10.2f} {stats['p95_ms']:>10.2f} {stats['mean_ms']:>10.2f}")
+
+    if not args.keep:
+        cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
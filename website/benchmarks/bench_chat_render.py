@@ -0,0 +1,105 @@
+"""
+Benchmark: chat page render time per rerun for long chats
+
+Runs the message-rendering part of pages/2_Chat.py under Streamlit's AppTest
+harness (real script reruns, element serialization included) on a synthetic
+chat, comparing:
+
+- full:     the original loop, one st.markdown per message with the timestamp
+            re-parsed on every rerun
+- windowed: utils/chat_render.render_messages, the latest CHAT_WINDOW_SIZE
+            messages with HTML cached by message id
+
+The first rerun is cold (nothing cached yet); later reruns are what every
+keystroke, button press or sent message costs.
+
+Usage (from website/):
+    python benchmarks/bench_chat_render.py --messages 1000
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from streamlit.testing.v1 import AppTest
+
+WEBSITE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, WEBSITE_DIR)
+
+
+def full_script():
+    from datetime import datetime
+    import streamlit as st
+    from utils.chat_render import message_html
+
+    for msg in st.session_state.messages:
+        ts = msg.get("timestamp", "")
+        time_str = ""
+        if ts:
+            try:
+                time_str = datetime.fromisoformat(ts).strftime("%I:%M %p")
+            except Exception:
+                pass
+        st.markdown(message_html(msg["role"], msg["content"], time_str), unsafe_allow_html=True)
+
+
+def windowed_script():
+    import streamlit as st
+    from utils.chat_render import render_messages
+
+    render_messages(st.session_state.messages)
+
+
+def make_chat(count: int):
+    start = datetime(2026, 1, 1, 9, 0)
+    reply = ("That sounds really hard, and it makes sense that you feel this way. "
+             "Could you tell me a little more about what happens when the worry starts? ") * 3
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": f"Message {i}: I keep worrying about exams." if i % 2 == 0 else reply,
+            "timestamp": (start + timedelta(seconds=30 * i)).isoformat(),
+        }
+        for i in range(count)
+    ]
+
+
+def measure(script, messages, reruns: int):
+    at = AppTest.from_function(script, default_timeout=120)
+    at.session_state.messages = messages
+    at.session_state.chat_id = "bench"
+    timings = []
+    for _ in range(reruns + 1):
+        start = time.perf_counter()
+        at.run()
+        timings.append(time.perf_counter() - start)
+    assert not at.exception, at.exception
+    return timings[0], timings[1:], len(at.markdown)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--reruns", type=int, default=10)
+    args = parser.parse_args()
+
+    os.chdir(WEBSITE_DIR)
+    messages = make_chat(args.messages)
+
+    print(f"{args.messages}-message chat, {args.reruns} warm reruns")
+    print(f"{'renderer':<10} {'elements':>9} {'cold ms':>9} {'rerun p50 ms':>13} {'rerun max ms':>13}")
+    results = {}
+    for name, script in [("full", full_script), ("windowed", windowed_script)]:
+        cold, warm, elements = measure(script, messages, args.reruns)
+        results[name] = statistics.median(warm)
+        print(f"{name:<10} {elements:>9} {cold * 1000:>9.1f} {results[name] * 1000:>13.1f} {max(warm) * 1000:>13.1f}")
+    print(f"\nwindowed rerun speedup: {results['full'] / results['windowed']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark: CPU backend latency and throughput per weight quantization and thread count
+
+Loads a small stand-in model through the same loader the app uses for
+backend = "cpu" (utils/backends.py), then for each quantization and
+thread count measures:
+
+- prefill: time to first token for a prompt of --prompt-tokens tokens
+- decode:  tokens/sec for --new-tokens greedy tokens after the first
+- batch:   generated tokens/sec for --batch-size prompts in one generate()
+
+Usage (from website/):
+    python benchmarks/bench_cpu_backend.py --model Qwen/Qwen2.5-0.5B-Instruct --threads 1,2,4
+"""
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.backends import load_cpu  # noqa: E402
+
+
+def model_bytes(model) -> int:
+    # Serialized size also counts packed int8/int4 weights, which parameters() does not
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def make_prompt(tokenizer, tokens: int, batch_size: int):
+    text = "I have been feeling anxious before exams and I can't sleep well. " * (tokens // 8 + 1)
+    ids = tokenizer(text, return_tensors="pt")["input_ids"][:, :tokens]
+    return {"input_ids": ids.repeat(batch_size, 1), "attention_mask": torch.ones(batch_size, ids.shape[1], dtype=torch.long)}
+
+
+def measure(model, tokenizer, prompt_tokens: int, new_tokens: int, batch_size: int, repeat: int) -> dict:
+    single = make_prompt(tokenizer, prompt_tokens, 1)
+    batch = make_prompt(tokenizer, prompt_tokens, batch_size)
+    greedy = {"do_sample": False, "pad_token_id": tokenizer.pad_token_id}
+
+    prefill, decode, batch_rates = [], [], []
+    with torch.no_grad():
+        model.generate(**single, max_new_tokens=2, **greedy)  # warm-up
+        for _ in range(repeat):
+            start = time.perf_counter()
+            model.generate(**single, max_new_tokens=1, min_new_tokens=1, **greedy)
+            ttft = time.perf_counter() - start
+            prefill.append(ttft)
+
+            start = time.perf_counter()
+            model.generate(**single, max_new_tokens=new_tokens, min_new_tokens=new_tokens, **greedy)
+            total = time.perf_counter() - start
+            decode.append((new_tokens - 1) / max(total - ttft, 1e-9))
+
+            start = time.perf_counter()
+            model.generate(**batch, max_new_tokens=new_tokens, min_new_tokens=new_tokens, **greedy)
+            batch_rates.append(batch_size * new_tokens / (time.perf_counter() - start))
+
+    return {
+        "ttft_ms": statistics.median(prefill) * 1000,
+        "decode_tps": statistics.median(decode),
+        "batch_tps": statistics.median(batch_rates),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="Qwen/Qwen2.5-0.5B-Instruct", help="hub id or local path of the stand-in model")
+    parser.add_argument("--adapter", default="", help="optional LoRA adapter, merged before quantizing")
+    parser.add_argument("--quantization", default="none,int8", help="comma-separated: none, int8, int4")
+    parser.add_argument("--threads", default=str(torch.get_num_threads()), help="comma-separated thread counts")
+    parser.add_argument("--prompt-tokens", type=int, default=256)
+    parser.add_argument("--new-tokens", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    threads = [int(t) for t in args.threads.split(",")]
+    print(f"{'quant':<6} {'threads':>7} {'size MB':>8} {'load s':>7} {'ttft ms':>8} {'decode tok/s':>12} {'batch tok/s':>11}")
+    for quantization in args.quantization.split(","):
+        config = {
+            "base_model": args.model,
+            "adapter": args.adapter,
+            "cpu_quantization": quantization,
+            "cpu_threads": threads[0],
+        }
+        start = time.perf_counter()
+        model, tokenizer = load_cpu(config)
+        load_seconds = time.perf_counter() - start
+        size_mb = model_bytes(model) / 1024 ** 2
+
+        for n in threads:
+            torch.set_num_threads(n)
+            r = measure(model, tokenizer, args.prompt_tokens, args.new_tokens, args.batch_size, args.repeat)
+            print(f"{quantization:<6} {n:>7} {size_mb:>8.1f} {load_seconds:>7.1f} {r['ttft_ms']:>8.1f} "
+                  f"{r['decode_tps']:>12.1f} {r['batch_tps']:>11.1f}")
+        del model
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Benchmark: chat_messages write throughput under the last_login trigger variants
+
+Compares, on a scratch schema in a local Postgres:
+
+- none:      no last_login tracking (upper bound)
+- per_row:   the original FOR EACH ROW trigger (one UPDATE users per message)
+- throttled: the FOR EACH STATEMENT trigger from migrations/003_last_login_throttle.sql
+             (at most one UPDATE per user per interval)
+
+Several client threads insert messages concurrently for a small set of active
+users, which is where the per-row trigger contends on the users rows. Both
+single-row inserts and multi-row (bulk) inserts are measured.
+
+Usage:
+    python benchmarks/bench_last_login.py --dsn postgresql://localhost/postgres
+"""
+
+import argparse
+import statistics
+import threading
+import time
+
+import psycopg2
+
+SCHEMA = "bench_last_login"
+
+PER_ROW = f"""
+CREATE FUNCTION {SCHEMA}.update_last_login() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE {SCHEMA}.users SET last_login = NOW() WHERE email = NEW.user_email;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER update_last_login_trigger
+    AFTER INSERT ON {SCHEMA}.chat_messages
+    FOR EACH ROW EXECUTE FUNCTION {SCHEMA}.update_last_login();
+"""
+
+THROTTLED = f"""
+CREATE FUNCTION {SCHEMA}.update_last_login() RETURNS TRIGGER AS $$
+DECLARE
+    min_interval INTERVAL := COALESCE(
+        NULLIF(current_setting('psychai.last_login_interval', true), '')::INTERVAL,
+        INTERVAL '5 minutes'
+    );
+BEGIN
+    UPDATE {SCHEMA}.users u
+    SET last_login = NOW()
+    FROM (SELECT DISTINCT user_email FROM new_rows) n
+    WHERE u.email = n.user_email
+      AND (u.last_login IS NULL OR u.last_login < NOW() - min_interval);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER update_last_login_trigger
+    AFTER INSERT ON {SCHEMA}.chat_messages
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION {SCHEMA}.update_last_login();
+"""
+
+MODES = {"none": "", "per_row": PER_ROW, "throttled": THROTTLED}
+
+
+def setup(dsn: str, mode: str, users: int):
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {SCHEMA}")
+    cur.execute(f"""
+        CREATE TABLE {SCHEMA}.users (
+            email TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            last_login TIMESTAMPTZ
+        )
+    """)
+    cur.execute(f"""
+        CREATE TABLE {SCHEMA}.chat_messages (
+            id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+            user_email TEXT NOT NULL REFERENCES {SCHEMA}.users(email) ON DELETE CASCADE,
+            chat_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+    cur.execute(f"CREATE INDEX ON {SCHEMA}.chat_messages(user_email, chat_id, timestamp, id)")
+    cur.execute(
+        f"INSERT INTO {SCHEMA}.users (email, name) "
+        f"SELECT 'user' || i || '@example.com', 'User ' || i FROM generate_series(0, %s) AS i",
+        (users - 1,),
+    )
+    if MODES[mode]:
+        cur.execute(MODES[mode])
+    conn.close()
+
+
+def worker(dsn: str, worker_id: int, users: int, statements: int, rows_per_statement: int,
+           latencies: list, lock: threading.Lock):
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    email = f"user{worker_id % users}@example.com"
+    values = ",".join(["(%s, %s, 'user', 'hello there')"] * rows_per_statement)
+    params = [email, f"chat_{worker_id}"] * rows_per_statement
+
+    local = []
+    for _ in range(statements):
+        start = time.perf_counter()
+        cur.execute(f"INSERT INTO {SCHEMA}.chat_messages (user_email, chat_id, role, content) VALUES {values}", params)
+        local.append((time.perf_counter() - start) * 1000)
+    conn.close()
+
+    with lock:
+        latencies.extend(local)
+
+
+def run(dsn: str, mode: str, threads: int, users: int, statements: int, rows_per_statement: int) -> dict:
+    setup(dsn, mode, users)
+    latencies, lock = [], threading.Lock()
+    pool = [
+        threading.Thread(target=worker, args=(dsn, i, users, statements, rows_per_statement, latencies, lock))
+        for i in range(threads)
+    ]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    rows = threads * statements * rows_per_statement
+    return {
+        "rows_per_sec": rows / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))],
+        "p99_ms": latencies[int(0.99 * (len(latencies) - 1))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default="postgresql://localhost/postgres")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--users", type=int, default=4, help="active users shared by the threads")
+    parser.add_argument("--statements", type=int, default=500, help="INSERT statements per thread")
+    parser.add_argument("--bulk-rows", type=int, default=20, help="rows per statement in the bulk run")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema afterwards")
+    args = parser.parse_args()
+
+    print(f"{args.threads} threads, {args.users} active users\n")
+    print(f"{'mode':<12} {'rows/stmt':>9} {'rows/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for rows_per_statement in (1, args.bulk_rows):
+        statements = max(1, args.statements // rows_per_statement)
+        for mode in MODES:
+            r = run(args.dsn, mode, args.threads, args.users, statements, rows_per_statement)
+            print(f"{mode:<12} {rows_per_statement:>9} {r['rows_per_sec']:>10.0f} "
+                  f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+    if not args.keep:
+        conn = psycopg2.connect(args.dsn)
+        conn.autocommit = True
+        conn.cursor().execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
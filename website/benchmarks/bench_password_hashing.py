@@ -0,0 +1,117 @@
+"""
+Benchmark: login throughput and tail latency under concurrent sign-ins
+
+Simulates a burst of sign-ins, each on its own thread like Streamlit script
+runs, and compares:
+
+- inline:  the original hash on the calling thread (PBKDF2-SHA256, 100,000
+           iterations), every login hashing at once
+- pool:    utils/passwords.PasswordHasher, hashing on a bounded worker pool,
+           for each algorithm/cost setting
+
+Reports logins/sec, logins/sec per core, p50/p95/p99 login latency and the
+worst delay seen by a heartbeat thread standing in for other sessions' reruns.
+
+Usage (from website/):
+    python benchmarks/bench_password_hashing.py --logins 64 --concurrency 32
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.passwords import PasswordHasher, _pbkdf2, _verify, get_password_config  # noqa: E402
+
+PASSWORD = "correct horse battery staple"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def run(verify, logins: int, concurrency: int):
+    """Run ``logins`` calls of ``verify`` from ``concurrency`` threads at once"""
+    latencies, lock = [], threading.Lock()
+    pending = list(range(logins))
+    start_gate = threading.Event()
+
+    def client():
+        start_gate.wait()
+        while True:
+            with lock:
+                if not pending:
+                    return
+                pending.pop()
+            start = time.perf_counter()
+            assert verify()
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    # Heartbeat: a tiny Python task every 10 ms, like another user's rerun
+    stop, lag = threading.Event(), [0.0]
+
+    def heartbeat():
+        while not stop.is_set():
+            before = time.perf_counter()
+            time.sleep(0.01)
+            lag[0] = max(lag[0], time.perf_counter() - before - 0.01)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    beat = threading.Thread(target=heartbeat)
+    beat.start()
+    for t in threads:
+        t.start()
+    start = time.perf_counter()
+    start_gate.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    beat.join()
+    return latencies, elapsed, lag[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32, help="simultaneous sign-in threads")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="hashing pool size")
+    parser.add_argument("--scrypt-n", type=int, default=2 ** 14)
+    parser.add_argument("--pbkdf2-iterations", type=int, default=600000)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    config = get_password_config()
+    config.update(workers=args.workers, max_pending=max(args.concurrency, 1), timeout_seconds=600,
+                  scrypt_n=args.scrypt_n, pbkdf2_iterations=args.pbkdf2_iterations)
+
+    salt = "0" * 64
+    legacy_hash = _pbkdf2(PASSWORD, salt, 100000)
+    cases = [("inline pbkdf2 100k", lambda: _verify(PASSWORD, legacy_hash, salt))]
+    for algorithm, label in [("pbkdf2_sha256", f"pool pbkdf2 {args.pbkdf2_iterations // 1000}k"),
+                             ("scrypt", f"pool scrypt n=2^{args.scrypt_n.bit_length() - 1}")]:
+        hasher = PasswordHasher(dict(config, algorithm=algorithm))
+        stored, _ = hasher.hash(PASSWORD)
+        cases.append((label, lambda h=hasher, s=stored: h.verify(PASSWORD, s)))
+    pool_legacy = PasswordHasher(config)
+    cases.insert(1, ("pool pbkdf2 100k", lambda: pool_legacy.verify(PASSWORD, legacy_hash, salt)))
+
+    print(f"{args.logins} logins from {args.concurrency} threads, {args.workers} hash workers, {cores} cores")
+    print(f"{'mode':<22} {'logins/s':>9} {'per core':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'lag ms':>7}")
+    for label, verify in cases:
+        verify()  # warm-up
+        latencies, elapsed, lag = run(verify, args.logins, args.concurrency)
+        rate = len(latencies) / elapsed
+        print(f"{label:<22} {rate:>9.1f} {rate / cores:>9.1f} "
+              f"{percentile(latencies, 50) * 1000:>8.0f} {percentile(latencies, 95) * 1000:>8.0f} "
+              f"{percentile(latencies, 99) * 1000:>8.0f} {lag * 1000:>7.1f}")
+    print("\nlatency includes queueing; 'lag' is the worst extra delay of a 10 ms heartbeat thread")
+
+
+if __name__ == "__main__":
+    main()
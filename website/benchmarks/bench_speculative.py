@@ -0,0 +1,96 @@
+"""
+Benchmark: speculative decoding vs plain greedy decoding
+
+Runs the same prompts through the target model's generate() and through
+SpeculativeDecoder (utils/speculative.py) with a draft model, for several
+draft lengths. Reports decode tokens/sec, acceptance rate, tokens per target
+forward pass and whether the greedy outputs match token for token.
+
+Works on CPU with small stand-ins, e.g. Qwen/Qwen3-0.6B drafting for
+Qwen/Qwen3-1.7B, or the same pair the app uses on a GPU.
+
+Usage (from website/):
+    python benchmarks/bench_speculative.py --target Qwen/Qwen3-1.7B --draft Qwen/Qwen3-0.6B
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.inference import SYSTEM_PROMPT  # noqa: E402
+from utils.speculative import SpeculativeDecoder  # noqa: E402
+
+PROMPTS = [
+    "I've been feeling really anxious about school lately.",
+    "My parents keep fighting and I don't know what to do.",
+    "I can't sleep before exams, my mind just keeps racing.",
+    "I feel like none of my friends actually like me.",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="Qwen/Qwen3-1.7B")
+    parser.add_argument("--draft", default="Qwen/Qwen3-0.6B")
+    parser.add_argument("--num-draft-tokens", default="2,4,6", help="comma-separated draft lengths")
+    parser.add_argument("--new-tokens", type=int, default=128)
+    parser.add_argument("--dtype", default="float32", choices=["float32", "bfloat16"])
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    dtype = getattr(torch, args.dtype)
+    tokenizer = AutoTokenizer.from_pretrained(args.target)
+    target = AutoModelForCausalLM.from_pretrained(args.target, torch_dtype=dtype).to(args.device).eval()
+    draft = AutoModelForCausalLM.from_pretrained(args.draft, torch_dtype=dtype).to(args.device).eval()
+    eos_ids = {tokenizer.eos_token_id}
+
+    prompts = []
+    for text in PROMPTS:
+        chat = [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": text}]
+        rendered = tokenizer.apply_chat_template(chat, tokenize=False, add_generation_prompt=True, enable_thinking=False)
+        prompts.append(tokenizer(rendered, return_tensors="pt")["input_ids"].to(args.device))
+
+    def timed(fn):
+        start = time.perf_counter()
+        result = fn()
+        return result, time.perf_counter() - start
+
+    # Plain greedy decoding is the reference for speed and output
+    baseline, baseline_rates = [], []
+    with torch.no_grad():
+        target.generate(prompts[0], max_new_tokens=4, do_sample=False)  # warm-up
+        for ids in prompts:
+            output, seconds = timed(lambda: target.generate(
+                ids, max_new_tokens=args.new_tokens, do_sample=False, pad_token_id=tokenizer.pad_token_id
+            ))
+            tokens = output[0, ids.shape[1]:].tolist()
+            baseline.append(tokens)
+            baseline_rates.append(len(tokens) / seconds)
+
+    print(f"{'mode':<14} {'tok/s':>8} {'speedup':>8} {'accept':>7} {'tok/step':>9} {'matches':>8}")
+    base_rate = statistics.median(baseline_rates)
+    print(f"{'greedy':<14} {base_rate:>8.1f} {1.0:>8.2f} {'-':>7} {'-':>9} {'-':>8}")
+
+    for k in [int(x) for x in args.num_draft_tokens.split(",")]:
+        decoder = SpeculativeDecoder(target, draft, num_draft_tokens=k)
+        rates, accept, per_step, matches = [], [], [], 0
+        for ids, expected in zip(prompts, baseline):
+            (tokens, stats), seconds = timed(lambda: decoder.generate(ids, args.new_tokens, eos_ids))
+            rates.append(len(tokens) / seconds)
+            accept.append(stats["acceptance_rate"] or 0.0)
+            per_step.append(stats["tokens_per_target_step"] or 0.0)
+            matches += tokens == expected
+        rate = statistics.median(rates)
+        print(f"{'draft k=' + str(k):<14} {rate:>8.1f} {rate / base_rate:>8.2f} {statistics.fmean(accept):>7.2f} "
+              f"{statistics.fmean(per_step):>9.2f} {matches:>5}/{len(prompts)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark: cold start and rerun time of each page
+
+Every page is run in a fresh Python process (with Streamlit itself already
+imported, as it is in a running server) under Streamlit's AppTest harness:
+
+- first run: the first script execution in a new server process, i.e.
+             importing the app's modules plus rendering, which is what the
+             first visitor after a (re)start waits for before first paint
+- rerun:     median of later reruns of the same session
+
+It also lists the top-level packages each page pulls in on its first run, and
+the import-time breakdown of the app's utils (utils/profiling.py).
+
+The model is disabled so only app start-up is measured; the chat page is
+signed in by seeding session_state the way login_user does.
+
+Usage (from website/):
+    python benchmarks/bench_startup.py
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+WEBSITE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, WEBSITE_DIR)
+
+PAGES = [
+    ("home", "app.py", False),
+    ("sign in", "pages/1_Authentication.py", False),
+    ("chat", "pages/2_Chat.py", True),
+    ("terms", "pages/3_Terms_of_Service.py", False),
+]
+
+CHILD = r"""
+import json, statistics, sys, time
+import streamlit
+from streamlit.testing.v1 import AppTest
+
+page, signed_in, reruns = sys.argv[1], sys.argv[2] == "1", int(sys.argv[3])
+before = set(sys.modules)
+at = AppTest.from_file(page, default_timeout=120)
+if signed_in:
+    at.session_state["authenticated"] = True
+    at.session_state["user_email"] = "bench@example.com"
+    at.session_state["user_name"] = "Bench"
+    at.session_state["auth_method"] = "custom"
+    at.session_state["session_expires"] = time.time() + 3600
+start = time.perf_counter()
+at.run()
+first = time.perf_counter() - start
+warm = []
+for _ in range(reruns):
+    start = time.perf_counter()
+    at.run()
+    warm.append(time.perf_counter() - start)
+assert not at.exception, at.exception
+loaded = sorted({m.split(".")[0] for m in set(sys.modules) - before if not m.startswith(("_", "utils", "streamlit"))})
+print(json.dumps({"first": first, "rerun": statistics.median(warm), "modules": loaded}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reruns", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3, help="fresh processes per page (median is reported)")
+    args = parser.parse_args()
+
+    env = dict(
+        os.environ,
+        PYTHONPATH=WEBSITE_DIR,
+        PSYCHAI_ENABLED="false",
+        # No secrets.toml needed for the sign-in page's Google button
+        GOOGLE_CLIENT_ID=os.getenv("GOOGLE_CLIENT_ID", "bench"),
+        GOOGLE_REDIRECT_URI=os.getenv("GOOGLE_REDIRECT_URI", "http://localhost:8501"),
+    )
+    os.environ.update(env)
+
+    print(f"{'page':<10} {'first run ms':>13} {'rerun ms':>9}  packages imported on first run")
+    for label, page, signed_in in PAGES:
+        results = []
+        for _ in range(args.repeat):
+            out = subprocess.run(
+                [sys.executable, "-c", CHILD, page, "1" if signed_in else "0", str(args.reruns)],
+                cwd=WEBSITE_DIR, env=env, capture_output=True, text=True,
+            )
+            if out.returncode != 0:
+                raise SystemExit(f"{page} failed:\n{out.stderr[-2000:]}")
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        results.sort(key=lambda r: r["first"])
+        median = results[len(results) // 2]
+        print(f"{label:<10} {median['first'] * 1000:>13.0f} {median['rerun'] * 1000:>9.1f}  "
+              f"{', '.join(median['modules']) or '-'}")
+
+    from utils.profiling import import_breakdown  # noqa: E402
+    for module in ["utils.auth", "utils.chat_handler"]:
+        total, rows = import_breakdown(module, top=6)
+        print(f"\nimport {module}: {total * 1000:.0f} ms")
+        for name, _, cumulative in rows[1:]:
+            print(f"  {name:<36} {cumulative * 1000:>7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
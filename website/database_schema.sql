@@ -1,5 +1,6 @@
 -- PsychAI Database Schema for Supabase (PostgreSQL)
--- Run this in your Supabase SQL Editor to create the tables
+-- Run this in your Supabase SQL Editor to create the tables, then run the
+-- files in migrations/ in order (each is safe to run again)
 
 -- Enable UUID extension (if not already enabled)
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
@@ -29,6 +30,17 @@ CREATE TABLE IF NOT EXISTS chat_messages (
     metadata JSONB  -- For future extensibility (attachments, ratings, etc.)
 );
 
+-- Migration for databases created before incremental saves: the app used to
+-- re-insert the whole chat on every turn. Keep the earliest copy of each message.
+-- Review before running: a message genuinely repeated within a chat is collapsed too.
+-- DELETE FROM chat_messages a
+--     USING chat_messages b
+--     WHERE a.user_email = b.user_email
+--       AND a.chat_id = b.chat_id
+--       AND a.role = b.role
+--       AND a.content = b.content
+--       AND (a.timestamp, a.id) > (b.timestamp, b.id);
+
 -- User activity log (optional, for analytics)
 CREATE TABLE IF NOT EXISTS user_activity (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -40,6 +52,7 @@ CREATE TABLE IF NOT EXISTS user_activity (
 
 -- Indexes for performance
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+-- (migrations/002_chat_history_index.sql replaces the next two with one composite index)
 CREATE INDEX IF NOT EXISTS idx_chat_messages_user_email ON chat_messages(user_email);
 CREATE INDEX IF NOT EXISTS idx_chat_messages_chat_id ON chat_messages(chat_id);
 CREATE INDEX IF NOT EXISTS idx_chat_messages_timestamp ON chat_messages(timestamp);
@@ -94,6 +107,8 @@ CREATE POLICY "Service role can do anything on user_activity"
     USING (auth.role() = 'service_role');
 
 -- Function to update last_login timestamp
+-- (migrations/003_last_login_throttle.sql replaces it with a throttled,
+-- statement-level version)
 CREATE OR REPLACE FUNCTION update_last_login()
 RETURNS TRIGGER AS $$
 BEGIN
@@ -117,9 +132,11 @@ COMMENT ON TABLE user_activity IS 'Logs user activity for analytics and monitori
 
 COMMENT ON COLUMN users.auth_method IS 'Authentication method: custom (email/password) or google (OAuth)';
 COMMENT ON COLUMN chat_messages.chat_id IS 'Groups messages into conversation sessions';
+COMMENT ON COLUMN chat_messages.id IS 'Generated by the app so message writes can be idempotent upserts';
 COMMENT ON COLUMN chat_messages.metadata IS 'Extensible field for future features like message ratings, attachments, etc.';
 
 -- Optional: Create a view for chat statistics
+-- (migrations/001_chats_summary.sql redefines it over the chats summary table)
 CREATE OR REPLACE VIEW chat_statistics AS
 SELECT 
     user_email,
@@ -0,0 +1,108 @@
+-- Migration 001: per-chat summary table
+-- Run after database_schema.sql; safe to run again.
+--
+-- Chat sessions summary: one row per chat, kept in sync with chat_messages by
+-- statement-level triggers, so listing a user's chats is O(chats)
+CREATE TABLE IF NOT EXISTS chats (
+    user_email TEXT NOT NULL REFERENCES users(email) ON DELETE CASCADE,
+    chat_id TEXT NOT NULL,
+    first_timestamp TIMESTAMPTZ NOT NULL,
+    last_timestamp TIMESTAMPTZ NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_email, chat_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_chats_user_last ON chats(user_email, last_timestamp DESC);
+
+ALTER TABLE chats ENABLE ROW LEVEL SECURITY;
+
+-- Users can only read their own chat summaries (rows are written by triggers)
+DROP POLICY IF EXISTS "Users can view own chats" ON chats;
+CREATE POLICY "Users can view own chats"
+    ON chats FOR SELECT
+    USING (auth.email() = user_email);
+
+DROP POLICY IF EXISTS "Service role can do anything on chats" ON chats;
+CREATE POLICY "Service role can do anything on chats"
+    ON chats FOR ALL
+    USING (auth.role() = 'service_role');
+
+-- Keep the chats summary in sync. Statement-level triggers with transition
+-- tables run once per INSERT/DELETE statement, so a bulk insert of N messages
+-- costs one upsert per chat touched, not N. Rows skipped by
+-- ON CONFLICT DO NOTHING are not in new_rows and are not counted.
+CREATE OR REPLACE FUNCTION chats_after_insert()
+RETURNS TRIGGER
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    INSERT INTO chats (user_email, chat_id, first_timestamp, last_timestamp, message_count)
+    SELECT user_email, chat_id, MIN(timestamp), MAX(timestamp), COUNT(*)
+    FROM new_rows
+    GROUP BY user_email, chat_id
+    ON CONFLICT (user_email, chat_id) DO UPDATE
+    SET first_timestamp = LEAST(chats.first_timestamp, EXCLUDED.first_timestamp),
+        last_timestamp = GREATEST(chats.last_timestamp, EXCLUDED.last_timestamp),
+        message_count = chats.message_count + EXCLUDED.message_count;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS chats_after_insert_trigger ON chat_messages;
+CREATE TRIGGER chats_after_insert_trigger
+    AFTER INSERT ON chat_messages
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION chats_after_insert();
+
+-- Deleting messages decrements the counts; chats left empty are removed.
+-- (The app deletes whole chats, so last_timestamp is not recomputed.)
+CREATE OR REPLACE FUNCTION chats_after_delete()
+RETURNS TRIGGER
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    UPDATE chats c
+    SET message_count = c.message_count - d.deleted
+    FROM (
+        SELECT user_email, chat_id, COUNT(*) AS deleted
+        FROM old_rows
+        GROUP BY user_email, chat_id
+    ) d
+    WHERE c.user_email = d.user_email AND c.chat_id = d.chat_id;
+
+    DELETE FROM chats c
+    USING (SELECT DISTINCT user_email, chat_id FROM old_rows) d
+    WHERE c.user_email = d.user_email AND c.chat_id = d.chat_id
+      AND c.message_count <= 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS chats_after_delete_trigger ON chat_messages;
+CREATE TRIGGER chats_after_delete_trigger
+    AFTER DELETE ON chat_messages
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION chats_after_delete();
+
+-- Backfill for databases that already have messages
+INSERT INTO chats (user_email, chat_id, first_timestamp, last_timestamp, message_count)
+SELECT user_email, chat_id, MIN(timestamp), MAX(timestamp), COUNT(*)
+FROM chat_messages
+GROUP BY user_email, chat_id
+ON CONFLICT (user_email, chat_id) DO NOTHING;
+
+COMMENT ON TABLE chats IS 'One row per chat session with last activity and message count, maintained by triggers';
+
+-- Aggregates the chats summary table, so it reads one row per chat instead of every message
+CREATE OR REPLACE VIEW chat_statistics AS
+SELECT 
+    user_email,
+    COUNT(*) as total_chats,
+    SUM(message_count) as total_messages,
+    MAX(last_timestamp) as last_activity
+FROM chats
+GROUP BY user_email;
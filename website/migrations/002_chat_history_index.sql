@@ -0,0 +1,11 @@
+-- Migration 002: composite index for chat history reads
+-- Run after database_schema.sql; safe to run again.
+--
+-- Chat history reads filter on (user_email, chat_id) and page by (timestamp, id);
+-- one composite index serves the filter, the ordering and keyset cursors, and its
+-- user_email prefix also covers per-user lookups and the users FK cascade
+CREATE INDEX IF NOT EXISTS idx_chat_messages_user_chat_ts ON chat_messages(user_email, chat_id, timestamp, id);
+
+-- Superseded by idx_chat_messages_user_chat_ts (fewer indexes = cheaper inserts)
+DROP INDEX IF EXISTS idx_chat_messages_user_email;
+DROP INDEX IF EXISTS idx_chat_messages_chat_id;
@@ -0,0 +1,35 @@
+-- Migration 003: statement-level, throttled last_login trigger
+-- Run after database_schema.sql; safe to run again.
+--
+-- Runs once per INSERT statement and touches each user at most once per
+-- interval (psychai.last_login_interval, default 5 minutes), instead of an
+-- UPDATE users per inserted message. Users already stamped within the interval
+-- don't match the WHERE clause, so their row is neither rewritten nor locked.
+-- Change the interval with e.g.:
+--   ALTER DATABASE postgres SET psychai.last_login_interval = '15 minutes';
+CREATE OR REPLACE FUNCTION update_last_login()
+RETURNS TRIGGER AS $$
+DECLARE
+    min_interval INTERVAL := COALESCE(
+        NULLIF(current_setting('psychai.last_login_interval', true), '')::INTERVAL,
+        INTERVAL '5 minutes'
+    );
+BEGIN
+    UPDATE users u
+    SET last_login = NOW()
+    FROM (SELECT DISTINCT user_email FROM new_rows) n
+    WHERE u.email = n.user_email
+      AND (u.last_login IS NULL OR u.last_login < NOW() - min_interval);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Replaces the FOR EACH ROW trigger created by database_schema.sql
+DROP TRIGGER IF EXISTS update_last_login_trigger ON chat_messages;
+CREATE TRIGGER update_last_login_trigger
+    AFTER INSERT ON chat_messages
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION update_last_login();
+
+COMMENT ON COLUMN users.last_login IS 'Last chat activity, accurate to psychai.last_login_interval (default 5 minutes)';
@@ -9,6 +9,7 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from utils.assets import inject_css
 from utils.auth import (
     create_user,
     authenticate_user,
@@ -16,6 +17,7 @@ from utils.auth import (
     check_authentication,
     get_google_oauth_url,
 )
+from utils.profiling import profile_rerun
 
 st.set_page_config(
     page_title="Sign in — PsychAI",
@@ -23,126 +25,7 @@ st.set_page_config(
     layout="centered",
 )
 
-st.markdown("""<style>
-@import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700;800&display=swap');
-
-.stApp { font-family: 'Inter', -apple-system, BlinkMacSystemFont, sans-serif; }
-
-#MainMenu, footer, header { visibility: hidden; }
-.stDeployButton { display: none !important; }
-[data-testid="stSidebar"] { display: none !important; }
-[data-testid="stHeader"] { display: none !important; }
-
-/* mesh background */
-.mesh-wrap {
-    position: fixed; inset: 0; overflow: hidden;
-    z-index: -1; pointer-events: none;
-}
-.mesh-blob {
-    position: absolute; border-radius: 50%;
-    filter: blur(150px); opacity: 0.10;
-}
-.mesh-blob.purple {
-    width: 500px; height: 500px; background: #8b5cf6;
-    top: -15%; right: -10%;
-    animation: d1 18s ease-in-out infinite;
-}
-.mesh-blob.blue {
-    width: 400px; height: 400px; background: #3b82f6;
-    bottom: -10%; left: -8%;
-    animation: d2 22s ease-in-out infinite;
-}
-@keyframes d1 {
-    0%,100% { transform: translate(0,0); }
-    50%     { transform: translate(30px,-40px); }
-}
-@keyframes d2 {
-    0%,100% { transform: translate(0,0); }
-    50%     { transform: translate(-40px,30px); }
-}
-
-/* back link */
-.back-link {
-    display: inline-flex; align-items: center; gap: 0.4rem;
-    color: #71717a; font-size: 0.85rem; text-decoration: none;
-    margin-bottom: 2rem; transition: color 0.2s;
-}
-.back-link:hover { color: #a1a1aa; }
-
-/* center the main content area and constrain width */
-.main .block-container {
-    max-width: 480px !important;
-    margin: 0 auto;
-    padding: 2rem 1.5rem !important;
-}
-.auth-title {
-    font-size: 1.75rem;
-    font-weight: 700;
-    color: #fafafa;
-    text-align: center;
-    margin-bottom: 0.3rem;
-}
-.auth-sub {
-    text-align: center;
-    color: #71717a;
-    font-size: 0.92rem;
-    margin-bottom: 2rem;
-}
-
-/* google button */
-.g-btn {
-    display: flex; align-items: center; justify-content: center;
-    gap: 10px; width: 100%; padding: 0.7rem 1rem;
-    background: rgba(255,255,255,0.05);
-    border: 1px solid rgba(255,255,255,0.1);
-    border-radius: 10px; color: #e4e4e7;
-    font-weight: 500; font-size: 0.9rem;
-    font-family: 'Inter', sans-serif;
-    cursor: pointer; transition: all 0.2s;
-    text-decoration: none !important;
-}
-.g-btn:hover {
-    background: rgba(255,255,255,0.08);
-    border-color: rgba(255,255,255,0.18);
-}
-.g-btn.disabled {
-    opacity: 0.4; cursor: not-allowed;
-    pointer-events: none;
-}
-.g-logo { width: 18px; height: 18px; }
-
-/* divider */
-.or-divider {
-    display: flex; align-items: center;
-    margin: 1.75rem 0; color: #3f3f46;
-    font-size: 0.8rem;
-}
-.or-divider::before, .or-divider::after {
-    content: ''; flex: 1;
-    border-bottom: 1px solid rgba(255,255,255,0.06);
-}
-.or-divider:not(:empty)::before { margin-right: 1rem; }
-.or-divider:not(:empty)::after  { margin-left: 1rem; }
-
-/* streamlit overrides */
-.stButton > button {
-    font-family: 'Inter', sans-serif !important;
-    border-radius: 10px !important;
-    font-weight: 600 !important;
-}
-.stTextInput > div > div > input {
-    border-radius: 10px !important;
-}
-.stTabs [data-baseweb="tab-list"] {
-    gap: 0;
-    justify-content: center;
-}
-.stTabs [data-baseweb="tab"] {
-    font-family: 'Inter', sans-serif;
-    font-weight: 500;
-    padding: 0.6rem 1.5rem;
-}
-</style>""", unsafe_allow_html=True)
+inject_css("auth")
 
 GOOGLE_SVG = """<svg class="g-logo" viewBox="0 0 24 24" xmlns="http://www.w3.org/2000/svg">
     <path d="M22.56 12.25c0-.78-.07-1.53-.2-2.25H12v4.26h5.92c-.26 1.37-1.04 2.53-2.21 3.31v2.77h3.57c2.08-1.92 3.28-4.74 3.28-8.09z" fill="#4285F4"/>
@@ -279,4 +162,5 @@ def _show_signup():
 
 
 if __name__ == "__main__":
-    main()
+    with profile_rerun("sign in"):
+        main()
@@ -3,6 +3,12 @@ Terms of Service page for PsychAI / FrAInd.ly
 """
 
 import streamlit as st
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.assets import inject_css
 
 st.set_page_config(
     page_title="Terms of Service — FrAInd.ly",
@@ -10,42 +16,7 @@ st.set_page_config(
     layout="centered",
 )
 
-st.markdown("""<style>
-@import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
-.stApp { font-family: 'Inter', -apple-system, BlinkMacSystemFont, sans-serif; }
-#MainMenu, footer { visibility: hidden; }
-.stDeployButton { display: none !important; }
-[data-testid="stSidebar"] { display: none !important; }
-[data-testid="stHeader"] { display: none !important; }
-.main .block-container {
-    max-width: 720px !important;
-    margin: 0 auto;
-    padding: 2rem 1.5rem 4rem !important;
-}
-.back-link {
-    display: inline-flex; align-items: center; gap: 0.4rem;
-    color: #71717a; font-size: 0.85rem; text-decoration: none;
-    margin-bottom: 1.5rem; transition: color 0.2s;
-}
-.back-link:hover { color: #a1a1aa; }
-.tos-title {
-    font-size: 2rem; font-weight: 700; color: #fafafa;
-    margin-bottom: 0.25rem;
-}
-.tos-updated {
-    font-size: 0.82rem; color: #52525b; margin-bottom: 2.5rem;
-}
-.tos h3 {
-    font-size: 1.1rem; font-weight: 600; color: #e4e4e7;
-    margin: 2rem 0 0.5rem;
-}
-.tos p, .tos li {
-    font-size: 0.92rem; color: #a1a1aa; line-height: 1.75;
-}
-.tos ul { padding-left: 1.25rem; }
-.tos li { margin-bottom: 0.35rem; }
-.tos strong { color: #d4d4d8; }
-</style>""", unsafe_allow_html=True)
+inject_css("terms")
 
 st.markdown("""
     <a href="/" target="_self" class="back-link">
@@ -0,0 +1,34 @@
+"""
+Shared fixtures for the website tests
+"""
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def tiny_llama():
+    """
+    Factory for tiny randomly initialised Llama models (CPU, milliseconds per step)
+
+    No EOS token is configured, so generate() always runs to max_new_tokens.
+    """
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+
+    def build(seed: int = 0):
+        torch.manual_seed(seed)
+        config = transformers.LlamaConfig(
+            vocab_size=64,
+            hidden_size=32,
+            intermediate_size=64,
+            num_hidden_layers=2,
+            num_attention_heads=4,
+            num_key_value_heads=2,
+            max_position_embeddings=256,
+            bos_token_id=None,
+            eos_token_id=None,
+            pad_token_id=None,
+        )
+        return transformers.LlamaForCausalLM(config).eval()
+
+    return build
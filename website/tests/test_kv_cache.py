@@ -0,0 +1,137 @@
+"""
+Tests for the prefix (KV) cache: reuse must never change the output
+
+Run from website/:
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from utils.kv_cache import PrefixCache, cache_nbytes  # noqa: E402
+
+MAX_NEW_TOKENS = 16
+
+
+class FakeCache:
+    """Stand-in holding ``nbytes`` of key tensors, for the memory accounting tests"""
+
+    def __init__(self, nbytes, tokens=2):
+        self.key_cache = [torch.zeros(nbytes, dtype=torch.uint8)]
+        self.value_cache = []
+        self.tokens = tokens
+
+    def get_seq_length(self):
+        return self.tokens
+
+
+def generate(model, input_ids, prefix_cache=None, key=None):
+    """Greedy reply the way InferenceEngine uses the prefix cache"""
+    from transformers import DynamicCache
+
+    kwargs = {}
+    if prefix_cache is not None:
+        cache, _ = prefix_cache.take(key, input_ids[0].tolist())
+        kwargs["past_key_values"] = cache if cache is not None else DynamicCache()
+    output = model.generate(input_ids, max_new_tokens=MAX_NEW_TOKENS, do_sample=False, **kwargs)
+    sequence = output[0].tolist()
+    if prefix_cache is not None:
+        cache = kwargs["past_key_values"]
+        prefix_cache.put(key, sequence[:cache.get_seq_length()], cache)
+    return sequence[input_ids.shape[1]:]
+
+
+def test_cached_turns_match_uncached_output(tiny_llama):
+    from transformers import DynamicCache
+
+    model = tiny_llama(0)
+    torch.manual_seed(2)
+    system = torch.randint(0, 64, (1, 10))
+    prefix_cache = PrefixCache(max_bytes=10 ** 8)
+    system_cache = DynamicCache()
+    with torch.no_grad():
+        model(system, past_key_values=system_cache, use_cache=True)
+    prefix_cache.set_system_prefix(system[0].tolist(), system_cache)
+
+    first = torch.cat([system, torch.randint(0, 64, (1, 6))], dim=1)
+    reply = generate(model, first, prefix_cache, "chat")
+    assert reply == generate(model, first)
+
+    # The next turn extends the conversation, so it reuses the chat's own entry
+    second = torch.cat([first, torch.tensor([reply]), torch.randint(0, 64, (1, 5))], dim=1)
+    assert generate(model, second, prefix_cache, "chat") == generate(model, second)
+
+    # A new chat starts from a copy of the system prefix, which stays intact
+    other = torch.cat([system, torch.randint(0, 64, (1, 7))], dim=1)
+    assert generate(model, other, prefix_cache, "other") == generate(model, other)
+    assert generate(model, other, prefix_cache, "third") == generate(model, other)
+
+    metrics = prefix_cache.metrics()
+    assert metrics["chat_hits"] == 1 and metrics["system_hits"] == 3 and metrics["misses"] == 0
+
+
+def test_diverging_prompt_only_reuses_the_common_prefix(tiny_llama):
+    model = tiny_llama(0)
+    torch.manual_seed(3)
+    prompt = torch.randint(0, 64, (1, 12))
+    prefix_cache = PrefixCache(max_bytes=10 ** 8)
+    generate(model, prompt, prefix_cache, "chat")
+
+    edited = prompt.clone()
+    edited[0, 6:] = (edited[0, 6:] + 1) % 64
+    assert generate(model, edited, prefix_cache, "chat") == generate(model, edited)
+    assert prefix_cache.metrics()["prefill_tokens_saved"] == 6
+
+
+def test_least_recently_used_chats_are_evicted_by_bytes():
+    prefix_cache = PrefixCache(max_bytes=250)
+    prefix_cache.put("a", [1, 2], FakeCache(100))
+    prefix_cache.put("b", [1, 2], FakeCache(100))
+    # Putting "a" back after a turn makes it the most recently used
+    cache, _ = prefix_cache.take("a", [1, 2, 3])
+    prefix_cache.put("a", [1, 2], cache)
+    prefix_cache.put("c", [1, 2], FakeCache(100))
+
+    assert set(prefix_cache._entries) == {"a", "c"}
+    metrics = prefix_cache.metrics()
+    assert metrics["evictions"] == 1 and metrics["bytes"] == 200
+
+
+def test_entry_larger_than_the_budget_is_not_stored():
+    prefix_cache = PrefixCache(max_bytes=250)
+    prefix_cache.put("a", [1, 2], FakeCache(100))
+    prefix_cache.put("huge", [1, 2], FakeCache(300))
+
+    assert set(prefix_cache._entries) == {"a"}
+    assert prefix_cache.metrics()["bytes"] == 100
+
+
+def test_pinned_system_entry_is_never_evicted(tiny_llama):
+    from transformers import DynamicCache
+
+    model = tiny_llama(0)
+    system = torch.arange(8).unsqueeze(0)
+    system_cache = DynamicCache()
+    with torch.no_grad():
+        model(system, past_key_values=system_cache, use_cache=True)
+
+    prefix_cache = PrefixCache(max_bytes=cache_nbytes(system_cache) + 150)
+    prefix_cache.set_system_prefix(system[0].tolist(), system_cache)
+    for key in "abcde":
+        prefix_cache.put(key, [1, 2], FakeCache(100))
+    # Only room for one chat next to the pinned entry
+    assert list(prefix_cache._entries) == ["e"]
+    # Chats may use at most the budget minus the pinned bytes
+    prefix_cache.put("f", [1, 2], FakeCache(200))
+    assert "f" not in prefix_cache._entries
+
+    cache, cached_tokens = prefix_cache.take("new chat", list(range(12)))
+    assert cached_tokens == 8 and cache is not system_cache
+    assert prefix_cache._system.cache.get_seq_length() == 8
@@ -0,0 +1,134 @@
+"""
+Tests for the crisis heuristics and the response cache's bypass and matching rules
+
+Run from website/:
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.safety import looks_like_crisis  # noqa: E402
+
+# Phrasings that must never be answered from the response cache
+CRISIS_MESSAGES = [
+    "I want to die",
+    "i wanna die",
+    "honestly i just wanna die lol",
+    "I'm gonna kill myself",
+    "thinking about suicide",
+    "i feel suicidal",
+    "kms",
+    "ugh kms",
+    "I want to unalive myself",
+    "I wish I was dead",
+    "i wish i were dead",
+    "I wish I'd never been born",
+    "I wish I could disappear",
+    "I don't want to be here anymore",
+    "i dont want to be here any more",
+    "I don’t want to live",
+    "I no longer want to exist",
+    "I don't want to wake up tomorrow",
+    "Everyone would be better off without me",
+    "they'd be better off if I wasn't around",
+    "better off dead",
+    "I can't go on like this",
+    "I can't take it anymore",
+    "I'm going to end it all",
+    "I want to end my life",
+    "thinking of taking my own life",
+    "there's no point in living",
+    "I've been cutting myself",
+    "I hurt myself again",
+    "I self-harm",
+    "I took too many pills, an overdose",
+    "my stepdad hits me",
+    "my uncle touched me",
+    "I am being abused at home",
+    "I don't feel safe at home",
+    "I'm going to run away",
+]
+
+# Everyday openings that should stay cacheable
+ORDINARY_MESSAGES = [
+    "How do I help my child with exam stress?",
+    "My son has trouble sleeping",
+    "My daughter is being bullied at school, what should I do?",
+    "How can I stop procrastinating?",
+    "I feel anxious before presentations",
+    "",
+]
+
+
+@pytest.mark.parametrize("message", CRISIS_MESSAGES)
+def test_crisis_phrasings_are_caught(message):
+    assert looks_like_crisis(message)
+
+
+@pytest.mark.parametrize("message", ORDINARY_MESSAGES)
+def test_ordinary_messages_are_not_flagged(message):
+    assert not looks_like_crisis(message)
+
+
+def test_short_messages_are_not_cached():
+    pytest.importorskip("streamlit")
+    from utils.response_cache import ResponseCache
+
+    cache = ResponseCache(min_length=10)
+    for message in ("hi", "hello!!", "???", "hey, um"):
+        cache.put(message, "Hello! How can I help?")
+        assert cache.lookup(message) is None
+    assert cache.metrics()["entries"] == 0
+
+    cache.put("How do I help my child with exam stress?", "Try breaking revision into short sessions.")
+    assert cache.lookup("how do i help my child with exam stress")["response"].startswith("Try")
+
+
+# Close in embedding space to the cached opening, but asking something else
+NEAR_MISSES = [
+    "How do I not help my son with exam stress?",
+    "How do I help my son with exam stress at university?",
+    "How do I help my son with no exam stress?",
+    "How do I help my daughter with exam stress?",
+]
+
+# Same question, different wording details
+PARAPHRASES = [
+    "how do i help my son with exam stress",
+    "How do I help my son with exams stress?",
+    "how do I help my son with exam stres",
+    "Hi, how do I help my son with exam stress please",
+]
+
+
+@pytest.fixture
+def exam_stress_cache():
+    pytest.importorskip("streamlit")
+    from utils.response_cache import ResponseCache
+
+    cache = ResponseCache(threshold=0.85)
+    cache.put("How do I help my son with exam stress?", "Try breaking revision into short sessions.")
+    return cache
+
+
+@pytest.mark.parametrize("message", NEAR_MISSES)
+def test_near_misses_are_not_served_from_the_cache(exam_stress_cache, message):
+    assert exam_stress_cache.lookup(message) is None
+
+
+@pytest.mark.parametrize("message", PARAPHRASES)
+def test_paraphrases_are_served_from_the_cache(exam_stress_cache, message):
+    assert exam_stress_cache.lookup(message)["response"].startswith("Try")
+
+
+def test_near_miss_falls_through_to_a_matching_entry(exam_stress_cache):
+    exam_stress_cache.put("How do I help my son with exam stress at university?", "University is different.")
+
+    hit = exam_stress_cache.lookup("how do i help my son with exam stress at university")
+    assert hit["response"] == "University is different."
+    assert exam_stress_cache.metrics()["near_misses"] == 0
@@ -0,0 +1,77 @@
+"""
+Tests for speculative decoding against a tiny random model
+
+Run from website/:
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from utils.speculative import SpeculativeDecoder  # noqa: E402
+
+MAX_NEW_TOKENS = 24
+
+
+def greedy_reference(model, input_ids):
+    output = model.generate(input_ids, max_new_tokens=MAX_NEW_TOKENS, do_sample=False)
+    return output[0, input_ids.shape[1]:].tolist()
+
+
+@pytest.fixture(scope="module")
+def prompt():
+    torch.manual_seed(1)
+    return torch.randint(0, 64, (1, 12))
+
+
+@pytest.mark.parametrize("num_draft_tokens", [1, 3, 5])
+@pytest.mark.parametrize("draft_seed", [None, 1], ids=["self-draft", "other-draft"])
+def test_greedy_output_matches_generate(tiny_llama, prompt, num_draft_tokens, draft_seed):
+    target = tiny_llama(0)
+    draft = target if draft_seed is None else tiny_llama(draft_seed)
+    decoder = SpeculativeDecoder(target, draft, num_draft_tokens)
+
+    tokens, stats = decoder.generate(prompt, MAX_NEW_TOKENS, eos_ids=set())
+
+    assert tokens == greedy_reference(target, prompt)
+    if draft_seed is None:
+        # A model always agrees with itself
+        assert stats["acceptance_rate"] == 1.0
+    else:
+        assert stats["accepted"] < stats["drafted"]
+
+
+@pytest.mark.parametrize("num_draft_tokens", [1, 3, 5])
+def test_prefilled_cache_gives_the_same_output(tiny_llama, prompt, num_draft_tokens):
+    from transformers import DynamicCache
+
+    target, draft = tiny_llama(0), tiny_llama(1)
+    cached_tokens = 8
+    cache = DynamicCache()
+    with torch.no_grad():
+        target(prompt[:, :cached_tokens], past_key_values=cache, use_cache=True)
+
+    tokens, _ = SpeculativeDecoder(target, draft, num_draft_tokens).generate(
+        prompt, MAX_NEW_TOKENS, eos_ids=set(), past_key_values=cache, cached_tokens=cached_tokens
+    )
+
+    assert tokens == greedy_reference(target, prompt)
+    # Like generate(), the cache covers the prompt and every token but the last
+    assert cache.get_seq_length() == prompt.shape[1] + MAX_NEW_TOKENS - 1
+
+
+def test_generation_stops_at_eos(tiny_llama, prompt):
+    target = tiny_llama(0)
+    reference = greedy_reference(target, prompt)
+    eos = reference[5]
+
+    tokens, _ = SpeculativeDecoder(target, tiny_llama(1), 4).generate(prompt, MAX_NEW_TOKENS, eos_ids={eos})
+
+    assert tokens == reference[:reference.index(eos) + 1]
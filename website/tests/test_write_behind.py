@@ -0,0 +1,232 @@
+"""
+Tests for the write-behind queue, using MemorySink in place of Supabase
+
+Run from website/:
+    python -m pytest tests
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("streamlit")
+
+from utils import write_behind  # noqa: E402
+from utils.write_behind import CHAT_MESSAGES, MemorySink, WriteBehindQueue  # noqa: E402
+
+
+def make_queue(sink, **kwargs):
+    options = {"flush_interval": 0.01, "backoff_base": 0.01, "backoff_max": 0.05}
+    options.update(kwargs)
+    write_queue = WriteBehindQueue({CHAT_MESSAGES: sink}, **options)
+    return write_queue
+
+
+def rows(count, chat_id="chat"):
+    return [{"id": str(i), "chat_id": chat_id} for i in range(count)]
+
+
+class BlockingSink(MemorySink):
+    """MemorySink whose calls wait until ``release`` is set"""
+
+    def __init__(self):
+        super().__init__()
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, batch):
+        self.entered.set()
+        assert self.release.wait(5)
+        return super().__call__(batch)
+
+
+@pytest.fixture
+def queues():
+    created = []
+    yield created
+    for write_queue in created:
+        write_queue.shutdown(timeout=1)
+
+
+def test_rows_are_written_in_order_in_bounded_batches(queues):
+    sink = MemorySink()
+    write_queue = make_queue(sink, max_batch_size=50)
+    queues.append(write_queue)
+
+    assert write_queue.enqueue_many(CHAT_MESSAGES, rows(500))
+    assert write_queue.flush(timeout=5)
+
+    assert [row["id"] for row in sink.rows] == [str(i) for i in range(500)]
+    assert sink.batches >= 10
+    metrics = write_queue.metrics()
+    assert metrics["written"] == 500 and metrics["queue_depth"] == 0
+
+
+def test_transient_failures_are_retried_with_backoff(queues):
+    sink = MemorySink(fail_next=3)
+    write_queue = make_queue(sink, backoff_base=0.02, backoff_max=1.0)
+    queues.append(write_queue)
+
+    started = time.monotonic()
+    write_queue.enqueue_many(CHAT_MESSAGES, rows(5))
+    assert write_queue.flush(timeout=5)
+
+    # 0.02 + 0.04 + 0.08 seconds of backoff before the fourth attempt
+    assert time.monotonic() - started >= 0.14
+    assert len(sink.rows) == 5
+    assert write_queue.metrics()["retries"] == 3
+
+
+def test_other_sinks_drop_rows_after_max_retries(queues):
+    sink = MemorySink(fail_next=100)
+    write_queue = make_queue(sink, max_retries=2)
+    queues.append(write_queue)
+
+    write_queue.enqueue_many(CHAT_MESSAGES, rows(3))
+    assert write_queue.flush(timeout=5)
+
+    metrics = write_queue.metrics()
+    assert metrics["dropped_failed"] == 3 and metrics["retries"] == 2
+    assert not sink.rows
+
+
+def test_durable_sinks_outlast_max_retries(queues):
+    sink = MemorySink(fail_next=6)
+    write_queue = make_queue(sink, max_retries=2, durable_sinks=[CHAT_MESSAGES])
+    queues.append(write_queue)
+
+    write_queue.enqueue_many(CHAT_MESSAGES, rows(3))
+    assert write_queue.flush(timeout=5)
+
+    assert len(sink.rows) == 3
+    assert write_queue.metrics()["dropped_failed"] == 0
+
+
+def test_durable_retries_stop_after_max_retry_seconds(queues):
+    sink = MemorySink(fail_next=10 ** 6)
+    write_queue = make_queue(sink, durable_sinks=[CHAT_MESSAGES], max_retry_seconds=0.2)
+    queues.append(write_queue)
+
+    write_queue.enqueue_many(CHAT_MESSAGES, rows(3))
+    # The worker gives up instead of wedging, so later rows still get through
+    assert write_queue.flush(timeout=5)
+    sink.fail_next = 0
+    write_queue.enqueue(CHAT_MESSAGES, {"id": "later", "chat_id": "chat"})
+    assert write_queue.flush(timeout=5)
+
+    assert [row["id"] for row in sink.rows] == ["later"]
+    assert write_queue.metrics()["dead_lettered"] == 3
+    assert [row["id"] for _, row, _ in write_queue.dead_letters] == ["0", "1", "2"]
+
+
+def test_rejected_row_is_isolated_and_dead_lettered(queues):
+    sink = MemorySink(reject=lambda row: row["id"] == "13")
+    write_queue = make_queue(sink, max_batch_size=64, durable_sinks=[CHAT_MESSAGES])
+    queues.append(write_queue)
+
+    write_queue.enqueue_many(CHAT_MESSAGES, rows(40))
+    assert write_queue.flush(timeout=5)
+
+    assert [row["id"] for row in sink.rows] == [str(i) for i in range(40) if i != 13]
+    assert [(row["id"], reason) for _, row, reason in write_queue.dead_letters] == [("13", "rejected")]
+    metrics = write_queue.metrics()
+    assert metrics["retries"] == 0 and metrics["dead_lettered"] == 1
+    # Bisecting a batch costs O(log n) extra calls, not one per row
+    assert sink.calls <= 2 * 6 + 1
+
+
+def test_flush_pending_writes_times_out_while_a_write_is_pending(monkeypatch, queues):
+    sink = BlockingSink()
+    write_queue = make_queue(sink)
+    queues.append(write_queue)
+    monkeypatch.setattr(write_behind, "_write_queue", write_queue)
+
+    write_queue.enqueue_many(CHAT_MESSAGES, rows(2))
+    assert sink.entered.wait(5)
+    started = time.monotonic()
+    assert not write_behind.flush_pending_writes(timeout=0.1)
+    assert time.monotonic() - started < 1
+
+    sink.release.set()
+    assert write_queue.flush(timeout=5)
+    assert len(sink.rows) == 2
+
+
+def test_discard_skips_pending_rows_of_a_chat(queues):
+    sink = MemorySink(fail_next=10 ** 6)
+    write_queue = make_queue(sink, durable_sinks=[CHAT_MESSAGES])
+    queues.append(write_queue)
+
+    write_queue.enqueue_many(CHAT_MESSAGES, rows(2, "deleted") + rows(2, "kept"))
+    deadline = time.monotonic() + 5
+    while not sink.calls and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # The batch being retried loses the discarded rows before its next attempt
+    write_queue.discard(CHAT_MESSAGES, lambda row: row["chat_id"] == "deleted")
+    sink.fail_next = 0
+    assert write_queue.flush(timeout=5)
+
+    assert [row["chat_id"] for row in sink.rows] == ["kept", "kept"]
+    assert write_queue.metrics()["discarded"] == 2
+
+
+def test_save_messages_async_writes_synchronously_when_the_queue_is_full(monkeypatch, queues):
+    sink = BlockingSink()
+    write_queue = make_queue(sink, max_queue_size=1, max_batch_size=1)
+    queues.append(write_queue)
+    monkeypatch.setattr(write_behind, "_write_queue", write_queue)
+    written_directly = []
+    monkeypatch.setattr(write_behind, "save_messages_db", lambda batch: written_directly.extend(batch) or True)
+
+    write_queue.enqueue(CHAT_MESSAGES, {"id": "blocking", "chat_id": "chat"})
+    assert sink.entered.wait(5)
+
+    assert write_behind.save_messages_async(rows(3))
+    sink.release.set()
+    assert write_queue.flush(timeout=5)
+
+    # One row fits in the queue, the other two are written by the caller
+    assert [row["id"] for row in sink.rows] == ["blocking", "0"]
+    assert [row["id"] for row in written_directly] == ["1", "2"]
+    assert write_queue.metrics()["dropped_full"] == 2
+
+
+def test_persisting_the_same_messages_again_upserts_by_client_id(monkeypatch):
+    import streamlit as st
+    from utils import chat_handler
+
+    table = {}
+    attempts = []
+
+    def save_messages_async(batch):
+        attempts.append([row["id"] for row in batch])
+        if len(attempts) == 1:
+            # Written, but the caller hears about a failure and keeps the rows
+            table.update((row["id"], row) for row in batch)
+            return False
+        table.update((row["id"], row) for row in batch)
+        return True
+
+    monkeypatch.setattr(chat_handler, "save_messages_async", save_messages_async)
+    st.session_state.clear()
+    try:
+        chat_handler.initialize_chat()
+        chat_handler.add_message("user", "hello there", save_to_db=True, user_email="a@example.com")
+        assert st.session_state.persisted_count == 0
+
+        chat_handler.add_message("assistant", "hi!", save_to_db=True, user_email="a@example.com")
+        assert st.session_state.persisted_count == 2
+
+        first, second = attempts
+        # The retry resends the first message under the same id, so the table keeps one copy
+        assert second[0] == first[0]
+        assert len(table) == 2
+        assert [message["id"] for message in st.session_state.messages] == second
+    finally:
+        st.session_state.clear()
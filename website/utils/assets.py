@@ -0,0 +1,30 @@
+"""
+Static assets for PsychAI
+Page stylesheets, read and minified once per server process
+"""
+
+import re
+from functools import lru_cache
+from pathlib import Path
+
+import streamlit as st
+
+STYLES_DIR = Path(__file__).parent.parent / "styles"
+
+_COMMENTS = re.compile(r"/\*.*?\*/", re.S)
+_WHITESPACE = re.compile(r"\s+")
+_PUNCTUATION_SPACE = re.compile(r"\s*([{};,])\s*")
+
+
+@lru_cache(maxsize=None)
+def css(name: str) -> str:
+    """``styles/<name>.css`` as a minified <style> block"""
+    text = (STYLES_DIR / f"{name}.css").read_text(encoding="utf-8")
+    text = _COMMENTS.sub("", text)
+    text = _PUNCTUATION_SPACE.sub(r"\1", _WHITESPACE.sub(" ", text)).strip()
+    return f"<style>{text}</style>"
+
+
+def inject_css(name: str):
+    """Add a page stylesheet (Streamlit needs it re-sent on every rerun; reading it is cached)"""
+    st.markdown(css(name), unsafe_allow_html=True)
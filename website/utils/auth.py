@@ -6,38 +6,34 @@ Uses Supabase database for persistent storage
 
 import streamlit as st
 import os
-from datetime import datetime, timedelta
-import hashlib
-import secrets
+import time
 from typing import Optional, Dict
 
 from .database import (
     create_user_db,
     get_user_db,
     user_exists_db,
-    log_user_activity_db
+    update_password_db
 )
+from .passwords import get_password_hasher, needs_rehash
+from .write_behind import log_activity_async
 
 # Session timeout (in hours)
 SESSION_TIMEOUT_HOURS = 24
 
-def hash_password(password: str, salt: Optional[str] = None) -> tuple[str, str]:
-    """Hash a password with a salt"""
-    if salt is None:
-        salt = secrets.token_hex(32)
-    
-    pwd_hash = hashlib.pbkdf2_hmac(
-        'sha256',
-        password.encode('utf-8'),
-        salt.encode('utf-8'),
-        100000
-    )
-    return pwd_hash.hex(), salt
+# Query parameter older versions put the session token in; stripped from the URL, never honoured
+LEGACY_SESSION_QUERY_PARAM = "session"
+
+def hash_password(password: str) -> tuple[str, str]:
+    """
+    Hash a password on the shared worker pool
+    Returns: (password_hash, salt); the hash encodes its algorithm and parameters
+    """
+    return get_password_hasher().hash(password)
 
 def verify_password(password: str, pwd_hash: str, salt: str) -> bool:
-    """Verify a password against a hash"""
-    new_hash, _ = hash_password(password, salt)
-    return new_hash == pwd_hash
+    """Verify a password against a hash (any supported format, constant-time compare)"""
+    return get_password_hasher().verify(password, pwd_hash, salt)
 
 def create_user(email: str, password: str, name: str) -> tuple[bool, str]:
     """
@@ -57,7 +53,10 @@ def create_user(email: str, password: str, name: str) -> tuple[bool, str]:
         return False, "Password must be at least 8 characters long"
     
     # Hash the password
-    pwd_hash, salt = hash_password(password)
+    try:
+        pwd_hash, salt = hash_password(password)
+    except TimeoutError:
+        return False, "The server is busy. Please try again in a moment."
     
     # Create user in database
     success = create_user_db(email, pwd_hash, salt, name, "custom")
@@ -78,12 +77,21 @@ def authenticate_user(email: str, password: str) -> tuple[bool, str, Optional[st
         return False, "Invalid email or password", None
     
     # Verify password
-    if not verify_password(password, user["password_hash"], user["salt"]):
-        return False, "Invalid email or password", None
+    try:
+        if not verify_password(password, user["password_hash"], user["salt"]):
+            return False, "Invalid email or password", None
+    except TimeoutError:
+        return False, "The server is busy. Please try again in a moment.", None
+
+    # Upgrade hashes made with an older algorithm or weaker parameters (in the background)
+    if needs_rehash(user["password_hash"]):
+        get_password_hasher().rehash_later(
+            password, lambda pwd_hash, salt: update_password_db(email, pwd_hash, salt)
+        )
     
-    # Log login activity
+    # Log login activity (written in the background)
     try:
-        log_user_activity_db(email, "login", {"auth_method": "custom"})
+        log_activity_async(email, "login", {"auth_method": "custom"})
     except:
         pass  # Don't fail authentication if logging fails
     
@@ -116,33 +124,49 @@ def authenticate_with_google(google_credentials: Dict) -> tuple[bool, str, Optio
         
         if not success:
             return False, "Failed to create account", None
+        
+        log_activity_async(email, "signup", {"auth_method": "google"})
     
-    # Log login activity
+    # Log login activity (written in the background)
     try:
-        log_user_activity_db(email, "login", {"auth_method": "google"})
+        log_activity_async(email, "login", {"auth_method": "google"})
     except:
         pass
     
     return True, "Google login successful!", name
 
+def _session_info() -> Dict:
+    return {
+        "authenticated": True,
+        "email": st.session_state.get("user_email"),
+        "name": st.session_state.get("user_name"),
+        "auth_method": st.session_state.get("auth_method")
+    }
+
 def login_user(email: str, name: str, auth_method: str = "custom"):
-    """Set session state for logged-in user"""
+    """
+    Mark the Streamlit session as logged in until SESSION_TIMEOUT_HOURS from now
+
+    The login lives only in session_state: nothing that could replay it is
+    put in the URL, so a refreshed tab asks for the login again.
+    """
     st.session_state.authenticated = True
     st.session_state.user_email = email
     st.session_state.user_name = name
     st.session_state.auth_method = auth_method
-    st.session_state.login_time = datetime.now().isoformat()
+    # Epoch seconds, so the per-rerun check is a float comparison
+    st.session_state.session_expires = time.time() + SESSION_TIMEOUT_HOURS * 3600
 
 def logout_user():
-    """Clear session state and log out user"""
+    """End the session and clear session state"""
     # Log logout activity before clearing session
     if st.session_state.get("user_email"):
         try:
-            log_user_activity_db(st.session_state.user_email, "logout", {})
+            log_activity_async(st.session_state.user_email, "logout", {})
         except:
             pass
-    
-    for key in ["authenticated", "user_email", "user_name", "auth_method", "login_time"]:
+
+    for key in ["authenticated", "user_email", "user_name", "auth_method", "session_expires"]:
         if key in st.session_state:
             del st.session_state[key]
 
@@ -151,24 +175,18 @@ def check_authentication() -> Dict:
     Check if user is authenticated and session is valid
     Returns: dict with authenticated status and user info
     """
-    # Check if authenticated
-    if not st.session_state.get("authenticated", False):
-        return {"authenticated": False}
-    
-    # Check session timeout
-    login_time_str = st.session_state.get("login_time")
-    if login_time_str:
-        login_time = datetime.fromisoformat(login_time_str)
-        if datetime.now() - login_time > timedelta(hours=SESSION_TIMEOUT_HOURS):
-            logout_user()
-            return {"authenticated": False, "message": "Session expired"}
-    
-    return {
-        "authenticated": True,
-        "email": st.session_state.get("user_email"),
-        "name": st.session_state.get("user_name"),
-        "auth_method": st.session_state.get("auth_method")
-    }
+    # Links saved from older versions may still carry a token; drop it from the address bar
+    if LEGACY_SESSION_QUERY_PARAM in st.query_params:
+        del st.query_params[LEGACY_SESSION_QUERY_PARAM]
+
+    # Every rerun: one float comparison, no datetime parsing and no I/O
+    if st.session_state.get("authenticated", False):
+        if time.time() < st.session_state.get("session_expires", 0):
+            return _session_info()
+        logout_user()
+        return {"authenticated": False, "message": "Session expired"}
+
+    return {"authenticated": False}
 
 def get_google_oauth_url() -> Optional[str]:
     """
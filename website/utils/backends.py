@@ -0,0 +1,149 @@
+"""
+Model loading backends for PsychAI
+Each backend turns the model config into a ready (model, tokenizer) pair for one kind of hardware
+"""
+
+from typing import Dict, Callable, Tuple
+
+# name -> loader(config) -> (model, tokenizer)
+BACKENDS: Dict[str, Callable[[Dict], Tuple[object, object]]] = {}
+
+
+def register_backend(name: str):
+    """Decorator adding a loader to BACKENDS (use it to plug in other runtimes)"""
+    def decorator(loader):
+        BACKENDS[name] = loader
+        return loader
+    return decorator
+
+
+def resolve_backend(name: str) -> str:
+    """Map "auto" to "cuda" when a GPU is visible, otherwise "cpu" """
+    if name != "auto":
+        return name
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except ImportError:
+        return "cpu"
+
+
+def load_model(config: Dict) -> Tuple[object, object, str]:
+    """Load with the configured backend; returns (model, tokenizer, backend name)"""
+    backend = resolve_backend(config["backend"])
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend: {backend} (available: {', '.join(sorted(BACKENDS))})")
+    model, tokenizer = BACKENDS[backend](config)
+    return model, tokenizer, backend
+
+
+def _model_source(config: Dict) -> Tuple[str, str]:
+    """(weights to load, adapter to attach); a merged checkpoint already contains the adapter"""
+    if config.get("merged_model"):
+        return config["merged_model"], ""
+    return config["base_model"], config["adapter"]
+
+
+def _load_tokenizer(config: Dict):
+    from transformers import AutoTokenizer
+
+    # The adapter repo (and scripts/merge_lora.py output) ships the tokenizer used during fine-tuning
+    model_path, adapter = _model_source(config)
+    tokenizer = AutoTokenizer.from_pretrained(adapter or model_path)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    # Batched generation with a decoder-only model needs left padding
+    tokenizer.padding_side = "left"
+    return tokenizer
+
+
+@register_backend("cuda")
+def load_cuda(config: Dict):
+    """bf16 weights on the GPU(s), optionally bitsandbytes 4-bit/8-bit, LoRA kept as an adapter unless merged"""
+    import torch
+    from transformers import AutoModelForCausalLM, BitsAndBytesConfig
+    from peft import PeftModel
+
+    quantization = config["quantization"]
+    load_kwargs = {"torch_dtype": torch.bfloat16, "device_map": "auto"}
+    if quantization == "4bit":
+        load_kwargs["quantization_config"] = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_compute_dtype=torch.bfloat16,
+        )
+    elif quantization == "8bit":
+        load_kwargs["quantization_config"] = BitsAndBytesConfig(load_in_8bit=True)
+
+    model_path, adapter = _model_source(config)
+    tokenizer = _load_tokenizer(config)
+    model = AutoModelForCausalLM.from_pretrained(model_path, **load_kwargs)
+    if adapter:
+        model = PeftModel.from_pretrained(model, adapter)
+    model.eval()
+
+    return model, tokenizer
+
+
+@register_backend("cpu")
+def load_cpu(config: Dict):
+    """
+    float32 weights on the CPU with the LoRA adapter merged in, then
+    weight-quantized according to ``cpu_quantization``:
+
+    - "int8": torch dynamic quantization of every nn.Linear (int8 weights,
+      activations quantized on the fly, fbgemm/onednn int8 matmuls)
+    - "int4": int4 weights with int8 dynamic activations (needs ``torchao``)
+    - "none": plain float32
+
+    Matmuls use ``cpu_threads`` intra-op threads (0 keeps torch's default,
+    one per physical core).
+    """
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    if config["cpu_threads"] > 0:
+        torch.set_num_threads(config["cpu_threads"])
+
+    model_path, adapter = _model_source(config)
+    tokenizer = _load_tokenizer(config)
+    # safetensors shards are memory-mapped, so weights are paged in rather than copied up front
+    model = AutoModelForCausalLM.from_pretrained(model_path, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+    if adapter:
+        from peft import PeftModel
+        # Merging removes the per-token LoRA matmuls and lets the quantizer see plain Linear layers
+        model = PeftModel.from_pretrained(model, adapter).merge_and_unload()
+    model.eval()
+
+    quantization = config["cpu_quantization"]
+    if quantization == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif quantization == "int4":
+        try:
+            from torchao.quantization import quantize_, Int8DynamicActivationInt4WeightConfig
+        except ImportError:
+            raise ImportError("cpu_quantization = \"int4\" needs torchao (pip install torchao)")
+        quantize_(model, Int8DynamicActivationInt4WeightConfig())
+    elif quantization != "none":
+        raise ValueError(f"Unknown cpu_quantization: {quantization}")
+
+    return model, tokenizer
+
+
+def load_draft(config: Dict, backend: str, device):
+    """
+    Load the speculative-decoding draft model next to the target
+
+    The draft is small, so it is kept unquantized on the GPU; on the cpu
+    backend it gets the same int8 treatment as the target.
+    """
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    if backend == "cpu":
+        model = AutoModelForCausalLM.from_pretrained(config["draft_model"], torch_dtype=torch.float32, low_cpu_mem_usage=True)
+        if config["cpu_quantization"] == "int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        model = AutoModelForCausalLM.from_pretrained(config["draft_model"], torch_dtype=torch.bfloat16).to(device)
+    return model.eval()
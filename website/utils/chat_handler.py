@@ -5,15 +5,18 @@ Uses Supabase database for persistent storage
 """
 
 import streamlit as st
+import random
+import uuid
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional, Iterator
 
 from .database import (
-    save_message_db,
     get_chat_history_db,
-    delete_chat_db,
-    log_user_activity_db
+    delete_chat_db
 )
+from .write_behind import save_messages_async, log_activity_async, discard_pending_messages
+from .inference import start_model_loading, get_inference_engine
+from .inference_server import get_inference_server
 
 def initialize_chat():
     """Initialize chat session state"""
@@ -22,12 +25,17 @@ def initialize_chat():
     
     if "chat_id" not in st.session_state:
         st.session_state.chat_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    
+    # High-water mark: messages[:persisted_count] are already in the database
+    if "persisted_count" not in st.session_state:
+        st.session_state.persisted_count = 0
 
 def get_chat_history() -> List[Dict]:
     """Get current chat history from session state"""
     return st.session_state.get("messages", [])
 
-def add_message(role: str, content: str, save_to_db: bool = False, user_email: str = None):
+def add_message(role: str, content: str, save_to_db: bool = False, user_email: str = None,
+                metadata: Optional[Dict] = None):
     """
     Add a message to chat history
     
@@ -36,39 +44,75 @@ def add_message(role: str, content: str, save_to_db: bool = False, user_email: s
         content: Message content
         save_to_db: Whether to save to database immediately
         user_email: User email (required if save_to_db is True)
+        metadata: Extra data stored with the message (e.g. generation metrics)
     """
     if "messages" not in st.session_state:
         st.session_state.messages = []
     
     message = {
+        # Client-generated id makes database writes idempotent (upsert on id)
+        "id": str(uuid.uuid4()),
         "role": role,
         "content": content,
         "timestamp": datetime.now().isoformat()
     }
+    if metadata:
+        message["metadata"] = metadata
     
     st.session_state.messages.append(message)
     
     # Save to database if requested
     if save_to_db and user_email:
-        try:
-            save_message_db(
-                user_email=user_email,
-                chat_id=st.session_state.chat_id,
-                role=role,
-                content=content
-            )
-        except Exception as e:
-            print(f"Error saving message to database: {e}")
+        _persist_new_messages(user_email)
 
 def clear_chat():
     """Clear current chat history and start a new session"""
     st.session_state.messages = []
     st.session_state.chat_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    st.session_state.persisted_count = 0
+    st.session_state.has_earlier_messages = False
+
+def _persist_new_messages(user_email: str) -> int:
+    """
+    Hand messages past the persisted high-water mark to the write-behind queue
+    
+    The queue writes them in bulk in the background and retries on failure;
+    every write is an upsert on the message id, so a retry never duplicates rows.
+    
+    Returns:
+        Number of messages handed off for writing
+    """
+    messages = st.session_state.get("messages", [])
+    chat_id = st.session_state.get("chat_id")
+    start = st.session_state.get("persisted_count", 0)
+    
+    new_messages = messages[start:]
+    if not new_messages:
+        return 0
+    
+    rows = []
+    for message in new_messages:
+        message.setdefault("id", str(uuid.uuid4()))
+        rows.append({
+            "id": message["id"],
+            "user_email": user_email,
+            "chat_id": chat_id,
+            "role": message["role"],
+            "content": message["content"],
+            "metadata": message.get("metadata"),
+            "timestamp": message.get("timestamp")
+        })
+    
+    if not save_messages_async(rows):
+        return 0
+    
+    st.session_state.persisted_count = start + len(rows)
+    return len(rows)
 
 def save_chat_history(user_email: str):
     """
-    Save entire chat history to database
-    This is called to persist the session to the database
+    Save new chat messages to the database
+    Only messages added since the last save are queued for writing
     """
     if not st.session_state.get("messages"):
         return
@@ -76,52 +120,88 @@ def save_chat_history(user_email: str):
     chat_id = st.session_state.get("chat_id")
     
     try:
-        # Save all messages that haven't been saved yet
-        for message in st.session_state.messages:
-            save_message_db(
+        written = _persist_new_messages(user_email)
+        
+        if written:
+            log_activity_async(
                 user_email=user_email,
-                chat_id=chat_id,
-                role=message["role"],
-                content=message["content"]
+                activity_type="chat_saved",
+                metadata={"chat_id": chat_id, "message_count": len(st.session_state.messages)}
             )
         
-        # Log activity
-        log_user_activity_db(
-            user_email=user_email,
-            activity_type="chat_saved",
-            metadata={"chat_id": chat_id, "message_count": len(st.session_state.messages)}
-        )
-        
-        return True
+        return st.session_state.persisted_count == len(st.session_state.messages)
     except Exception as e:
         print(f"Error saving chat history: {e}")
         return False
 
-def load_chat_history(user_email: str, chat_id: str):
-    """Load a previous chat session from database"""
+# Messages fetched per page when opening a saved chat
+HISTORY_PAGE_SIZE = 50
+
+def _from_db_format(messages: List[Dict]) -> List[Dict]:
+    return [
+        {
+            "id": msg["id"],
+            "role": msg["role"],
+            "content": msg["content"],
+            "timestamp": msg["timestamp"]
+        }
+        for msg in messages
+    ]
+
+def load_chat_history(user_email: str, chat_id: str, limit: Optional[int] = HISTORY_PAGE_SIZE):
+    """
+    Load a previous chat session from database
+    
+    Only the most recent `limit` messages are fetched (None loads everything);
+    older ones are fetched on demand with load_earlier_messages().
+    """
     try:
-        messages = get_chat_history_db(user_email, chat_id)
+        messages = get_chat_history_db(user_email, chat_id, limit=limit)
         
         # Convert database format to session state format
-        st.session_state.messages = [
-            {
-                "role": msg["role"],
-                "content": msg["content"],
-                "timestamp": msg["timestamp"]
-            }
-            for msg in messages
-        ]
+        st.session_state.messages = _from_db_format(messages)
         st.session_state.chat_id = chat_id
+        st.session_state.persisted_count = len(st.session_state.messages)
+        st.session_state.has_earlier_messages = limit is not None and len(messages) == limit
         
         return True
     except Exception as e:
         print(f"Error loading chat history: {e}")
         return False
 
+def load_earlier_messages(user_email: str, limit: int = HISTORY_PAGE_SIZE) -> int:
+    """
+    Prepend the page of messages just older than the oldest one in session state
+    
+    Returns:
+        Number of messages loaded
+    """
+    messages = st.session_state.get("messages", [])
+    if not messages or not st.session_state.get("has_earlier_messages"):
+        return 0
+    
+    oldest = messages[0]
+    older = get_chat_history_db(
+        user_email,
+        st.session_state.chat_id,
+        before=(oldest["timestamp"], oldest["id"]),
+        limit=limit
+    )
+    
+    st.session_state.messages = _from_db_format(older) + messages
+    # Loaded messages are already stored, so the high-water mark shifts with them
+    st.session_state.persisted_count = st.session_state.get("persisted_count", 0) + len(older)
+    st.session_state.has_earlier_messages = len(older) == limit
+    return len(older)
+
 def delete_chat(user_email: str, chat_id: str):
     """Delete a chat and all its messages"""
     try:
+        # Queued messages of this chat would otherwise be inserted after the delete and bring it back
+        discard_pending_messages(chat_id)
         success = delete_chat_db(user_email, chat_id)
+        # Free the chat's cached attention state, it will never be extended again
+        get_inference_engine().prefix_cache.discard(f"{user_email}:{chat_id}")
         
         # If it's the current chat, clear the session
         if st.session_state.get("chat_id") == chat_id:
@@ -132,85 +212,121 @@ def delete_chat(user_email: str, chat_id: str):
         print(f"Error deleting chat: {e}")
         return False
 
-def get_llm_response(user_message: str, conversation_history: List[Dict]) -> str:
+PLACEHOLDER_RESPONSES = [
+    "I understand you're reaching out for support. While I'm still being set up, "
+    "I want you to know that your feelings are valid and it's brave of you to seek help. "
+    "Once our system is fully configured, I'll be able to provide more personalized guidance.",
+
+    "Thank you for sharing that with me. I'm currently in development mode, but I want "
+    "to acknowledge what you've expressed. In the meantime, if you're experiencing a crisis, "
+    "please reach out to a trusted adult or call a crisis helpline.",
+
+    "I hear you, and I appreciate you opening up. My AI capabilities are still being "
+    "configured, but I want you to know that seeking support is an important step. "
+    "Remember, there are always people who care and want to help.",
+]
+
+def stream_llm_response(user_message: str, conversation_history: List[Dict],
+                        metrics: Optional[Dict] = None) -> Iterator[str]:
     """
-    Get response from the fine-tuned LLM
+    Stream the response from the fine-tuned LLM as it is generated
     
-    This is a placeholder function. You'll replace this with actual model inference
-    once your fine-tuned model is ready.
+    The model is loaded once per server process (see utils/inference.py) and shared
+    by every session; requests from all sessions are batched by the inference
+    server (see utils/inference_server.py). Opening messages that closely match one
+    already answered are served from the response cache (see utils/response_cache.py).
+    If the model is disabled or failed to load, a placeholder response is yielded so
+    the chat keeps working in development.
     
     Args:
         user_message: The user's current message
         conversation_history: List of previous messages in the conversation
+        metrics: Optional dict filled with ttft_seconds, tokens_per_second, etc.
     
-    Returns:
-        The LLM's response as a string
+    Yields:
+        Chunks of the response text
     """
-    # TODO: Replace this placeholder with actual model inference
-    # For now, return a helpful placeholder message
+    engine = start_model_loading()
     
-    placeholder_responses = [
-        "I understand you're reaching out for support. While I'm still being set up, "
-        "I want you to know that your feelings are valid and it's brave of you to seek help. "
-        "Once our system is fully configured, I'll be able to provide more personalized guidance.",
+    if engine.wait_until_loaded():
+        messages = list(conversation_history)
+        # The chat page appends the user message before calling us
+        if not messages or messages[-1].get("content") != user_message:
+            messages.append({"role": "user", "content": user_message})
         
-        "Thank you for sharing that with me. I'm currently in development mode, but I want "
-        "to acknowledge what you've expressed. In the meantime, if you're experiencing a crisis, "
-        "please reach out to a trusted adult or call a crisis helpline.",
+        first_turn = sum(1 for m in messages if m["role"] == "user") == 1
+        from .response_cache import get_response_cache  # numpy is only needed once a reply is requested
+        response_cache = get_response_cache()
+        if first_turn:
+            cached = response_cache.lookup(user_message)
+            if cached is not None:
+                if metrics is not None:
+                    metrics.update({"response_cache": "hit", "similarity": cached["similarity"]})
+                yield cached["response"]
+                return
         
-        "I hear you, and I appreciate you opening up. My AI capabilities are still being "
-        "configured, but I want you to know that seeking support is an important step. "
-        "Remember, there are always people who care and want to help.",
-    ]
-    
-    # Simple logic to vary responses
-    import random
-    response = random.choice(placeholder_responses)
+        streamed = False
+        chunks = []
+        try:
+            # Lets the next turn of this chat reuse the KV cache of this one
+            cache_key = f"{st.session_state.get('user_email')}:{st.session_state.get('chat_id')}"
+            request = get_inference_server().submit(messages, cache_key=cache_key)
+            for chunk in request:
+                streamed = True
+                chunks.append(chunk)
+                yield chunk
+            if metrics is not None:
+                metrics.update(request.stats)
+            if first_turn:
+                response_cache.put(user_message, "".join(chunks).strip(), request.stats.get("total_seconds", 0.0))
+            return
+        except Exception as e:
+            print(f"Error generating response: {e}")
+            if streamed:
+                return
     
-    return response
+    yield random.choice(PLACEHOLDER_RESPONSES)
 
-def load_model_placeholder():
+def get_llm_response(user_message: str, conversation_history: List[Dict]) -> str:
     """
-    Placeholder function for loading the fine-tuned model
-    
-    Once your model is trained, you'll implement this function to:
-    1. Load the base model and LoRA adapters
-    2. Set up the tokenizer
-    3. Configure generation parameters
+    Get the complete response from the fine-tuned LLM
     
-    Example implementation (for later):
-    ```python
-    from transformers import AutoTokenizer, AutoModelForCausalLM
-    from peft import PeftModel
-    
-    base_model = "Qwen/Qwen2.5-7B-Instruct"
-    adapter_path = "path/to/your/lora/adapters"
+    Args:
+        user_message: The user's current message
+        conversation_history: List of previous messages in the conversation
     
-    tokenizer = AutoTokenizer.from_pretrained(base_model)
-    model = AutoModelForCausalLM.from_pretrained(base_model, device_map="auto")
-    model = PeftModel.from_pretrained(model, adapter_path)
+    Returns:
+        The LLM's response as a string
+    """
+    return "".join(stream_llm_response(user_message, conversation_history)).strip()
+
+def load_model():
+    """
+    Load the fine-tuned model into the process-wide cache
     
-    return model, tokenizer
-    ```
+    Returns:
+        (model, tokenizer), or (None, None) if the model is disabled or failed to load
     """
+    engine = start_model_loading()
+    if engine.wait_until_loaded():
+        return engine.model, engine.tokenizer
     return None, None
 
-def format_conversation_for_model(messages: List[Dict]) -> str:
+def format_conversation_for_model(messages: List[Dict], max_new_tokens: Optional[int] = None) -> str:
     """
     Format conversation history for model input
     
+    Uses the model's chat template and system prompt, dropping the oldest turns
+    so the prompt and the reply fit in the model's context window.
+    
     Args:
         messages: List of message dictionaries with 'role' and 'content'
+        max_new_tokens: Room to leave for the reply (defaults to the model config)
     
     Returns:
         Formatted string ready for model input
     """
-    # This will depend on your model's chat template
-    # For now, a simple format
-    formatted = ""
-    for msg in messages:
-        role = msg["role"]
-        content = msg["content"]
-        formatted += f"{role.capitalize()}: {content}\n"
-    
-    return formatted
\ No newline at end of file
+    engine = start_model_loading()
+    if not engine.wait_until_loaded():
+        raise RuntimeError(f"Model is not ready (status: {engine.status})")
+    return engine.build_prompt(messages, max_new_tokens)
@@ -0,0 +1,86 @@
+"""
+Chat message rendering for PsychAI
+Shows a window of the latest messages and caches each message's HTML by id
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import streamlit as st
+
+from .chat_handler import load_earlier_messages
+
+# Messages shown initially, and added per "Load earlier messages" click
+CHAT_WINDOW_SIZE = 40
+
+
+def format_time(timestamp: str) -> str:
+    """12-hour clock time of an ISO timestamp ("" if missing or unparseable)"""
+    if not timestamp:
+        return ""
+    try:
+        return datetime.fromisoformat(timestamp).strftime("%I:%M %p")
+    except Exception:
+        return ""
+
+
+def message_html(role: str, content: str, time_str: str) -> str:
+    css_class, label = ("msg-user", "You") if role == "user" else ("msg-ai", "PsychAI")
+    return f"""
+        <div class="msg {css_class}">
+            <div class="msg-role">{label}</div>
+            {content}
+            <div class="msg-time">{time_str}</div>
+        </div>
+    """
+
+
+def _window_state() -> Dict:
+    """Window size for the current chat (reset when another chat is opened or a new one started)"""
+    chat_id = st.session_state.get("chat_id")
+    window = st.session_state.get("chat_window")
+    if window is None or window["chat_id"] != chat_id:
+        window = {"chat_id": chat_id, "size": CHAT_WINDOW_SIZE}
+        st.session_state.chat_window = window
+    return window
+
+
+def _show_earlier(user_email: str):
+    """Button callback: widen the window, fetching older messages once memory runs out"""
+    window = _window_state()
+    messages = st.session_state.get("messages", [])
+    if window["size"] >= len(messages) and st.session_state.get("has_earlier_messages"):
+        load_earlier_messages(user_email, limit=CHAT_WINDOW_SIZE)
+    window["size"] += CHAT_WINDOW_SIZE
+
+
+def visible_messages(messages: List[Dict]) -> List[Dict]:
+    """The latest messages that fit in the current window"""
+    return messages[-_window_state()["size"]:]
+
+
+def render_messages(messages: List[Dict], user_email: Optional[str] = None):
+    """
+    Render the latest window of ``messages``, with a "Load earlier messages"
+    button when older ones are hidden or still in the database
+
+    A message's HTML (including its formatted timestamp) is built once and
+    cached by message id in session state, so a rerun only formats messages
+    that are new; the cache only keeps messages inside the window.
+    """
+    window = visible_messages(messages)
+    if len(window) < len(messages) or (user_email and st.session_state.get("has_earlier_messages")):
+        st.button("↑  Load earlier messages", key="load_earlier", use_container_width=True,
+                  on_click=_show_earlier, args=(user_email,))
+
+    cached = st.session_state.get("chat_html_cache", {})
+    fresh = {}
+    for msg in window:
+        msg_id = msg.get("id")
+        html = cached.get(msg_id) if msg_id else None
+        if html is None:
+            html = message_html(msg["role"], msg["content"], format_time(msg.get("timestamp", "")))
+        if msg_id:
+            fresh[msg_id] = html
+        st.markdown(html, unsafe_allow_html=True)
+    st.session_state.chat_html_cache = fresh
@@ -4,19 +4,29 @@ Handles all database connections and operations
 """
 
 import os
-from typing import Optional, Dict, List
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple, TYPE_CHECKING
 from datetime import datetime
 import streamlit as st
-from supabase import create_client, Client
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 # Initialize Supabase client
-_supabase_client: Optional[Client] = None
+_supabase_client: Optional["Client"] = None
 
-def get_supabase_client() -> Client:
+def get_supabase_client() -> "Client":
     """Get or create Supabase client (singleton pattern)"""
     global _supabase_client
     
     if _supabase_client is None:
+        # Imported on first use: supabase and its HTTP/auth stack take ~0.4 s to
+        # import, which would otherwise delay the first paint of every page
+        from supabase import create_client
+
         supabase_url = os.getenv("SUPABASE_URL") or st.secrets.get("supabase", {}).get("url")
         supabase_key = os.getenv("SUPABASE_KEY") or st.secrets.get("supabase", {}).get("key")
         
@@ -42,6 +52,118 @@ def init_database():
     # See database_schema.sql for the schema
     pass
 
+# In-process cache of user records. Every login and sign-up looks the user up,
+# so bursts (e.g. everyone reconnecting after an outage) would otherwise each
+# hit the users table. Emails with no account are cached too, for a shorter
+# time, since sign-up checks and failed logins look those up as well.
+USER_CACHE_TTL_SECONDS = float(os.getenv("PSYCHAI_USER_CACHE_TTL_SECONDS", 300))
+USER_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("PSYCHAI_USER_CACHE_NEGATIVE_TTL_SECONDS", 30))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("PSYCHAI_USER_CACHE_MAX_ENTRIES", 10000))
+
+# Columns the app reads from a user record (no need to ship the rest on every login)
+USER_COLUMNS = "email, name, password_hash, salt, auth_method"
+
+
+class _UserCache:
+    """
+    TTL + LRU cache of user records keyed by email
+
+    ``None`` is cached for emails without an account. Concurrent misses for
+    the same email share one database query, and invalidating an email while
+    its query is in flight keeps the (possibly stale) result out of the cache.
+    """
+
+    def __init__(self, ttl_seconds: float, negative_ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+
+        self._entries: "OrderedDict[str, Tuple[float, Optional[Dict]]]" = OrderedDict()  # email -> (expires_at, user)
+        self._inflight: Dict[str, threading.Event] = {}
+        self._generation: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, email: str, fetch) -> Optional[Dict]:
+        """Cached user for ``email``, calling ``fetch(email)`` on a miss (it raises on DB errors)"""
+        while True:
+            with self._lock:
+                entry = self._entries.get(email)
+                if entry is not None and entry[0] > time.monotonic():
+                    self._entries.move_to_end(email)
+                    if entry[1] is None:
+                        self.negative_hits += 1
+                        return None
+                    self.hits += 1
+                    return dict(entry[1])
+
+                waiting = self._inflight.get(email)
+                if waiting is None:
+                    self._inflight[email] = threading.Event()
+                    generation = self._generation.get(email, 0)
+                    self.misses += 1
+                    break
+            waiting.wait()  # another session is already fetching this email
+
+        try:
+            user = fetch(email)
+            with self._lock:
+                if self._generation.get(email, 0) == generation:
+                    self._store(email, user)
+            return dict(user) if user is not None else None
+        finally:
+            with self._lock:
+                self._inflight.pop(email).set()
+
+    def invalidate(self, email: str):
+        """Forget ``email`` (after it is created or updated)"""
+        with self._lock:
+            self._entries.pop(email, None)
+            self._generation[email] = self._generation.get(email, 0) + 1
+            if len(self._generation) > self.max_entries:
+                self._generation = {e: g for e, g in self._generation.items() if e in self._inflight}
+
+    def clear(self):
+        with self._lock:
+            for email in list(self._entries) + list(self._inflight):
+                self._generation[email] = self._generation.get(email, 0) + 1
+            self._entries.clear()
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.negative_hits) / lookups if lookups else None,
+                "evictions": self.evictions,
+            }
+
+    def _store(self, email: str, user: Optional[Dict]):
+        if self.max_entries <= 0:
+            return
+        ttl = self.ttl_seconds if user is not None else self.negative_ttl_seconds
+        self._entries.pop(email, None)
+        self._entries[email] = (time.monotonic() + ttl, dict(user) if user is not None else None)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+_user_cache = _UserCache(USER_CACHE_TTL_SECONDS, USER_CACHE_NEGATIVE_TTL_SECONDS, USER_CACHE_MAX_ENTRIES)
+
+
+def user_cache_metrics() -> Dict:
+    """Hit rate and size of the in-process user record cache"""
+    return _user_cache.metrics()
+
 # User management functions
 def create_user_db(email: str, password_hash: str, salt: str, name: str, auth_method: str = "custom") -> bool:
     """Create a new user in the database"""
@@ -64,17 +186,21 @@ def create_user_db(email: str, password_hash: str, salt: str, name: str, auth_me
         _st.error(f"DB error: {e}")
         print(f"Error creating user: {e}")
         return False
+    finally:
+        # Drops the cached "no such user" from the sign-up check (and any record on failure)
+        _user_cache.invalidate(email)
+
+def _fetch_user(email: str) -> Optional[Dict]:
+    client = get_supabase_client()
+    result = client.table("users").select(USER_COLUMNS).eq("email", email).limit(1).execute()
+    return result.data[0] if result.data else None
 
 def get_user_db(email: str) -> Optional[Dict]:
-    """Get user by email"""
+    """Get user by email (served from the in-process user cache when fresh)"""
     try:
-        client = get_supabase_client()
-        result = client.table("users").select("*").eq("email", email).execute()
-        
-        if result.data and len(result.data) > 0:
-            return result.data[0]
-        return None
+        return _user_cache.get(email, _fetch_user)
     except Exception as e:
+        # Errors are not cached: the next call queries again
         print(f"Error getting user: {e}")
         return None
 
@@ -82,67 +208,165 @@ def user_exists_db(email: str) -> bool:
     """Check if user exists"""
     return get_user_db(email) is not None
 
+def update_password_db(email: str, password_hash: str, salt: str) -> bool:
+    """Replace a user's stored password hash (e.g. after rehashing with stronger parameters)"""
+    try:
+        client = get_supabase_client()
+        client.table("users").update({"password_hash": password_hash, "salt": salt}).eq("email", email).execute()
+        return True
+    except Exception as e:
+        print(f"Error updating password: {e}")
+        return False
+    finally:
+        _user_cache.invalidate(email)
+
 # Chat history functions
-def save_message_db(user_email: str, chat_id: str, role: str, content: str) -> bool:
-    """Save a single message to the database"""
+def save_message_db(user_email: str, chat_id: str, role: str, content: str,
+                    metadata: Optional[Dict] = None, message_id: Optional[str] = None,
+                    timestamp: Optional[str] = None) -> bool:
+    """Save a single message to the database (see save_messages_db)"""
+    return save_messages_db([{
+        "id": message_id,
+        "user_email": user_email,
+        "chat_id": chat_id,
+        "role": role,
+        "content": content,
+        "metadata": metadata,
+        "timestamp": timestamp
+    }])
+
+class PermanentWriteError(Exception):
+    """A write the database rejected for its content; retrying it cannot succeed"""
+
+
+def _is_permanent_error(e: Exception) -> bool:
+    """
+    True for errors caused by the rows themselves rather than the connection
+    
+    Malformed rows (KeyError/TypeError while building or serialising them),
+    SQLSTATE classes 22 (data exception), 23 (constraint violation) and 42
+    (syntax or permission, including RLS), and PostgREST's PGRST1xx/2xx
+    request errors (HTTP 4xx). Everything else (network errors, timeouts,
+    5xx, 429) is transient.
+    """
+    if isinstance(e, (KeyError, TypeError)):
+        return True
+    code = str(getattr(e, "code", None) or "")
+    return code[:2] in ("22", "23", "42") or code.startswith(("PGRST1", "PGRST2"))
+
+
+def save_messages_db(messages: List[Dict], raise_rejected: bool = False) -> bool:
+    """
+    Save several messages in one multi-row request
+    
+    Each dict needs user_email, chat_id, role and content; id, timestamp and
+    metadata are optional. The write is an upsert on id that ignores existing
+    rows, so saving the same messages twice (e.g. on retry) leaves one copy.
+    
+    Returns False on any error, unless ``raise_rejected`` is set: then errors
+    a retry cannot fix raise PermanentWriteError (used by the write-behind
+    queue to tell a bad row from an outage).
+    """
+    if not messages:
+        return True
+    
     try:
         client = get_supabase_client()
         
-        data = {
-            "user_email": user_email,
-            "chat_id": chat_id,
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now().isoformat()
-        }
+        now = datetime.now().isoformat()
+        # Every row carries the same keys so PostgREST can send a single INSERT
+        rows = [
+            {
+                "id": msg.get("id") or str(uuid.uuid4()),
+                "user_email": msg["user_email"],
+                "chat_id": msg["chat_id"],
+                "role": msg["role"],
+                "content": msg["content"],
+                "metadata": msg.get("metadata"),
+                "timestamp": msg.get("timestamp") or now
+            }
+            for msg in messages
+        ]
         
-        result = client.table("chat_messages").insert(data).execute()
+        client.table("chat_messages").upsert(rows, on_conflict="id", ignore_duplicates=True).execute()
         return True
     except Exception as e:
-        print(f"Error saving message: {e}")
+        if raise_rejected and _is_permanent_error(e):
+            raise PermanentWriteError(str(e)) from e
+        print(f"Error saving messages: {e}")
         return False
 
-def get_chat_history_db(user_email: str, chat_id: str) -> List[Dict]:
-    """Get all messages for a specific chat"""
+def get_chat_history_db(user_email: str, chat_id: str,
+                        after: Optional[Tuple[str, str]] = None,
+                        before: Optional[Tuple[str, str]] = None,
+                        limit: Optional[int] = None) -> List[Dict]:
+    """
+    Get messages for a specific chat, oldest first
+    
+    Uses keyset pagination on (timestamp, id), served by the composite
+    (user_email, chat_id, timestamp, id) index from migration 002. Cursors are the
+    (timestamp, id) of a message already on screen:
+    
+    - no cursor, no limit: the whole chat
+    - limit only: the most recent `limit` messages
+    - before=cursor: up to `limit` messages just older than the cursor
+    - after=cursor: up to `limit` messages newer than the cursor
+    """
     try:
         client = get_supabase_client()
-        result = (
+        # Without an `after` cursor a limited read wants the newest rows,
+        # so scan the index backwards and flip the page afterwards
+        newest_first = limit is not None and after is None
+        
+        query = (
             client.table("chat_messages")
             .select("*")
             .eq("user_email", user_email)
             .eq("chat_id", chat_id)
-            .order("timestamp", desc=False)
-            .execute()
         )
+        if after is not None:
+            query = query.or_(_keyset_filter("gt", after))
+        if before is not None:
+            query = query.or_(_keyset_filter("lt", before))
         
-        return result.data if result.data else []
+        query = query.order("timestamp", desc=newest_first).order("id", desc=newest_first)
+        if limit is not None:
+            query = query.limit(limit)
+        
+        result = query.execute()
+        rows = result.data if result.data else []
+        return rows[::-1] if newest_first else rows
     except Exception as e:
         print(f"Error getting chat history: {e}")
         return []
 
-def get_user_chats_db(user_email: str) -> List[Dict]:
-    """Get all chat sessions for a user"""
+def _keyset_filter(op: str, cursor: Tuple[str, str]) -> str:
+    """PostgREST filter for (timestamp, id) <op> cursor, with id breaking timestamp ties"""
+    timestamp, message_id = cursor
+    return f'timestamp.{op}."{timestamp}",and(timestamp.eq."{timestamp}",id.{op}.{message_id})'
+
+def get_user_chats_db(user_email: str, limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+    """
+    Get chat sessions for a user, most recent first
+    
+    Reads the `chats` summary table (one row per chat, maintained by triggers on
+    chat_messages), so the cost is proportional to the number of chats returned
+    rather than the number of messages. Each row has chat_id, timestamp (last
+    message) and message_count. Use limit/offset to page through long lists.
+    """
     try:
         client = get_supabase_client()
-        result = (
-            client.table("chat_messages")
-            .select("chat_id, timestamp")
+        query = (
+            client.table("chats")
+            .select("chat_id, timestamp:last_timestamp, message_count")
             .eq("user_email", user_email)
-            .order("timestamp", desc=True)
-            .execute()
+            .order("last_timestamp", desc=True)
         )
+        if limit is not None:
+            query = query.range(offset, offset + limit - 1)
         
-        if not result.data:
-            return []
-        
-        # Group by chat_id and get the latest timestamp for each
-        chats = {}
-        for row in result.data:
-            chat_id = row["chat_id"]
-            if chat_id not in chats:
-                chats[chat_id] = row
-        
-        return list(chats.values())
+        result = query.execute()
+        return result.data if result.data else []
     except Exception as e:
         print(f"Error getting user chats: {e}")
         return []
@@ -165,41 +389,63 @@ def delete_chat_db(user_email: str, chat_id: str) -> bool:
 
 # Analytics/Usage functions (optional)
 def log_user_activity_db(user_email: str, activity_type: str, metadata: Optional[Dict] = None):
-    """Log user activity for analytics"""
+    """Log user activity for analytics (see log_activities_db)"""
+    log_activities_db([{
+        "user_email": user_email,
+        "activity_type": activity_type,
+        "metadata": metadata
+    }])
+
+def log_activities_db(activities: List[Dict], raise_rejected: bool = False) -> bool:
+    """
+    Log several activity events in one multi-row insert
+    
+    Each dict needs user_email and activity_type; metadata and timestamp are optional.
+    ``raise_rejected`` works as in save_messages_db.
+    """
+    if not activities:
+        return True
+    
     try:
         client = get_supabase_client()
         
-        data = {
-            "user_email": user_email,
-            "activity_type": activity_type,
-            "metadata": metadata or {},
-            "timestamp": datetime.now().isoformat()
-        }
+        now = datetime.now().isoformat()
+        rows = [
+            {
+                "user_email": activity["user_email"],
+                "activity_type": activity["activity_type"],
+                "metadata": activity.get("metadata") or {},
+                "timestamp": activity.get("timestamp") or now
+            }
+            for activity in activities
+        ]
         
-        client.table("user_activity").insert(data).execute()
+        client.table("user_activity").insert(rows).execute()
+        return True
     except Exception as e:
+        if raise_rejected and _is_permanent_error(e):
+            raise PermanentWriteError(str(e)) from e
         print(f"Error logging activity: {e}")
-        pass  # Don't fail on analytics errors
+        return False  # Don't fail on analytics errors
 
 def get_user_stats_db(user_email: str) -> Dict:
-    """Get usage statistics for a user"""
+    """Get usage statistics for a user (one row from the chat_statistics view)"""
     try:
         client = get_supabase_client()
-        
-        # Count total messages
-        messages_result = (
-            client.table("chat_messages")
-            .select("id", count="exact")
+        result = (
+            client.table("chat_statistics")
+            .select("total_chats, total_messages")
             .eq("user_email", user_email)
             .execute()
         )
         
-        # Count unique chats
-        chats = get_user_chats_db(user_email)
+        if not result.data:
+            return {"total_messages": 0, "total_chats": 0}
         
+        row = result.data[0]
         return {
-            "total_messages": messages_result.count if hasattr(messages_result, 'count') else 0,
-            "total_chats": len(chats),
+            "total_messages": row["total_messages"] or 0,
+            "total_chats": row["total_chats"] or 0,
         }
     except Exception as e:
         print(f"Error getting stats: {e}")
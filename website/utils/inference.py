@@ -0,0 +1,530 @@
+"""
+Inference engine for PsychAI
+Loads the fine-tuned model once per server process and shares it across all sessions
+"""
+
+import os
+import threading
+import time
+import resource
+from typing import Optional, Dict, List, Iterator, Callable
+
+import streamlit as st
+
+from .prompt_builder import PromptBuilder
+from .kv_cache import PrefixCache
+from .backends import load_model, load_draft
+from .speculative import SpeculativeDecoder
+
+# Defaults match the training notebook (data_and_model_training.ipynb)
+BASE_MODEL = "Qwen/Qwen3-8B"
+ADAPTER_ID = "kavin-ravi/qwen3-8b-psychai-lora"
+MAX_SEQ_LENGTH = 2048
+
+SYSTEM_PROMPT = (
+    'You are "PsychAI," a compassionate coach who supports teens dealing with '
+    "anxiety, mood dips, and everyday stresses. "
+    "Always validate the user’s feelings and invite self-reflection before offering guidance. "
+    "Share coping ideas, grounding techniques, or resources, "
+    "but never diagnose, prescribe medication, or promise confidentiality. "
+    "When you suspect safety risks or crises, encourage the teen to reach out to a trusted adult "
+    "or emergency professional immediately. "
+    "Keep replies in one or two conversational paragraphs "
+    "(no bullet lists unless the user explicitly asks), avoid clinical jargon, "
+    "and sound warm, hopeful, and practical. "
+    "End by inviting the user to share how the suggestion felt or ask a follow-up question."
+)
+
+# Engine status values reported by model_health()
+STATUS_NOT_LOADED = "not_loaded"
+STATUS_LOADING = "loading"
+STATUS_READY = "ready"
+STATUS_ERROR = "error"
+STATUS_DISABLED = "disabled"
+
+
+def _get_setting(key: str, default=None):
+    """Read a model setting from PSYCHAI_<KEY> or the [model] section of secrets.toml"""
+    env_value = os.getenv(f"PSYCHAI_{key.upper()}")
+    if env_value is not None:
+        return env_value
+    try:
+        return st.secrets.get("model", {}).get(key, default)
+    except Exception:
+        return default
+
+
+def _as_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y", "on")
+    return bool(value)
+
+
+def get_model_config() -> Dict:
+    """Collect model settings (environment first, then secrets, then defaults)"""
+    return {
+        "enabled": _as_bool(_get_setting("enabled", True)),
+        "base_model": _get_setting("base_model", BASE_MODEL),
+        "adapter": _get_setting("adapter", ADAPTER_ID),
+        "merged_model": _get_setting("merged_model", ""),  # output of scripts/merge_lora.py, replaces base + adapter
+        "backend": str(_get_setting("backend", "auto")).lower(),  # "auto" | "cuda" | "cpu" (see utils/backends.py)
+        "quantization": str(_get_setting("quantization", "4bit")).lower(),  # cuda: "4bit" | "8bit" | "none"
+        "cpu_quantization": str(_get_setting("cpu_quantization", "int8")).lower(),  # cpu: "int8" | "int4" | "none"
+        "cpu_threads": int(_get_setting("cpu_threads", 0)),  # 0 = torch default
+        "max_new_tokens": int(_get_setting("max_new_tokens", 512)),
+        "draft_model": _get_setting("draft_model", ""),  # same-tokenizer model for speculative decoding, e.g. Qwen/Qwen3-0.6B
+        "num_draft_tokens": int(_get_setting("num_draft_tokens", 4)),
+        "max_seq_length": int(_get_setting("max_seq_length", MAX_SEQ_LENGTH)),
+        "kv_cache_mb": float(_get_setting("kv_cache_mb", 2048)),  # 0 disables prefix caching
+        "temperature": float(_get_setting("temperature", 0.7)),
+        "top_p": float(_get_setting("top_p", 0.9)),
+    }
+
+
+class InferenceEngine:
+    """
+    Owns the model and tokenizer for the lifetime of the server process.
+
+    Streamlit re-executes page scripts on every interaction, but imported modules
+    stay loaded, so a single engine held at module level is shared by every
+    session and every rerun.
+    """
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.model = None
+        self.tokenizer = None
+        self.backend: Optional[str] = None
+        self.speculative: Optional[SpeculativeDecoder] = None
+        self.prompt_builder: Optional[PromptBuilder] = None
+        self.prefix_cache = PrefixCache(int(config["kv_cache_mb"] * 1024 * 1024))
+        self.status = STATUS_NOT_LOADED
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        self.requests_served = 0
+        self._load_lock = threading.Lock()
+        self._generate_lock = threading.Lock()
+        self._ready = threading.Event()
+
+        if not config["enabled"]:
+            self.status = STATUS_DISABLED
+            self._ready.set()
+
+    def load(self):
+        """Load the model with the configured backend (no-op if already loaded or failed)"""
+        with self._load_lock:
+            if self.status in (STATUS_READY, STATUS_ERROR, STATUS_DISABLED):
+                return
+
+            self.status = STATUS_LOADING
+            start = time.perf_counter()
+            try:
+                self.model, self.tokenizer, self.backend = load_model(self.config)
+                self.prompt_builder = PromptBuilder(
+                    self.tokenizer,
+                    SYSTEM_PROMPT,
+                    max_seq_length=self.config["max_seq_length"],
+                    max_new_tokens=self.config["max_new_tokens"],
+                )
+                self.load_seconds = time.perf_counter() - start
+                self.loaded_at = time.time()
+                self._load_draft()
+                self._prefill_system_prefix()
+                self.status = STATUS_READY
+                print(f"Model loaded on {self.backend} in {self.load_seconds:.1f}s")
+            except Exception as e:
+                self.error = str(e)
+                self.status = STATUS_ERROR
+                print(f"Error loading model: {e}")
+            finally:
+                self._ready.set()
+
+    def _load_draft(self):
+        """Load the speculative-decoding draft model; the engine works without it"""
+        if not self.config["draft_model"]:
+            return
+        try:
+            draft = load_draft(self.config, self.backend, self.model.device)
+            target_vocab = self.model.get_output_embeddings().weight.shape[0]
+            draft_vocab = draft.get_output_embeddings().weight.shape[0]
+            if draft_vocab != target_vocab:
+                raise ValueError(f"draft vocabulary ({draft_vocab}) differs from the model's ({target_vocab})")
+            self.speculative = SpeculativeDecoder(self.model, draft, self.config["num_draft_tokens"])
+        except Exception as e:
+            print(f"Error loading draft model, speculative decoding disabled: {e}")
+
+    def _prefill_system_prefix(self):
+        """Compute the KV cache of the system prompt once, shared by every new chat"""
+        if not self.prefix_cache.enabled:
+            return
+        try:
+            import torch
+            from transformers import DynamicCache
+
+            prefix = self.prompt_builder.system_block
+            ids = self.tokenizer(prefix, return_tensors="pt", add_special_tokens=False)["input_ids"]
+            cache = DynamicCache()
+            with torch.no_grad():
+                self.model(input_ids=ids.to(self.model.device), past_key_values=cache, use_cache=True)
+            self.prefix_cache.set_system_prefix(ids[0].tolist(), cache)
+        except Exception as e:
+            print(f"Error caching system prompt prefix: {e}")
+
+    def wait_until_loaded(self, timeout: Optional[float] = None) -> bool:
+        """Block until loading finished (successfully or not)"""
+        self._ready.wait(timeout)
+        return self.status == STATUS_READY
+
+    @property
+    def is_ready(self) -> bool:
+        return self.status == STATUS_READY
+
+    def build_prompt(self, messages: List[Dict], max_new_tokens: Optional[int] = None) -> str:
+        """Render the conversation with the chat template, trimmed to the context window"""
+        return self.prompt_builder.build(messages, max_new_tokens)[0]
+
+    def _generation_kwargs(self, **overrides) -> Dict:
+        temperature = overrides.get("temperature", self.config["temperature"])
+        kwargs = {
+            "max_new_tokens": overrides.get("max_new_tokens", self.config["max_new_tokens"]),
+            "do_sample": temperature > 0,
+            "pad_token_id": self.tokenizer.pad_token_id,
+        }
+        if temperature > 0:
+            kwargs["temperature"] = temperature
+            kwargs["top_p"] = overrides.get("top_p", self.config["top_p"])
+        return kwargs
+
+    def stream(self, messages: List[Dict], stats: Optional[Dict] = None, **overrides) -> Iterator[str]:
+        """
+        Generate the assistant reply, yielding text as tokens are produced
+
+        If a ``stats`` dict is given it is filled with prompt_tokens,
+        completion_tokens, ttft_seconds (time to first token), total_seconds and
+        tokens_per_second (decode rate after the first token).
+        """
+        import torch
+        from transformers import TextIteratorStreamer
+
+        if not self.is_ready:
+            raise RuntimeError(f"Model is not ready (status: {self.status})")
+
+        start = time.perf_counter()
+        prompt = self.build_prompt(messages, overrides.get("max_new_tokens"))
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        prompt_tokens = inputs["input_ids"].shape[1]
+
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        result = {}
+
+        def _run():
+            try:
+                with self._generate_lock, torch.no_grad():
+                    result["output"] = self.model.generate(
+                        **inputs, streamer=streamer, **self._generation_kwargs(**overrides)
+                    )
+            except Exception as e:
+                result["error"] = e
+                streamer.end()
+
+        thread = threading.Thread(target=_run, name="psychai-generate", daemon=True)
+        thread.start()
+
+        ttft = None
+        for text in streamer:
+            if not text:
+                continue
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            yield text
+
+        thread.join()
+        if "error" in result:
+            raise result["error"]
+
+        self.requests_served += 1
+        if stats is not None:
+            total = time.perf_counter() - start
+            completion_tokens = result["output"].shape[1] - prompt_tokens
+            decode_seconds = total - (ttft or total)
+            stats.update({
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "ttft_seconds": ttft,
+                "total_seconds": total,
+                "tokens_per_second": (
+                    (completion_tokens - 1) / decode_seconds if completion_tokens > 1 and decode_seconds > 0 else None
+                ),
+            })
+
+    def generate(self, messages: List[Dict], stats: Optional[Dict] = None, **overrides) -> str:
+        """Generate the full assistant reply for a conversation"""
+        return "".join(self.stream(messages, stats=stats, **overrides)).strip()
+
+    def generate_batch(self, prompts: List[str], on_text: Callable[[int, str], None],
+                       cache_key: Optional[str] = None, **overrides) -> List[Dict]:
+        """
+        Generate replies for several rendered prompts in one padded forward pass
+
+        Text for row ``i`` is delivered through ``on_text(i, text)`` as it is
+        decoded. Returns per-row stats (prompt_tokens, cached_prompt_tokens,
+        completion_tokens, ttft_seconds, total_seconds, tokens_per_second).
+
+        A single prompt with a ``cache_key`` (the chat it belongs to) reuses
+        the KV cache of that chat's previous turn, or of the system prompt,
+        and only prefills the tokens that are new. A single prompt is also
+        decoded speculatively when a draft model is loaded; its stats then
+        include a ``speculative`` dict (acceptance rate, speedup estimate).
+        """
+        import torch
+
+        if not self.is_ready:
+            raise RuntimeError(f"Model is not ready (status: {self.status})")
+
+        start = time.perf_counter()
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.model.device)
+        prompt_tokens = inputs["attention_mask"].sum(dim=1).tolist()
+
+        cache, cached_tokens = None, 0
+        use_cache = cache_key is not None and len(prompts) == 1 and self.prefix_cache.enabled
+        if use_cache:
+            from transformers import DynamicCache
+
+            cache, cached_tokens = self.prefix_cache.take(cache_key, inputs["input_ids"][0].tolist())
+            if cache is None:
+                cache = DynamicCache()
+
+        eos_ids = set(_as_list(self.tokenizer.eos_token_id))
+        eos_ids.update(_as_list(getattr(self.model.generation_config, "eos_token_id", None)))
+        streamer = _BatchTextStreamer(self.tokenizer, len(prompts), on_text, eos_ids)
+        generation_kwargs = self._generation_kwargs(**overrides)
+        if use_cache:
+            generation_kwargs["past_key_values"] = cache
+        speculative_stats = None
+        with self._generate_lock, torch.no_grad():
+            if self.speculative is not None and len(prompts) == 1:
+                token_ids, speculative_stats = self.speculative.generate(
+                    inputs["input_ids"],
+                    generation_kwargs["max_new_tokens"],
+                    eos_ids,
+                    streamer=streamer,
+                    temperature=generation_kwargs.get("temperature", 0.0),
+                    top_p=generation_kwargs.get("top_p", 1.0),
+                    top_k=getattr(self.model.generation_config, "top_k", None) or 0,
+                    past_key_values=cache,
+                    cached_tokens=cached_tokens,
+                )
+                sequence = inputs["input_ids"][0].tolist() + token_ids
+            else:
+                output = self.model.generate(**inputs, streamer=streamer, **generation_kwargs)
+                sequence = output[0].tolist()
+
+        if use_cache:
+            # The cache now covers the prompt and the reply (all but its last token)
+            self.prefix_cache.put(cache_key, sequence[:cache.get_seq_length()], cache)
+
+        self.requests_served += len(prompts)
+        total = time.perf_counter() - start
+        stats = []
+        for i in range(len(prompts)):
+            completion_tokens = streamer.token_counts[i]
+            ttft = streamer.first_text_at[i] - start if streamer.first_text_at[i] else None
+            decode_seconds = total - (ttft or total)
+            stats.append({
+                "prompt_tokens": prompt_tokens[i],
+                "cached_prompt_tokens": cached_tokens,
+                "completion_tokens": completion_tokens,
+                "ttft_seconds": ttft,
+                "total_seconds": total,
+                "tokens_per_second": (
+                    (completion_tokens - 1) / decode_seconds if completion_tokens > 1 and decode_seconds > 0 else None
+                ),
+            })
+        if speculative_stats is not None:
+            stats[0]["speculative"] = speculative_stats
+        return stats
+
+    def memory_footprint(self) -> Dict:
+        """Report model, accelerator and process memory in bytes"""
+        footprint = {
+            "model_bytes": None,
+            "cuda_allocated_bytes": None,
+            "cuda_reserved_bytes": None,
+            # ru_maxrss is reported in kilobytes on Linux
+            "process_peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        }
+        if self.model is not None:
+            try:
+                footprint["model_bytes"] = self.model.get_memory_footprint()
+            except Exception:
+                pass
+            try:
+                import torch
+                if torch.cuda.is_available():
+                    footprint["cuda_allocated_bytes"] = sum(
+                        torch.cuda.memory_allocated(i) for i in range(torch.cuda.device_count())
+                    )
+                    footprint["cuda_reserved_bytes"] = sum(
+                        torch.cuda.memory_reserved(i) for i in range(torch.cuda.device_count())
+                    )
+            except Exception:
+                pass
+        return footprint
+
+    def health(self) -> Dict:
+        """Snapshot of engine state that never triggers a load"""
+        return {
+            "status": self.status,
+            "error": self.error,
+            "base_model": self.config["base_model"],
+            "adapter": self.config["adapter"],
+            "merged_model": self.config["merged_model"] or None,
+            "backend": self.backend,
+            "device": str(self.model.device) if self.model is not None else None,
+            "load_seconds": self.load_seconds,
+            "uptime_seconds": time.time() - self.loaded_at if self.loaded_at else None,
+            "requests_served": self.requests_served,
+            "prompt_builder": self.prompt_builder.metrics() if self.prompt_builder is not None else None,
+            "prefix_cache": self.prefix_cache.metrics(),
+            "speculative": self.speculative.metrics() if self.speculative is not None else None,
+        }
+
+
+class _BatchTextStreamer:
+    """
+    Streamer for batched generate() calls
+
+    transformers' TextIteratorStreamer only supports a batch of one; this one
+    receives the new token of every row at each step and decodes each row
+    incrementally, holding back incomplete multi-byte characters.
+    """
+
+    def __init__(self, tokenizer, batch_size: int, on_text: Callable[[int, str], None], eos_ids: set):
+        self.tokenizer = tokenizer
+        self.on_text = on_text
+        self.eos_ids = eos_ids
+        self.skipped_prompt = False
+        self.token_cache = [[] for _ in range(batch_size)]
+        self.emitted = [0] * batch_size
+        self.token_counts = [0] * batch_size
+        self.finished = [False] * batch_size
+        self.first_text_at: List[Optional[float]] = [None] * batch_size
+
+    def put(self, value):
+        # The first call carries the (padded) prompt ids
+        if not self.skipped_prompt:
+            self.skipped_prompt = True
+            return
+
+        for i, token_id in enumerate(value.reshape(-1).tolist()):
+            if self.finished[i]:
+                continue
+            self.token_counts[i] += 1
+            if token_id in self.eos_ids:
+                self.finished[i] = True
+                self._flush(i)
+                continue
+            self.token_cache[i].append(token_id)
+            text = self.tokenizer.decode(self.token_cache[i], skip_special_tokens=True)
+            if text.endswith("\n"):
+                self._emit(i, text[self.emitted[i]:])
+                self.token_cache[i] = []
+                self.emitted[i] = 0
+            elif not text.endswith("\ufffd"):
+                self._emit(i, text[self.emitted[i]:])
+                self.emitted[i] = len(text)
+
+    def end(self):
+        for i in range(len(self.token_cache)):
+            self._flush(i)
+
+    def _flush(self, i: int):
+        if self.token_cache[i]:
+            text = self.tokenizer.decode(self.token_cache[i], skip_special_tokens=True)
+            self._emit(i, text[self.emitted[i]:])
+            self.token_cache[i] = []
+            self.emitted[i] = 0
+
+    def _emit(self, i: int, text: str):
+        if not text:
+            return
+        if self.first_text_at[i] is None:
+            self.first_text_at[i] = time.perf_counter()
+        self.on_text(i, text)
+
+
+def _as_list(value) -> List:
+    if value is None:
+        return []
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+# Process-wide engine (singleton pattern, shared by all sessions)
+_engine: Optional[InferenceEngine] = None
+_engine_lock = threading.Lock()
+_load_thread: Optional[threading.Thread] = None
+
+
+def get_inference_engine() -> InferenceEngine:
+    """Get or create the process-wide engine (does not load the model)"""
+    global _engine
+
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = InferenceEngine(get_model_config())
+
+    return _engine
+
+
+def start_model_loading() -> InferenceEngine:
+    """
+    Kick off model loading in a background thread so page renders are not blocked
+
+    The same thread then runs warm_up(), so the first user does not pay for it.
+    """
+    global _load_thread
+
+    engine = get_inference_engine()
+    if engine.status == STATUS_NOT_LOADED:
+        with _engine_lock:
+            if _load_thread is None:
+                _load_thread = threading.Thread(target=_load_and_warm_up, args=(engine,),
+                                                name="psychai-model-loader", daemon=True)
+                _load_thread.start()
+
+    return engine
+
+
+def _load_and_warm_up(engine: InferenceEngine):
+    engine.load()
+    if engine.status == STATUS_READY:
+        warm_up(timeout=0)
+
+
+def warm_up(timeout: Optional[float] = None) -> bool:
+    """
+    Load the model (if needed) and run one short generation so CUDA kernels,
+    allocator pools and the chat template are initialized before the first user
+    """
+    engine = start_model_loading()
+    if not engine.wait_until_loaded(timeout):
+        return False
+
+    start = time.perf_counter()
+    try:
+        engine.generate([{"role": "user", "content": "Hi"}], max_new_tokens=8, temperature=0)
+    except Exception as e:
+        print(f"Model warm-up generation failed: {e}")
+        return False
+    print(f"Model warm-up generation took {time.perf_counter() - start:.2f}s")
+    return True
+
+
+def model_health() -> Dict:
+    """Engine health plus memory footprint, safe to call on every rerun"""
+    engine = get_inference_engine()
+    health = engine.health()
+    health["memory"] = engine.memory_footprint()
+    return health
@@ -0,0 +1,291 @@
+"""
+Batching inference server for PsychAI
+Queues generation requests from every Streamlit session and runs them in dynamic, run-to-completion batches
+"""
+
+import queue
+import threading
+import time
+from collections import Counter, deque
+from typing import Optional, Dict, List, Iterator
+
+from .inference import InferenceEngine, start_model_loading, _get_setting
+
+# Sentinel pushed onto a request's chunk queue when generation is finished
+_DONE = object()
+
+
+class InferenceRequest:
+    """
+    Handle for one queued generation
+
+    Iterate over it to receive text chunks as they are produced, or call
+    result() to block for the full reply. Per-request stats (queue wait,
+    batch size, time to first token, tokens/sec) are in ``stats`` once done.
+    """
+
+    def __init__(self, prompt: str, prompt_tokens: int, overrides: Dict, cache_key: Optional[str] = None):
+        self.prompt = prompt
+        self.prompt_tokens = prompt_tokens
+        self.cache_key = cache_key
+        self.overrides = overrides
+        self.enqueued_at = time.perf_counter()
+        self.started_at: Optional[float] = None
+        self.stats: Dict = {}
+        self.error: Optional[BaseException] = None
+        self._chunks: "queue.Queue" = queue.Queue()
+        self._text: List[str] = []
+        self._done = threading.Event()
+
+    @property
+    def batch_key(self) -> tuple:
+        # Only requests with identical generation settings can share a generate() call
+        return tuple(sorted(self.overrides.items()))
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            item = self._chunks.get()
+            if item is _DONE:
+                break
+            yield item
+        if self.error is not None:
+            raise self.error
+
+    def result(self, timeout: Optional[float] = None) -> str:
+        if not self._done.wait(timeout):
+            raise TimeoutError("Inference request timed out")
+        if self.error is not None:
+            raise self.error
+        return "".join(self._text)
+
+    def _push(self, text: str):
+        self._text.append(text)
+        self._chunks.put(text)
+
+    def _finish(self, stats: Optional[Dict] = None, error: Optional[BaseException] = None):
+        if stats:
+            self.stats.update(stats)
+        self.error = error
+        self._done.set()
+        self._chunks.put(_DONE)
+
+
+class InferenceServer:
+    """
+    In-process inference service shared by all sessions
+
+    A single worker thread owns the model. Requests are queued by every
+    session; the worker waits up to ``max_wait_ms`` after the oldest pending
+    request for others to arrive, then batches requests with similar prompt
+    lengths (within ``length_ratio`` of each other and under
+    ``max_batch_tokens`` padded tokens) so little compute is spent on padding.
+
+    Each batch runs to completion before the next one is formed: requests
+    are not admitted between decode steps, so one that arrives mid-batch
+    waits for the whole generation (dynamic, not continuous, batching).
+    """
+
+    def __init__(self, engine: InferenceEngine, max_batch_size: int = 8, max_wait_ms: float = 25,
+                 max_batch_tokens: int = 16384, length_ratio: float = 1.5):
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_tokens = max_batch_tokens
+        self.length_ratio = length_ratio
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._pending: List[InferenceRequest] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+        # Metrics
+        self._metrics_lock = threading.Lock()
+        self.batch_size_histogram: Counter = Counter()
+        self.wait_times: deque = deque(maxlen=1000)
+        self.requests_total = 0
+        self.requests_failed = 0
+        self.batches_total = 0
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="psychai-inference-server", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def submit(self, messages: List[Dict], cache_key: Optional[str] = None, **overrides) -> InferenceRequest:
+        """
+        Queue a conversation for generation (the model must already be loaded)
+
+        ``cache_key`` identifies the chat so its next turn can reuse this
+        turn's KV cache (only when the request runs in a batch of one).
+        """
+        if not self.engine.is_ready:
+            raise RuntimeError(f"Model is not ready (status: {self.engine.status})")
+
+        # Prompt rendering/tokenization happens on the caller's thread, not the worker's
+        prompt, prompt_tokens = self.engine.prompt_builder.build(messages, overrides.get("max_new_tokens"))
+
+        request = InferenceRequest(prompt, prompt_tokens, overrides, cache_key)
+        self.start()
+        self._queue.put(request)
+        return request
+
+    # ---- worker ----
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self._collect():
+                continue
+
+            batch = self._take_batch()
+            if batch:
+                self._execute(batch)
+
+    def _collect(self) -> bool:
+        """Move queued requests into the pending list, waiting out the batching window"""
+        if not self._pending:
+            try:
+                self._pending.append(self._queue.get(timeout=0.5))
+            except queue.Empty:
+                return False
+
+        deadline = self._pending[0].enqueued_at + self.max_wait
+        while True:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    self._pending.append(self._queue.get(timeout=remaining))
+                else:
+                    self._pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return True
+
+    def _take_batch(self) -> List[InferenceRequest]:
+        """Pick the oldest request plus compatible, similar-length requests"""
+        anchor = self._pending[0]
+        low = anchor.prompt_tokens / self.length_ratio
+        high = anchor.prompt_tokens * self.length_ratio
+
+        candidates = [
+            r for r in self._pending
+            if r.batch_key == anchor.batch_key and low <= r.prompt_tokens <= high
+        ]
+        # Closest lengths first so padding stays small
+        candidates.sort(key=lambda r: abs(r.prompt_tokens - anchor.prompt_tokens))
+
+        batch = []
+        longest = 0
+        for request in candidates:
+            longest_if_added = max(longest, request.prompt_tokens)
+            if batch and longest_if_added * (len(batch) + 1) > self.max_batch_tokens:
+                break
+            batch.append(request)
+            longest = longest_if_added
+            if len(batch) >= self.max_batch_size:
+                break
+
+        taken = set(map(id, batch))
+        self._pending = [r for r in self._pending if id(r) not in taken]
+        return batch
+
+    def _execute(self, batch: List[InferenceRequest]):
+        """Generate for ``batch`` in one call; nothing joins it until every row is finished"""
+        started_at = time.perf_counter()
+        for request in batch:
+            request.started_at = started_at
+
+        with self._metrics_lock:
+            self.batches_total += 1
+            self.requests_total += len(batch)
+            self.batch_size_histogram[len(batch)] += 1
+            self.wait_times.extend(started_at - r.enqueued_at for r in batch)
+
+        try:
+            stats = self.engine.generate_batch(
+                [r.prompt for r in batch],
+                lambda i, text: batch[i]._push(text),
+                cache_key=batch[0].cache_key if len(batch) == 1 else None,
+                **batch[0].overrides,
+            )
+        except Exception as e:
+            print(f"Error running inference batch: {e}")
+            with self._metrics_lock:
+                self.requests_failed += len(batch)
+            for request in batch:
+                request._finish(error=e)
+            return
+
+        for request, row_stats in zip(batch, stats):
+            row_stats["wait_seconds"] = started_at - request.enqueued_at
+            row_stats["batch_size"] = len(batch)
+            # Latencies as the user sees them, including time spent queued
+            row_stats["total_seconds"] += row_stats["wait_seconds"]
+            if row_stats.get("ttft_seconds") is not None:
+                row_stats["ttft_seconds"] += row_stats["wait_seconds"]
+            request._finish(row_stats)
+
+    # ---- metrics ----
+
+    def metrics(self) -> Dict:
+        """Queue depth, batch-size histogram and request wait-time percentiles"""
+        with self._metrics_lock:
+            waits = sorted(self.wait_times)
+            histogram = dict(sorted(self.batch_size_histogram.items()))
+            requests_total = self.requests_total
+            requests_failed = self.requests_failed
+            batches_total = self.batches_total
+
+        def percentile(p: float) -> Optional[float]:
+            if not waits:
+                return None
+            return waits[min(len(waits) - 1, int(p * len(waits)))]
+
+        return {
+            "queue_depth": self._queue.qsize() + len(self._pending),
+            "requests_total": requests_total,
+            "requests_failed": requests_failed,
+            "batches_total": batches_total,
+            "mean_batch_size": requests_total / batches_total if batches_total else None,
+            "batch_size_histogram": histogram,
+            "wait_seconds": {
+                "mean": sum(waits) / len(waits) if waits else None,
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "max": waits[-1] if waits else None,
+            },
+        }
+
+
+# Process-wide server (singleton pattern, shared by all sessions)
+_server: Optional[InferenceServer] = None
+_server_lock = threading.Lock()
+
+
+def get_inference_server() -> InferenceServer:
+    """Get or create the process-wide server and make sure the model is loading"""
+    global _server
+
+    if _server is None:
+        with _server_lock:
+            if _server is None:
+                _server = InferenceServer(
+                    start_model_loading(),
+                    max_batch_size=int(_get_setting("max_batch_size", 8)),
+                    max_wait_ms=float(_get_setting("max_batch_wait_ms", 25)),
+                    max_batch_tokens=int(_get_setting("max_batch_tokens", 16384)),
+                )
+
+    return _server
+
+
+def server_metrics() -> Dict:
+    """Metrics of the process-wide server"""
+    return get_inference_server().metrics()
@@ -0,0 +1,178 @@
+"""
+Prefix (KV) cache for PsychAI
+Keeps the attention cache of each chat's last turn so the next turn only prefills what is new
+"""
+
+import copy
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple
+
+class _Entry:
+    def __init__(self, token_ids: List[int], cache, nbytes: int):
+        self.token_ids = token_ids
+        self.cache = cache
+        self.nbytes = nbytes
+
+
+class PrefixCache:
+    """
+    LRU store of model KV caches keyed by chat, bounded by memory
+
+    Each entry remembers the token ids its cache covers. On lookup the
+    longest common prefix with the new prompt is found and the cache is
+    cropped to it, so reuse is decided by the tokens themselves: a key only
+    picks the candidate, it can never make the model attend to another
+    conversation's text.
+
+    Chat entries are taken out on lookup (the request extends them in place)
+    and put back after generation. The system prompt entry is pinned, never
+    evicted, and copied on use so every session can start from it.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._system: Optional[_Entry] = None
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.lookups = 0
+        self.chat_hits = 0
+        self.system_hits = 0
+        self.misses = 0
+        self.prefill_tokens_total = 0
+        self.prefill_tokens_saved = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def set_system_prefix(self, token_ids: List[int], cache):
+        """Pin the cache of the shared system prompt prefix"""
+        with self._lock:
+            if self._system is not None:
+                self._bytes -= self._system.nbytes
+            self._system = _Entry(list(token_ids), cache, cache_nbytes(cache))
+            self._bytes += self._system.nbytes
+
+    def take(self, key: Optional[str], token_ids: List[int]) -> Tuple[Optional[object], int]:
+        """
+        Find a cache for a prompt of ``token_ids``
+
+        Returns:
+            (cache, cached_tokens): a cache covering the first ``cached_tokens``
+            tokens of the prompt that the caller owns, or (None, 0) on a miss.
+            At least one prompt token is always left to prefill.
+        """
+        limit = len(token_ids) - 1
+        with self._lock:
+            self.lookups += 1
+            self.prefill_tokens_total += len(token_ids)
+            entry = self._entries.pop(key, None) if key is not None else None
+            if entry is not None:
+                self._bytes -= entry.nbytes
+            system = self._system
+
+        if entry is not None:
+            length = min(_common_prefix(entry.token_ids, token_ids), limit)
+            if system is None or length >= len(system.token_ids):
+                if length > 0:
+                    crop_cache(entry.cache, length)
+                    self._record(chat=True, saved=length)
+                    return entry.cache, length
+
+        if system is not None:
+            length = min(_common_prefix(system.token_ids, token_ids), limit)
+            if length > 0:
+                cache = copy.deepcopy(system.cache)
+                crop_cache(cache, length)
+                self._record(chat=False, saved=length)
+                return cache, length
+
+        with self._lock:
+            self.misses += 1
+        return None, 0
+
+    def put(self, key: str, token_ids: List[int], cache):
+        """Store the cache covering ``token_ids`` for ``key``, evicting least recently used chats"""
+        nbytes = cache_nbytes(cache)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            if nbytes > self.max_bytes - self._pinned_bytes():
+                return  # larger than the whole budget
+            self._entries[key] = _Entry(list(token_ids), cache, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def discard(self, key: str):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry.nbytes
+
+    def metrics(self) -> Dict:
+        """Hit rates, prefill tokens saved and memory use"""
+        with self._lock:
+            hits = self.chat_hits + self.system_hits
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "lookups": self.lookups,
+                "hit_rate": hits / self.lookups if self.lookups else None,
+                "chat_hits": self.chat_hits,
+                "system_hits": self.system_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "prefill_tokens_total": self.prefill_tokens_total,
+                "prefill_tokens_saved": self.prefill_tokens_saved,
+                "prefill_saved_ratio": (
+                    self.prefill_tokens_saved / self.prefill_tokens_total if self.prefill_tokens_total else None
+                ),
+            }
+
+    def _pinned_bytes(self) -> int:
+        return self._system.nbytes if self._system is not None else 0
+
+    def _record(self, chat: bool, saved: int):
+        with self._lock:
+            if chat:
+                self.chat_hits += 1
+            else:
+                self.system_hits += 1
+            self.prefill_tokens_saved += saved
+
+
+def cache_nbytes(cache) -> int:
+    """Bytes held by the key/value tensors of a transformers cache"""
+    tensors = []
+    if hasattr(cache, "layers"):
+        for layer in cache.layers:
+            tensors += [getattr(layer, "keys", None), getattr(layer, "values", None)]
+    else:
+        tensors += list(getattr(cache, "key_cache", [])) + list(getattr(cache, "value_cache", []))
+    return sum(t.numel() * t.element_size() for t in tensors if t is not None and hasattr(t, "numel"))
+
+
+def _common_prefix(a: List[int], b: List[int]) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def crop_cache(cache, length: int):
+    """Shorten a cache to its first ``length`` tokens"""
+    # Negative crop (drop N tokens) works across transformers versions
+    excess = cache.get_seq_length() - length
+    if excess > 0:
+        cache.crop(-excess)
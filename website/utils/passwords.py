@@ -0,0 +1,217 @@
+"""
+Password hashing for PsychAI
+Self-describing password hashes computed on a bounded worker pool
+"""
+
+import os
+import hmac
+import hashlib
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Tuple
+
+import streamlit as st
+
+# Rows created before hashes carried their parameters: bare hex PBKDF2-SHA256
+LEGACY_PBKDF2_ITERATIONS = 100000
+
+
+def _get_setting(key: str, default=None):
+    """Read a setting from PSYCHAI_<KEY> or the [passwords] section of secrets.toml"""
+    env_value = os.getenv(f"PSYCHAI_{key.upper()}")
+    if env_value is not None:
+        return env_value
+    try:
+        return st.secrets.get("passwords", {}).get(key, default)
+    except Exception:
+        return default
+
+
+def get_password_config() -> Dict:
+    """Algorithm and cost parameters for new hashes"""
+    return {
+        "algorithm": str(_get_setting("password_algorithm", "scrypt")).lower(),  # "scrypt" | "pbkdf2_sha256" | "argon2"
+        "scrypt_n": int(_get_setting("scrypt_n", 2 ** 14)),
+        "scrypt_r": int(_get_setting("scrypt_r", 8)),
+        "scrypt_p": int(_get_setting("scrypt_p", 1)),
+        "pbkdf2_iterations": int(_get_setting("pbkdf2_iterations", 600000)),
+        "workers": int(_get_setting("password_workers", 0)) or os.cpu_count() or 1,  # 0 = one per core
+        "max_pending": int(_get_setting("password_max_pending", 64)),
+        "timeout_seconds": float(_get_setting("password_timeout_seconds", 10)),
+    }
+
+
+# ---- hash formats ----
+#
+#   scrypt$<n>$<r>$<p>$<salt>$<hex digest>
+#   pbkdf2_sha256$<iterations>$<salt>$<hex digest>
+#   $argon2id$...                      (argon2-cffi's own encoding)
+#   <hex digest>                       legacy PBKDF2, salt in the users.salt column
+
+def _scrypt(password: str, salt: str, n: int, r: int, p: int) -> str:
+    return hashlib.scrypt(
+        password.encode("utf-8"), salt=salt.encode("utf-8"), n=n, r=r, p=p,
+        maxmem=256 * r * (n + p + 2), dklen=32,
+    ).hex()
+
+
+def _pbkdf2(password: str, salt: str, iterations: int) -> str:
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt.encode("utf-8"), iterations).hex()
+
+
+def _argon2():
+    try:
+        from argon2 import PasswordHasher
+    except ImportError:
+        raise ImportError("password_algorithm = \"argon2\" needs argon2-cffi (pip install argon2-cffi)")
+    return PasswordHasher()
+
+
+def _hash(password: str, config: Dict) -> Tuple[str, str]:
+    algorithm = config["algorithm"]
+    salt = secrets.token_hex(16)
+    if algorithm == "scrypt":
+        n, r, p = config["scrypt_n"], config["scrypt_r"], config["scrypt_p"]
+        return f"scrypt${n}${r}${p}${salt}${_scrypt(password, salt, n, r, p)}", salt
+    if algorithm == "pbkdf2_sha256":
+        iterations = config["pbkdf2_iterations"]
+        return f"pbkdf2_sha256${iterations}${salt}${_pbkdf2(password, salt, iterations)}", salt
+    if algorithm == "argon2":
+        return _argon2().hash(password), ""
+    raise ValueError(f"Unknown password_algorithm: {algorithm}")
+
+
+def _verify(password: str, pwd_hash: str, salt: str) -> bool:
+    if not pwd_hash:
+        return False  # OAuth accounts have no password
+
+    if pwd_hash.startswith("$argon2"):
+        try:
+            return _argon2().verify(pwd_hash, password)
+        except Exception:
+            return False
+
+    parts = pwd_hash.split("$")
+    try:
+        if parts[0] == "scrypt" and len(parts) == 6:
+            n, r, p, salt, expected = int(parts[1]), int(parts[2]), int(parts[3]), parts[4], parts[5]
+            actual = _scrypt(password, salt, n, r, p)
+        elif parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+            iterations, salt, expected = int(parts[1]), parts[2], parts[3]
+            actual = _pbkdf2(password, salt, iterations)
+        elif len(parts) == 1:
+            expected = pwd_hash
+            actual = _pbkdf2(password, salt or "", LEGACY_PBKDF2_ITERATIONS)
+        else:
+            return False
+    except (ValueError, IndexError, OverflowError) as e:
+        # A malformed stored hash fails the login rather than raising out of it
+        print(f"Unreadable password hash: {e}")
+        return False
+
+    # Constant time, so response timing does not reveal how much of the hash matched
+    return hmac.compare_digest(actual, expected)
+
+
+def needs_rehash(pwd_hash: str, config: Optional[Dict] = None) -> bool:
+    """True if ``pwd_hash`` was made with a different algorithm or weaker parameters than configured"""
+    config = config or get_password_config()
+    if not pwd_hash:
+        return False
+
+    algorithm = config["algorithm"]
+    parts = pwd_hash.split("$")
+    try:
+        if algorithm == "scrypt":
+            return parts[0] != "scrypt" or len(parts) != 6 or (
+                (int(parts[1]), int(parts[2]), int(parts[3])) < (config["scrypt_n"], config["scrypt_r"], config["scrypt_p"])
+            )
+        if algorithm == "pbkdf2_sha256":
+            return parts[0] != "pbkdf2_sha256" or len(parts) != 4 or int(parts[1]) < config["pbkdf2_iterations"]
+    except (ValueError, IndexError):
+        return True  # unreadable parameters: replace it with a well-formed hash
+    if algorithm == "argon2":
+        try:
+            return not pwd_hash.startswith("$argon2") or _argon2().check_needs_rehash(pwd_hash)
+        except ImportError:
+            return False
+    return False
+
+
+# ---- worker pool ----
+
+class PasswordHasher:
+    """
+    Runs password hashing on a fixed pool of worker threads
+
+    hashlib releases the GIL while hashing, so ``workers`` hashes run in
+    parallel on separate cores while the Streamlit script threads only wait.
+    At most ``max_pending`` hashes are queued or running; beyond that callers
+    wait up to ``timeout_seconds`` for a slot and then get a TimeoutError,
+    so a login burst queues instead of oversubscribing the CPU. Background
+    rehashes never wait for a slot.
+    """
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self._pool = ThreadPoolExecutor(max_workers=config["workers"], thread_name_prefix="psychai-password")
+        self._slots = threading.BoundedSemaphore(config["max_pending"])
+
+    def _submit(self, fn, *args, blocking: bool = True):
+        if blocking:
+            acquired = self._slots.acquire(timeout=self.config["timeout_seconds"])
+        else:
+            acquired = self._slots.acquire(blocking=False)
+        if not acquired:
+            raise TimeoutError("Too many password checks in progress")
+        future = self._pool.submit(fn, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def hash(self, password: str) -> Tuple[str, str]:
+        """Hash a new password; returns (password_hash, salt) for the users table"""
+        return self._submit(_hash, password, self.config).result()
+
+    def verify(self, password: str, pwd_hash: str, salt: str = "") -> bool:
+        """Check a password against any supported hash format"""
+        return self._submit(_verify, password, pwd_hash, salt).result()
+
+    def rehash_later(self, password: str, on_done) -> bool:
+        """
+        Compute a fresh hash in the background and pass (password_hash, salt) to ``on_done``
+
+        The login has already succeeded, so when every slot is taken the
+        rehash is skipped (False) rather than waited for; the next login
+        tries again.
+        """
+        try:
+            future = self._submit(_hash, password, self.config, blocking=False)
+        except TimeoutError:
+            return False
+
+        def _callback(f):
+            if f.exception() is None:
+                on_done(*f.result())
+            else:
+                print(f"Error rehashing password: {f.exception()}")
+
+        future.add_done_callback(_callback)
+        return True
+
+
+# Process-wide hasher (singleton pattern, shared by all sessions)
+_hasher: Optional[PasswordHasher] = None
+_hasher_lock = threading.Lock()
+
+
+def get_password_hasher() -> PasswordHasher:
+    """Get or create the process-wide password hasher"""
+    global _hasher
+
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher(get_password_config())
+
+    return _hasher
@@ -0,0 +1,99 @@
+"""
+Startup and rerun profiling for PsychAI
+Per-page script execution times, and import-time breakdowns of the app's modules
+"""
+
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+# Set PSYCHAI_PROFILE=1 to print every rerun's execution time
+PROFILE_LOG = os.getenv("PSYCHAI_PROFILE", "").lower() in ("1", "true", "yes")
+
+_timings: Dict[str, deque] = defaultdict(lambda: deque(maxlen=1000))
+_first_run: Dict[str, float] = {}
+_timings_lock = threading.Lock()
+
+
+@contextmanager
+def profile_rerun(page: str):
+    """Time one execution of a page script (wrap the page's main())"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _timings_lock:
+            _first_run.setdefault(page, elapsed)
+            _timings[page].append(elapsed)
+        if PROFILE_LOG:
+            print(f"[profile] {page}: {elapsed * 1000:.1f} ms")
+
+
+def rerun_metrics() -> Dict[str, Dict]:
+    """Per page: reruns seen, first (cold) run and p50/p95/max of recent reruns, in ms"""
+    with _timings_lock:
+        snapshot = {page: sorted(times) for page, times in _timings.items()}
+        first = dict(_first_run)
+
+    def pct(values, q):
+        return values[min(len(values) - 1, int(q * len(values)))] * 1000
+
+    return {
+        page: {
+            "runs": len(times),
+            "first_ms": first[page] * 1000,
+            "p50_ms": pct(times, 0.5),
+            "p95_ms": pct(times, 0.95),
+            "max_ms": times[-1] * 1000,
+        }
+        for page, times in snapshot.items()
+    }
+
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_breakdown(module: str, top: int = 15, python: str = sys.executable) -> Tuple[float, List[Tuple[str, float, float]]]:
+    """
+    Import ``module`` in a fresh interpreter under ``-X importtime``
+
+    Returns:
+        (total seconds, [(module, self seconds, cumulative seconds)] for the
+        ``top`` slowest top-level imports of ``module``'s dependency tree)
+    """
+    website_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        cwd=website_dir, capture_output=True, text=True,
+        env=dict(os.environ, PYTHONPATH=website_dir),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, len(indent) // 2, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+
+    total = rows[-1][3] if rows else 0.0
+    # Depth 1 = imported directly by the interpreter bootstrap or ``module``'s package chain
+    shallow = [(name, self_s, cum_s) for name, depth, self_s, cum_s in rows if depth <= 2]
+    return total, sorted(shallow, key=lambda row: row[2], reverse=True)[:top]
+
+
+if __name__ == "__main__":
+    # python -m utils.profiling utils.auth utils.chat_handler
+    for name in sys.argv[1:] or ["utils.auth"]:
+        total, rows = import_breakdown(name)
+        print(f"{name}: {total * 1000:.0f} ms")
+        for mod, self_s, cum_s in rows:
+            print(f"  {mod:<40} {cum_s * 1000:>8.1f} ms  (self {self_s * 1000:.1f})")
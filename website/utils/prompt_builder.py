@@ -0,0 +1,210 @@
+"""
+Prompt builder for PsychAI
+Renders conversations with the tokenizer's chat template within the model's context window
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple, Callable
+
+# summarizer(previous_summary, newly_dropped_messages) -> updated summary
+Summarizer = Callable[[Optional[str], List[Dict]], str]
+
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+
+
+class PromptBuilder:
+    """
+    Builds generation prompts that fit in ``max_seq_length`` tokens
+
+    The system prompt and the latest messages are always kept; older turns
+    are dropped first (a user message together with the replies after it) so
+    the prompt plus ``max_new_tokens`` never exceeds the window the model was
+    trained with. Token counts are cached per message, so each turn only
+    tokenizes the message that is new.
+
+    If a ``summarizer`` is set, dropped turns are folded into a rolling
+    summary appended to the system prompt, using at most
+    ``summary_max_tokens`` of the budget.
+    """
+
+    def __init__(self, tokenizer, system_prompt: str, max_seq_length: int = 2048,
+                 max_new_tokens: int = 512, summarizer: Optional[Summarizer] = None,
+                 summary_max_tokens: int = 256, cache_size: int = 50000):
+        self.tokenizer = tokenizer
+        self.system_prompt = system_prompt
+        self.max_seq_length = max_seq_length
+        self.max_new_tokens = max_new_tokens
+        self.summarizer = summarizer
+        self.summary_max_tokens = summary_max_tokens
+        self.cache_size = cache_size
+
+        self._lock = threading.Lock()
+        self._counts: "OrderedDict" = OrderedDict()
+        self._summaries: "OrderedDict" = OrderedDict()
+        self._overheads: Dict[str, int] = {}
+
+        # Fixed parts of every prompt: the system block and the generation prompt
+        self.system_block = self._render([self._system_message()], add_generation_prompt=False)
+        with_generation = self._render([self._system_message()], add_generation_prompt=True)
+        self.system_tokens = self._tokenize(self.system_block)
+        self.generation_tokens = self._tokenize(with_generation[len(self.system_block):])
+
+        # Metrics
+        self.count_hits = 0
+        self.count_misses = 0
+        self.truncated_prompts = 0
+        self.dropped_messages = 0
+
+    # ---- public ----
+
+    def build(self, messages: List[Dict], max_new_tokens: Optional[int] = None) -> Tuple[str, int]:
+        """
+        Render ``messages`` (oldest first) as a prompt
+
+        Returns:
+            (prompt, prompt_tokens); prompt_tokens is computed from the cached
+            per-message counts, without tokenizing the whole prompt
+        """
+        messages = [m for m in messages if m["role"] != "system"]
+        budget = self.max_seq_length - (self.max_new_tokens if max_new_tokens is None else max_new_tokens)
+        budget -= self.system_tokens + self.generation_tokens
+
+        counts = [self.count(m) for m in messages]
+        keep_from = self._fit(messages, counts, budget)
+
+        summary = None
+        if keep_from and self.summarizer is not None:
+            keep_from = self._fit(messages, counts, budget - self.summary_max_tokens)
+            summary = self._summary(messages[:keep_from])
+
+        kept = messages[keep_from:]
+        used = sum(counts[keep_from:])
+        if kept and used > budget:
+            # Even the latest message alone is too long: keep its end
+            kept[-1] = self._truncate(kept[-1], counts[-1] - (used - budget))
+            used = budget
+
+        system = self._system_message(summary)
+        prompt_tokens = self.system_tokens + self.generation_tokens + used
+        if summary:
+            prompt_tokens += self._tokenize(system["content"]) - self._tokenize(self.system_prompt)
+
+        with self._lock:
+            self.dropped_messages += keep_from
+            if keep_from:
+                self.truncated_prompts += 1
+
+        chat = [system] + [{"role": m["role"], "content": m["content"]} for m in kept]
+        return self._render(chat, add_generation_prompt=True), prompt_tokens
+
+    def count(self, message: Dict) -> int:
+        """Tokens ``message`` adds to a prompt, template markup included (cached)"""
+        key = message.get("id") or (message["role"], message["content"])
+        with self._lock:
+            if key in self._counts:
+                self._counts.move_to_end(key)
+                self.count_hits += 1
+                return self._counts[key]
+            self.count_misses += 1
+
+        tokens = self._tokenize(message["content"]) + self._overhead(message["role"])
+        with self._lock:
+            self._counts[key] = tokens
+            while len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return tokens
+
+    def metrics(self) -> Dict:
+        """Token-count cache hit rate and how often history had to be trimmed"""
+        with self._lock:
+            lookups = self.count_hits + self.count_misses
+            return {
+                "cached_counts": len(self._counts),
+                "count_hit_rate": self.count_hits / lookups if lookups else None,
+                "truncated_prompts": self.truncated_prompts,
+                "dropped_messages": self.dropped_messages,
+                "cached_summaries": len(self._summaries),
+            }
+
+    # ---- internals ----
+
+    def _fit(self, messages: List[Dict], counts: List[int], budget: int) -> int:
+        """Index of the first message to keep so the rest fits in ``budget``"""
+        keep_from = len(messages)
+        used = 0
+        for i in range(len(messages) - 1, -1, -1):
+            used += counts[i]
+            if used > budget:
+                break
+            # Only cut in front of a user message, so turns stay whole
+            if messages[i]["role"] == "user":
+                keep_from = i
+
+        # Always keep the latest message, even if it has to be truncated
+        return min(keep_from, len(messages) - 1) if messages else 0
+
+    def _summary(self, dropped: List[Dict]) -> Optional[str]:
+        """Rolling summary of ``dropped``, extending the longest summary already made"""
+        keys = [m.get("id") or (m["role"], m["content"]) for m in dropped]
+
+        previous, start = None, 0
+        with self._lock:
+            for i in range(len(keys), 0, -1):
+                cached = self._summaries.get(keys[i - 1])
+                if cached is not None:
+                    self._summaries.move_to_end(keys[i - 1])
+                    previous, start = cached, i
+                    break
+
+        if start == len(dropped):
+            return previous
+
+        try:
+            summary = self.summarizer(previous, dropped[start:])
+        except Exception as e:
+            print(f"Error summarizing conversation: {e}")
+            return previous
+
+        ids = self.tokenizer(summary, add_special_tokens=False)["input_ids"]
+        if len(ids) > self.summary_max_tokens - 16:  # leave room for the header
+            summary = self.tokenizer.decode(ids[:self.summary_max_tokens - 16])
+
+        with self._lock:
+            self._summaries[keys[-1]] = summary
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def _truncate(self, message: Dict, max_tokens: int) -> Dict:
+        available = max(1, max_tokens - self._overhead(message["role"]))
+        ids = self.tokenizer(message["content"], add_special_tokens=False)["input_ids"]
+        return dict(message, content=self.tokenizer.decode(ids[-available:]))
+
+    def _overhead(self, role: str) -> int:
+        """Template markup around one message of ``role``, measured once"""
+        if role not in self._overheads:
+            probe = "x"
+            base = self._render([self._system_message()], add_generation_prompt=False)
+            full = self._render([self._system_message(), {"role": role, "content": probe}],
+                                add_generation_prompt=False)
+            block = full[len(base):] if full.startswith(base) else full
+            self._overheads[role] = max(0, self._tokenize(block) - self._tokenize(probe))
+        return self._overheads[role]
+
+    def _system_message(self, summary: Optional[str] = None) -> Dict:
+        content = self.system_prompt
+        if summary:
+            content += f"\n\n{SUMMARY_HEADER} {summary}"
+        return {"role": "system", "content": content}
+
+    def _render(self, chat: List[Dict], add_generation_prompt: bool) -> str:
+        return self.tokenizer.apply_chat_template(
+            chat,
+            tokenize=False,
+            add_generation_prompt=add_generation_prompt,
+            enable_thinking=False,  # Qwen3: answer directly, no <think> block
+        )
+
+    def _tokenize(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
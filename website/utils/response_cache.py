@@ -0,0 +1,255 @@
+"""
+Semantic response cache for PsychAI
+Serves stored replies to opening messages that closely match one already answered
+"""
+
+import difflib
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Optional, Dict, List, Callable
+
+import numpy as np
+
+from .safety import looks_like_crisis
+from .inference import _get_setting
+
+# embed(normalized_text) -> 1-D float vector; the default needs no model
+Embedder = Callable[[str], np.ndarray]
+
+_CONTRACTIONS = {"i'm": "i am", "im": "i am", "can't": "cannot", "cant": "cannot", "don't": "do not",
+                 "dont": "do not", "won't": "will not", "i've": "i have", "it's": "it is", "idk": "i do not know"}
+_FILLERS = {"hi", "hello", "hey", "so", "really", "just", "like", "um", "uh", "please", "lately", "recently"}
+# Words that don't change what is being asked. Negations ("not", "no",
+# "never", "cannot", ...) are deliberately absent.
+_FUNCTION_WORDS = {"a", "an", "the", "to", "of", "for", "with", "about", "and", "or", "is", "am", "are", "be",
+                   "do", "does", "i", "me", "how", "what", "can", "could", "should", "would", "some", "any"}
+# Two words count as the same when they differ by a typo or an inflection (exam/exams, stres/stress)
+_SAME_WORD_RATIO = 0.8
+
+
+def normalize(text: str) -> str:
+    """Lowercase, expand common contractions, drop punctuation and filler words"""
+    words = re.findall(r"[a-z0-9']+", text.lower())
+    words = " ".join(_CONTRACTIONS.get(w, w) for w in words).replace("'", "").split()
+    return " ".join(w for w in words if w not in _FILLERS)
+
+
+def hashing_embedding(text: str, dim: int = 1024) -> np.ndarray:
+    """
+    Bag of word unigrams, bigrams and character trigrams hashed into ``dim``
+    buckets, L2-normalized. Robust to word order changes and typos, which is
+    what near-identical opening messages differ by.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    words = text.split()
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    padded = f" {text} "
+    features += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    for feature in features:
+        h = zlib.crc32(feature.encode())
+        vector[h % dim] += 1.0 if (h >> 31) == 0 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def content_words(text: str) -> List[str]:
+    """Words of a normalized message that carry its meaning"""
+    return [w for w in text.split() if w not in _FUNCTION_WORDS]
+
+
+def same_content(a: str, b: str) -> bool:
+    """
+    True if two normalized messages use the same content words, up to typos
+
+    Embedding similarity can't tell "help my son" from "not help my son", or
+    miss a qualifier like "at university": one word moves the vector very
+    little. Every content word of each message must have a counterpart in
+    the other, so such near misses go to the model instead.
+    """
+    words_a, words_b = set(content_words(a)), set(content_words(b))
+    return _covered(words_a, words_b) and _covered(words_b, words_a)
+
+
+def _covered(words: set, others: set) -> bool:
+    for word in words - others:
+        if not any(difflib.SequenceMatcher(None, word, other).ratio() >= _SAME_WORD_RATIO for other in others):
+            return False
+    return True
+
+
+class _Entry:
+    def __init__(self, text: str, vector: np.ndarray, response: str, generation_seconds: float):
+        self.text = text
+        self.vector = vector
+        self.response = response
+        self.generation_seconds = generation_seconds
+        self.created_at = time.time()
+        self.hits = 0
+        self.nbytes = vector.nbytes + len(response.encode()) + len(text.encode())
+
+
+class ResponseCache:
+    """
+    Cache of first-turn replies keyed by the embedded opening message
+
+    A lookup returns the stored reply whose message has cosine similarity of
+    at least ``threshold`` with the new one and the same content words (see
+    same_content), so a negation or an extra qualifier is a miss even when
+    the vectors are close. Entries expire after
+    ``ttl_seconds``; beyond ``max_entries`` the least recently used entry is
+    evicted. Messages flagged by the crisis heuristics are never served from
+    or stored in the cache, and neither are messages that normalize to fewer
+    than ``min_length`` characters (greetings, punctuation), which would all
+    share one entry.
+    """
+
+    def __init__(self, threshold: float = 0.85, ttl_seconds: float = 24 * 3600, max_entries: int = 2000,
+                 embed: Embedder = hashing_embedding, min_length: int = 10):
+        self.threshold = threshold
+        self.min_length = min_length
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.embed = embed
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None  # rows follow self._entries order
+        self._keys: List[str] = []
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.lookups = 0
+        self.hits = 0
+        self.bypassed = 0
+        self.near_misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.seconds_saved = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def lookup(self, message: str) -> Optional[Dict]:
+        """
+        Find a stored reply for an opening ``message``
+
+        Returns:
+            {"response", "similarity", "matched"} on a hit, otherwise None
+        """
+        if not self.enabled:
+            return None
+        if looks_like_crisis(message):
+            with self._lock:
+                self.bypassed += 1
+            return None
+
+        text = normalize(message)
+        if len(text) < self.min_length:
+            return None
+        vector = self.embed(text)
+        with self._lock:
+            self.lookups += 1
+            self._expire()
+            if not self._entries:
+                return None
+
+            if self._matrix is None:
+                self._keys = list(self._entries)
+                self._matrix = np.stack([self._entries[k].vector for k in self._keys])
+            scores = self._matrix @ vector
+            # Most similar first; the first candidate asking the same thing wins
+            candidates = np.flatnonzero(scores >= self.threshold)
+            rejected = False
+            for best in candidates[np.argsort(-scores[candidates])]:
+                key = self._keys[best]
+                entry = self._entries[key]
+                if not same_content(text, entry.text):
+                    rejected = True
+                    continue
+                self._entries.move_to_end(key)
+                entry.hits += 1
+                self.hits += 1
+                self.seconds_saved += entry.generation_seconds
+                return {"response": entry.response, "similarity": float(scores[best]), "matched": entry.text}
+            if rejected:
+                self.near_misses += 1
+            return None
+
+    def put(self, message: str, response: str, generation_seconds: float = 0.0):
+        """Store the model's reply to an opening ``message``"""
+        if not self.enabled or not response.strip():
+            return
+        if looks_like_crisis(message) or looks_like_crisis(response):
+            return
+
+        text = normalize(message)
+        if len(text) < self.min_length:
+            return
+        entry = _Entry(text, self.embed(text), response, generation_seconds)
+        with self._lock:
+            self._entries.pop(text, None)
+            self._entries[text] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def metrics(self) -> Dict:
+        """Hit rate, generation time saved and memory held"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(e.nbytes for e in self._entries.values()),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else None,
+                "crisis_bypassed": self.bypassed,
+                "near_misses": self.near_misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "seconds_saved": self.seconds_saved,
+            }
+
+    def _expire(self):
+        now = time.time()
+        stale = [k for k, e in self._entries.items() if now - e.created_at > self.ttl_seconds]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            self.expired += len(stale)
+            self._matrix = None
+
+
+# Process-wide cache (singleton pattern, shared by all sessions)
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Get or create the process-wide response cache from the [model] settings"""
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    threshold=float(_get_setting("response_cache_threshold", 0.85)),
+                    ttl_seconds=float(_get_setting("response_cache_ttl_seconds", 24 * 3600)),
+                    max_entries=int(_get_setting("response_cache_max_entries", 2000)),
+                    min_length=int(_get_setting("response_cache_min_length", 10)),
+                )
+
+    return _cache
+
+
+def response_cache_metrics() -> Dict:
+    """Metrics of the process-wide response cache"""
+    return get_response_cache().metrics()
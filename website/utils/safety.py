@@ -0,0 +1,35 @@
+"""
+Safety heuristics for PsychAI
+Cheap keyword checks for messages that must always get a fresh, individual reply
+"""
+
+import re
+
+# Self-harm, suicide, abuse and immediate-danger phrasing. Deliberately broad:
+# a false positive only costs a cache miss, a false negative could serve a
+# canned reply to someone in crisis.
+CRISIS_PATTERN = re.compile(
+    r"\b("
+    r"suicid\w*|kms|kys|unaliv\w*|"
+    r"kill(ing)? (my|him|her|them|your)sel(f|ves)|end(ing)? (it all|my (own )?life|things)|"
+    r"tak(e|ing) my (own )?life|"
+    r"(want|wanna|going|gonna|plan(ning)?|ready)( to)? die|"
+    r"(do ?n['’]?t|no longer) want to (live|be alive|exist|be here|wake up)|"
+    r"wish (i|i['’]?d) ((was|were|could|had) )?(dead|die|died|not (here|alive)|never (been )?born|disappear)|"
+    r"better off (dead|without me|if i (was|were)n['’]?t (here|around))|"
+    r"(be here|be around|go on|keep going|do this) any ?more|"
+    r"can['’]?t (go on|keep going|take (it|this) any ?more)|"
+    r"no (reason|point) (to|in) (live|living|going on|being here)|"
+    r"self[- ]?harm\w*|cut(ting)? (my ?self|my (arm|wrist|leg)s?)|hurt(ing)? my ?self|"
+    r"overdos\w*|pills to|jump off|hang (my ?self)|"
+    r"abus(e|ed|ing|ive)|rap(e|ed)|molest\w*|touch(es|ed)? me|hits? me|beat(s|ing)? me|"
+    r"(not|never|do ?n['’]?t|does ?n['’]?t) (feel )?safe|in danger|run(ning)? away|"
+    r"988|crisis|emergency"
+    r")\b",
+    re.I,
+)
+
+
+def looks_like_crisis(text: str) -> bool:
+    """True if the message mentions self-harm, abuse or danger and needs individual care"""
+    return bool(CRISIS_PATTERN.search(text or ""))
@@ -0,0 +1,195 @@
+"""
+Speculative decoding for PsychAI
+A small draft model proposes tokens that the fine-tuned model verifies in one forward pass
+"""
+
+import threading
+import time
+from typing import Dict, List, Tuple, Set
+
+from .kv_cache import crop_cache
+
+
+class SpeculativeDecoder:
+    """
+    Draft-then-verify decoding for a single sequence
+
+    Each step the draft model greedily (or by sampling) proposes up to
+    ``num_draft_tokens`` tokens; the target model scores them all in one
+    forward pass and keeps the longest prefix it agrees with, plus one
+    token of its own. With sampling off the output is exactly the target's
+    greedy output. With sampling on, drafts are accepted with probability
+    min(1, p/q) and rejections are resampled from the residual, which keeps
+    the target's sampling distribution.
+
+    Both models must share the tokenizer (e.g. Qwen3-0.6B drafting for
+    Qwen3-8B).
+    """
+
+    def __init__(self, target, draft, num_draft_tokens: int = 4):
+        self.target = target
+        self.draft = draft
+        self.num_draft_tokens = num_draft_tokens
+
+        # Totals across requests
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.drafted = 0
+        self.accepted = 0
+
+    def generate(self, input_ids, max_new_tokens: int, eos_ids: Set[int], streamer=None,
+                 temperature: float = 0.0, top_p: float = 1.0, top_k: int = 0,
+                 past_key_values=None, cached_tokens: int = 0) -> Tuple[List[int], Dict]:
+        """
+        Generate up to ``max_new_tokens`` tokens after ``input_ids`` (shape 1 x n)
+
+        ``past_key_values`` may hold the target's cache for the first
+        ``cached_tokens`` prompt tokens; on return it covers the prompt and
+        every generated token but the last, like generate() leaves it.
+
+        Returns:
+            (token ids, stats) with drafted/accepted counts, acceptance_rate,
+            tokens_per_target_step and speedup_estimate
+        """
+        import torch
+        from transformers import DynamicCache
+
+        sampling = temperature > 0
+        device = input_ids.device
+        target_cache = past_key_values if past_key_values is not None else DynamicCache()
+        draft_cache = DynamicCache()
+
+        def pick(probs_or_logits):
+            if sampling:
+                return int(torch.multinomial(probs_or_logits, 1))
+            return int(probs_or_logits.argmax())
+
+        def dist(logits):
+            return _probs(logits, temperature, top_p, top_k) if sampling else logits
+
+        if streamer is not None:
+            streamer.put(input_ids.cpu())
+
+        generated: List[int] = []
+        stats = {"drafted": 0, "accepted": 0, "target_steps": 0}
+        verify_seconds = 0.0
+
+        def emit(token: int) -> bool:
+            """Record a token; True when generation should stop"""
+            generated.append(token)
+            if streamer is not None:
+                streamer.put(torch.tensor([token]))
+            return token in eos_ids or len(generated) >= max_new_tokens
+
+        with torch.no_grad():
+            logits = self.target(input_ids[:, cached_tokens:], past_key_values=target_cache, use_cache=True).logits
+            decode_start = time.perf_counter()
+            next_token = pick(dist(logits[0, -1]))
+            done = emit(next_token)
+
+            # Tokens already in the sequence but not yet in the draft's cache
+            draft_pending = input_ids[0].tolist()
+
+            while not done:
+                k = min(self.num_draft_tokens, max_new_tokens - len(generated))
+
+                drafts, draft_dists = [], []
+                feed = draft_pending + [next_token]
+                draft_base = draft_cache.get_seq_length() + len(draft_pending)
+                for _ in range(k):
+                    draft_logits = self.draft(
+                        torch.tensor([feed], device=device), past_key_values=draft_cache, use_cache=True
+                    ).logits[0, -1]
+                    q = dist(draft_logits)
+                    drafts.append(pick(q))
+                    draft_dists.append(q)
+                    feed = [drafts[-1]]
+
+                target_base = target_cache.get_seq_length()
+                step_start = time.perf_counter()
+                target_logits = self.target(
+                    torch.tensor([[next_token] + drafts], device=device), past_key_values=target_cache, use_cache=True
+                ).logits[0]
+                verify_seconds += time.perf_counter() - step_start
+                stats["target_steps"] += 1
+                stats["drafted"] += k
+
+                accepted = 0
+                for j in range(k):
+                    if sampling:
+                        p = _probs(target_logits[j], temperature, top_p, top_k)
+                        q = draft_dists[j]
+                        ok = torch.rand(()).item() < min(1.0, (p[drafts[j]] / q[drafts[j]].clamp_min(1e-20)).item())
+                    else:
+                        ok = drafts[j] == int(target_logits[j].argmax())
+                    if not ok:
+                        break
+                    accepted += 1
+                stats["accepted"] += accepted
+
+                if accepted < k and sampling:
+                    residual = (p - q).clamp_min(0)
+                    bonus = pick(residual / residual.sum() if residual.sum() > 0 else p)
+                else:
+                    bonus = pick(dist(target_logits[accepted]))
+
+                # Keep only the verified tokens in both caches
+                crop_cache(target_cache, target_base + 1 + accepted)
+                crop_cache(draft_cache, draft_base + 1 + accepted)
+                # The last draft was proposed but never fed to the draft model
+                draft_pending = [drafts[-1]] if accepted == k else []
+
+                for token in drafts[:accepted]:
+                    done = emit(token)
+                    if done:
+                        break
+                if not done:
+                    next_token = bonus
+                    done = emit(next_token)
+
+        if streamer is not None:
+            streamer.end()
+
+        decode_seconds = time.perf_counter() - decode_start
+        steps = stats["target_steps"]
+        stats.update({
+            "acceptance_rate": stats["accepted"] / stats["drafted"] if stats["drafted"] else None,
+            "tokens_per_target_step": (len(generated) - 1) / steps if steps else None,
+            # Decode time if every token had cost one target step, over the time actually taken
+            "speedup_estimate": (
+                (len(generated) - 1) * (verify_seconds / steps) / decode_seconds if steps and decode_seconds > 0 else None
+            ),
+        })
+        with self._lock:
+            self.requests += 1
+            self.drafted += stats["drafted"]
+            self.accepted += stats["accepted"]
+        return generated, stats
+
+    def metrics(self) -> Dict:
+        """Acceptance rate over every request so far"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "num_draft_tokens": self.num_draft_tokens,
+                "drafted": self.drafted,
+                "accepted": self.accepted,
+                "acceptance_rate": self.accepted / self.drafted if self.drafted else None,
+            }
+
+
+def _probs(logits, temperature: float, top_p: float, top_k: int):
+    """Sampling distribution after temperature, top-k and top-p, as generate() applies them"""
+    import torch
+
+    logits = logits.float() / temperature
+    if top_k and top_k < logits.shape[-1]:
+        threshold = torch.topk(logits, top_k).values[-1]
+        logits = logits.masked_fill(logits < threshold, float("-inf"))
+    if top_p < 1.0:
+        sorted_logits, order = torch.sort(logits)
+        cumulative = sorted_logits.softmax(-1).cumsum(-1)
+        remove = cumulative <= 1 - top_p
+        remove[-1] = False
+        logits = logits.masked_fill(torch.zeros_like(remove).scatter(0, order, remove), float("-inf"))
+    return logits.softmax(-1)
@@ -0,0 +1,396 @@
+"""
+Write-behind queue for PsychAI
+Buffers chat messages and activity logs and writes them to the database in the background
+"""
+
+import atexit
+import functools
+import queue
+import threading
+import time
+from datetime import datetime
+from collections import defaultdict, deque
+from typing import Optional, Dict, List, Callable, Iterable
+
+from .database import save_messages_db, log_activities_db, PermanentWriteError
+
+# Sink names (one per table)
+CHAT_MESSAGES = "chat_messages"
+USER_ACTIVITY = "user_activity"
+
+# A sink takes a list of rows and returns True when they were written. False
+# or an exception means "try again later"; PermanentWriteError means some row
+# in the batch can never be written.
+Sink = Callable[[List[Dict]], bool]
+
+
+class WriteBehindQueue:
+    """
+    Bounded queue drained by a background worker
+
+    Rows are grouped per sink and flushed when ``max_batch_size`` rows are
+    waiting or ``flush_interval`` seconds have passed. A full queue rejects
+    rows instead of blocking the caller.
+
+    Transient failures are retried with exponential backoff, capped at
+    ``backoff_max``. Rows of ``durable_sinks`` are retried for up to
+    ``max_retry_seconds`` and then dead-lettered; other rows are dropped (and
+    counted) after ``max_retries`` attempts. A batch rejected with
+    PermanentWriteError is split in halves until the offending rows are
+    isolated; those are dead-lettered and the rest is written. Dead-lettered
+    rows are kept in ``dead_letters`` (newest ``max_dead_letters``) and
+    logged, so one bad row or a long outage never wedges the worker.
+
+    Sinks are plain callables, so a local stand-in (see MemorySink) can
+    replace the database in development and tests.
+    """
+
+    def __init__(self, sinks: Dict[str, Sink], max_queue_size: int = 10000, max_batch_size: int = 200,
+                 flush_interval: float = 1.0, max_retries: int = 5, backoff_base: float = 0.5,
+                 backoff_max: float = 30.0, durable_sinks: Iterable[str] = (),
+                 max_retry_seconds: float = 300.0, max_dead_letters: int = 10000):
+        self.sinks = sinks
+        self.durable_sinks = set(durable_sinks)
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_seconds = max_retry_seconds
+        # (sink, row, reason) of rows given up on
+        self.dead_letters: deque = deque(maxlen=max_dead_letters)
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue_size)
+        self._buffers: Dict[str, List[Dict]] = defaultdict(list)
+        self._stop = threading.Event()
+        self._flush_requested = threading.Event()
+        self._idle = threading.Condition()
+        self._in_flight = 0
+        # Held for the duration of every sink call
+        self._write_lock = threading.Lock()
+        # sink -> predicates of rows to skip, set by discard() until the queue is idle
+        self._discards: Dict[str, List[Callable[[Dict], bool]]] = defaultdict(list)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+        # Metrics
+        self._metrics_lock = threading.Lock()
+        self.enqueued = 0
+        self.written = 0
+        self.dropped_full = 0
+        self.dropped_failed = 0
+        self.dead_lettered = 0
+        self.discarded = 0
+        self.retries = 0
+        self.flushes = 0
+        self.flush_latencies: deque = deque(maxlen=1000)
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="psychai-write-behind", daemon=True)
+                self._thread.start()
+
+    def enqueue(self, sink: str, row: Dict) -> bool:
+        """Queue one row for ``sink`` without blocking; False if the queue is full"""
+        if sink not in self.sinks:
+            raise ValueError(f"Unknown sink: {sink}")
+
+        self.start()
+        with self._idle:
+            self._in_flight += 1
+        try:
+            self._queue.put_nowait((sink, row))
+        except queue.Full:
+            self._done(1)
+            with self._metrics_lock:
+                self.dropped_full += 1
+            return False
+
+        with self._metrics_lock:
+            self.enqueued += 1
+        return True
+
+    def enqueue_many(self, sink: str, rows: List[Dict]) -> bool:
+        """Queue several rows; False if any of them was dropped"""
+        return all([self.enqueue(sink, row) for row in rows])
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every queued row has been written or dropped"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # Don't hold rows back for the flush timer while someone is waiting
+        self._flush_requested.set()
+        with self._idle:
+            while self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        self._flush_requested.clear()
+        return True
+
+    def discard(self, sink: str, predicate: Callable[[Dict], bool]):
+        """
+        Never write rows of ``sink`` matching ``predicate`` that are still pending
+
+        Waits for a sink call in progress, so once this returns no matching
+        row reaches the sink any more, including rows of a batch that is
+        being retried (e.g. before deleting what they belong to).
+        """
+        with self._write_lock:
+            with self._idle:
+                if self._in_flight:
+                    self._discards[sink].append(predicate)
+
+    def shutdown(self, timeout: Optional[float] = 10.0) -> bool:
+        """Drain outstanding rows, then stop the worker"""
+        drained = self.flush(timeout)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        return drained
+
+    # ---- worker ----
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while not self._stop.is_set():
+            timeout = max(0.0, last_flush + self.flush_interval - time.monotonic())
+            try:
+                sink, row = self._queue.get(timeout=timeout)
+                self._buffers[sink].append(row)
+            except queue.Empty:
+                pass
+
+            buffered = sum(len(rows) for rows in self._buffers.values())
+            due = time.monotonic() - last_flush >= self.flush_interval
+            draining = self._flush_requested.is_set() and self._queue.empty()
+            if buffered and (buffered >= self.max_batch_size or due or draining):
+                self._flush_buffers()
+                last_flush = time.monotonic()
+            elif due:
+                last_flush = time.monotonic()
+
+    def _flush_buffers(self):
+        for sink, rows in list(self._buffers.items()):
+            if not rows:
+                continue
+            del self._buffers[sink]
+            for start in range(0, len(rows), self.max_batch_size):
+                self._write(sink, rows[start:start + self.max_batch_size])
+
+    def _write(self, sink: str, rows: List[Dict]):
+        durable = sink in self.durable_sinks
+        batches = [rows]
+        while batches:
+            batch = batches.pop()
+            attempt = 0
+            failing_since = time.monotonic()
+            while True:
+                rejected = False
+                with self._write_lock:
+                    batch = self._without_discarded(sink, batch)
+                    if not batch:
+                        break
+                    started = time.perf_counter()
+                    try:
+                        ok = self.sinks[sink](batch)
+                    except PermanentWriteError as e:
+                        print(f"{sink} rejected a batch of {len(batch)} rows: {e}")
+                        ok, rejected = False, True
+                    except Exception as e:
+                        print(f"Error writing {sink} batch: {e}")
+                        ok = False
+
+                if ok:
+                    with self._metrics_lock:
+                        self.written += len(batch)
+                        self.flushes += 1
+                        self.flush_latencies.append(time.perf_counter() - started)
+                    self._done(len(batch))
+                    break
+
+                if rejected:
+                    if len(batch) == 1:
+                        self._dead_letter(sink, batch, "rejected")
+                    else:
+                        # Retry each half on its own; first half first to keep the order
+                        middle = len(batch) // 2
+                        batches += [batch[middle:], batch[:middle]]
+                    break
+
+                if durable:
+                    out_of_retries = time.monotonic() - failing_since >= self.max_retry_seconds
+                else:
+                    out_of_retries = attempt >= self.max_retries
+                if self._stop.is_set() or out_of_retries:
+                    if durable:
+                        self._dead_letter(sink, batch, f"failed for {time.monotonic() - failing_since:.0f}s")
+                    else:
+                        print(f"Dropping {len(batch)} {sink} rows after {attempt} retries")
+                        with self._metrics_lock:
+                            self.dropped_failed += len(batch)
+                        self._done(len(batch))
+                    break
+
+                with self._metrics_lock:
+                    self.retries += 1
+                # Wakes early on shutdown, which makes the next failure the last attempt
+                self._stop.wait(min(self.backoff_max, self.backoff_base * (2 ** min(attempt, 32))))
+                attempt += 1
+
+    def _without_discarded(self, sink: str, rows: List[Dict]) -> List[Dict]:
+        predicates = self._discards.get(sink)
+        if not predicates:
+            return rows
+        kept = [row for row in rows if not any(predicate(row) for predicate in predicates)]
+        skipped = len(rows) - len(kept)
+        if skipped:
+            with self._metrics_lock:
+                self.discarded += skipped
+            self._done(skipped)
+        return kept
+
+    def _dead_letter(self, sink: str, rows: List[Dict], reason: str):
+        print(f"Dead-lettering {len(rows)} {sink} rows ({reason})")
+        self.dead_letters.extend((sink, row, reason) for row in rows)
+        with self._metrics_lock:
+            self.dead_lettered += len(rows)
+        self._done(len(rows))
+
+    def _done(self, count: int):
+        with self._idle:
+            self._in_flight -= count
+            if not self._in_flight:
+                # Nothing pending is left for the discard predicates to match
+                self._discards = defaultdict(list)
+                self._idle.notify_all()
+
+    # ---- metrics ----
+
+    def metrics(self) -> Dict:
+        """Queue depth, throughput counters, drop counts and flush latency"""
+        with self._metrics_lock:
+            latencies = sorted(self.flush_latencies)
+            counters = {
+                "enqueued": self.enqueued,
+                "written": self.written,
+                "dropped_full": self.dropped_full,
+                "dropped_failed": self.dropped_failed,
+                "dead_lettered": self.dead_lettered,
+                "discarded": self.discarded,
+                "retries": self.retries,
+                "flushes": self.flushes,
+            }
+
+        with self._idle:
+            in_flight = self._in_flight
+
+        counters.update({
+            "queue_depth": in_flight,
+            "flush_latency_seconds": {
+                "mean": sum(latencies) / len(latencies) if latencies else None,
+                "p95": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))] if latencies else None,
+                "max": latencies[-1] if latencies else None,
+            },
+        })
+        return counters
+
+
+class MemorySink:
+    """
+    In-memory stand-in for a database table
+
+    Records every batch it accepts; set ``fail_next`` to make the next N
+    calls fail, e.g. to exercise retries without Supabase, and ``reject`` to
+    refuse (with PermanentWriteError) every batch holding a matching row.
+    """
+
+    def __init__(self, fail_next: int = 0, latency: float = 0.0,
+                 reject: Optional[Callable[[Dict], bool]] = None):
+        self.rows: List[Dict] = []
+        self.batches = 0
+        self.calls = 0
+        self.fail_next = fail_next
+        self.latency = latency
+        self.reject = reject
+        self._lock = threading.Lock()
+
+    def __call__(self, rows: List[Dict]) -> bool:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            if self.reject is not None and any(self.reject(row) for row in rows):
+                raise PermanentWriteError("row rejected")
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return False
+            self.rows.extend(rows)
+            self.batches += 1
+        return True
+
+
+# Process-wide queue (singleton pattern, shared by all sessions)
+_write_queue: Optional[WriteBehindQueue] = None
+_write_queue_lock = threading.Lock()
+
+
+def get_write_queue() -> WriteBehindQueue:
+    """Get or create the process-wide write-behind queue backed by Supabase"""
+    global _write_queue
+
+    if _write_queue is None:
+        with _write_queue_lock:
+            if _write_queue is None:
+                _write_queue = WriteBehindQueue({
+                    CHAT_MESSAGES: functools.partial(save_messages_db, raise_rejected=True),
+                    USER_ACTIVITY: functools.partial(log_activities_db, raise_rejected=True),
+                }, durable_sinks=[CHAT_MESSAGES])
+                atexit.register(_write_queue.shutdown)
+
+    return _write_queue
+
+
+def save_messages_async(messages: List[Dict]) -> bool:
+    """
+    Queue chat messages for a background bulk upsert
+
+    Queued messages are retried through outages of up to the queue's
+    ``max_retry_seconds``; rows the database rejects, or still cannot take
+    after that, are dead-lettered (see WriteBehindQueue). If the queue is full the rejected messages are written synchronously instead;
+    False means that write failed, so the caller must keep the messages
+    and hand them in again later.
+    """
+    write_queue = get_write_queue()
+    dropped = [row for row in messages if not write_queue.enqueue(CHAT_MESSAGES, row)]
+    if dropped:
+        return save_messages_db(dropped)
+    return True
+
+
+def log_activity_async(user_email: str, activity_type: str, metadata: Optional[Dict] = None):
+    """Queue an analytics event; dropped (and counted) if the queue is full"""
+    get_write_queue().enqueue(USER_ACTIVITY, {
+        "user_email": user_email,
+        "activity_type": activity_type,
+        "metadata": metadata,
+        "timestamp": datetime.now().isoformat(),  # when it happened, not when flushed
+    })
+
+
+def discard_pending_messages(chat_id: str):
+    """Drop queued messages of ``chat_id`` that have not been written yet"""
+    get_write_queue().discard(CHAT_MESSAGES, lambda row: row.get("chat_id") == chat_id)
+
+
+def flush_pending_writes(timeout: Optional[float] = 10.0) -> bool:
+    """Wait until every queued row has been written; False if some are still pending at ``timeout``"""
+    return get_write_queue().flush(timeout)
+
+
+def write_queue_metrics() -> Dict:
+    """Metrics of the process-wide write-behind queue"""
+    return get_write_queue().metrics()
+